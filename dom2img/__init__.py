@@ -1,13 +1,10 @@
 # coding=utf-8
-import pkg_resources
+from dom2img import _dom2img, _exceptions, _phantomjs, _version, \
+    _pool, _cache, _volatile, _upload, _documents, _service, _scheduler, \
+    _semaphore, _limits, _cancel, _screenshot, _retry, _breaker
 
-from dom2img import _dom2img, _exceptions
 
-
-try:
-    __version__ = pkg_resources.require('dom2img')[0].version
-except pkg_resources.DistributionNotFound:
-    __version__ = 'dev'
+__version__ = _version.__version__
 
 
 __author__ = 'Bartek Ćwikłowski <paczesiowa@gmail.com>'
@@ -15,9 +12,41 @@ __author__ = 'Bartek Ćwikłowski <paczesiowa@gmail.com>'
 
 dom2img = _dom2img.dom2img
 dom2img_debug = _dom2img.dom2img_debug
+dom2img_upload = _upload.dom2img_upload
+dom2img_upload_document = _upload.dom2img_upload_document
+check_phantomjs = _phantomjs.check_phantomjs
+PhantomJSPool = _pool.PhantomJSPool
+RenderCache = _cache.RenderCache
+VolatileContent = _volatile.VolatileContent
+DocumentStore = _documents.DocumentStore
+ScreenshotService = _service.ScreenshotService
+image_response = _service.image_response
+RenderScheduler = _scheduler.RenderScheduler
+HostSemaphore = _semaphore.HostSemaphore
+ResourceLimits = _limits.ResourceLimits
+CancelToken = _cancel.CancelToken
+Screenshot = _screenshot.Screenshot
+RetryPolicy = _retry.RetryPolicy
+CircuitBreaker = _breaker.CircuitBreaker
 Dom2ImgError = _exceptions.Dom2ImgError
 PhantomJSFailure = _exceptions.PhantomJSFailure
 PhantomJSTimeout = _exceptions.PhantomJSTimeout
 PhantomJSNotInPath = _exceptions.PhantomJSNotInPath
-__all__ = ['dom2img', 'dom2img_debug', 'Dom2ImgError',
-           'PhantomJSFailure', 'PhantomJSTimeout', 'PhantomJSNotInPath']
+DocumentNotFound = _exceptions.DocumentNotFound
+DeadlineExceeded = _exceptions.DeadlineExceeded
+RenderQueueTimeout = _exceptions.RenderQueueTimeout
+PhantomJSMemoryLimit = _exceptions.PhantomJSMemoryLimit
+PhantomJSCPULimit = _exceptions.PhantomJSCPULimit
+PhantomJSOutputLimit = _exceptions.PhantomJSOutputLimit
+RenderCancelled = _exceptions.RenderCancelled
+CircuitOpen = _exceptions.CircuitOpen
+__all__ = ['dom2img', 'dom2img_debug', 'dom2img_upload',
+           'dom2img_upload_document', 'check_phantomjs', 'PhantomJSPool',
+           'RenderCache', 'VolatileContent', 'DocumentStore',
+           'ScreenshotService', 'image_response', 'RenderScheduler',
+           'HostSemaphore', 'ResourceLimits', 'CancelToken', 'Screenshot',
+           'RetryPolicy', 'CircuitBreaker', 'Dom2ImgError',
+           'PhantomJSFailure', 'PhantomJSTimeout', 'PhantomJSNotInPath',
+           'DocumentNotFound', 'DeadlineExceeded', 'RenderQueueTimeout',
+           'PhantomJSMemoryLimit', 'PhantomJSCPULimit',
+           'PhantomJSOutputLimit', 'RenderCancelled', 'CircuitOpen']
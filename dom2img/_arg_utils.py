@@ -2,6 +2,7 @@
 Invalid argument value exception and validation utilities.
 '''
 import functools
+import sys
 
 from dom2img import _compat, _url_utils, _inspect
 
@@ -194,6 +195,53 @@ def non_negative_int(val, variable_name):
 non_negative_int.__name__ = 'non-negative integer'
 
 
+@_fix_variable_name
+def optional_non_negative_int(val, variable_name):
+    '''
+    Type-value unifier for optional non-negative integers.
+
+    Values can be None, or anything accepted by non_negative_int().
+
+    Returns:
+        None or int, that is greater or equal to zero.
+
+    Raises:
+        The same as non_negative_int().
+
+    >>> optional_non_negative_int(None, 'x') is None
+    True
+    >>> optional_non_negative_int(b'5', 'x')
+    5
+    '''
+    if val is None:
+        return None
+    return non_negative_int(val, variable_name)
+
+
+@_fix_variable_name
+def positive_int(val, variable_name):
+    '''
+    Type-value unifier for positive integers.
+
+    Values can be anything accepted by non_negative_int().
+
+    Returns:
+        int, that is greater than zero.
+
+    Raises:
+        The same as non_negative_int(), ValueError is raised for zero too.
+
+    >>> positive_int(b'2', 'x')
+    2
+    '''
+    val = non_negative_int(val, variable_name)
+    if val == 0:
+        raise ValueError(u'unexpected zero for %s' % variable_name)
+    return val
+
+positive_int.__name__ = 'positive integer'
+
+
 @_fix_variable_name
 @_check_type(_compat.text, bytes)
 @_prettify_value_errors
@@ -268,3 +316,40 @@ def utf8_byte_string(val, variable_name):
         raise ValueError(
             variable_name + u' byte string is not properly utf-8 encoded')
     return val
+
+
+@_fix_variable_name
+@_check_type(_compat.text, bytes, type(None))
+def optional_path(val, variable_name):
+    '''
+    Type-value unifier for optional filesystem paths.
+
+    Values can be None, bytes or unicode texts.
+
+    Args:
+        val: None, bytes or unicode text with a filesystem path.
+        variable_name: unicode text (optional, may be None), with variable
+            name used for this value in the calling function. Used only
+            for exception messages.
+
+    Returns:
+        None or unicode text with the path.
+
+    Raises:
+        TypeError: val is not None, bytes or an unicode text.
+        ValueError: val is empty, or bytes that cannot be decoded using
+            filesystem encoding.
+    '''
+    if val is None:
+        return None
+    if isinstance(val, bytes):
+        try:
+            val = val.decode(sys.getfilesystemencoding())
+        except UnicodeDecodeError:
+            raise ValueError(variable_name + u' cannot be decoded')
+    if not val:
+        raise ValueError(u'unexpected empty path for ' + variable_name)
+    return val
+
+
+optional_path.__name__ = 'path'
@@ -0,0 +1,158 @@
+'''
+Batch rendering of JSON Lines job descriptions.
+
+Every input line is a JSON object describing a single render:
+    * content (HTML) or content_file (path to a file with HTML),
+    * output: path of a file where PNG image will be written,
+    * width, height, prefix, top, left, scale, timeout, load_timeout,
+        render_timeout, settle_timeout and cookies (string or object),
+        with the same meaning as dom2img() arguments,
+    * id (optional): any JSON value, copied to the status record.
+
+For every job, a JSON Lines status record is written, in order
+of completion, with keys:
+    * line: number of the input line with the job,
+    * id: copied from the job (or null),
+    * output: copied from the job (or null),
+    * status: "ok" or "error",
+    * seconds: time it took to process the job,
+    * size (on success): size of the image in bytes,
+    * error, message (on failure): exception class name and its message.
+'''
+import json
+import threading
+import time
+
+from dom2img import _compat, _daemon, _dom2img, _pool
+
+
+# dom2img() arguments that can be used in jobs (the same as in requests
+# of render server)
+OPTIONS = _daemon.OPTIONS
+
+_JOB_KEYS = OPTIONS | frozenset(['id', 'content', 'content_file', 'output'])
+
+
+def _job_content(job):
+    '''
+    Get HTML content of a job.
+
+    Raises:
+        ValueError: job doesn't have exactly one of content/content_file.
+        IOError: content file couldn't be read.
+    '''
+    if ('content' in job) == ('content_file' in job):
+        raise ValueError(u'job needs either content or content_file')
+    if 'content' in job:
+        return job['content']
+    with open(job['content_file'], 'rb') as f:
+        return f.read()
+
+
+def run_job(line, pool):
+    '''
+    Render a single job.
+
+    Args:
+        line: bytes or unicode text with job JSON object.
+        pool: PhantomJSPool used for rendering.
+
+    Returns:
+        dict with job status record (without the line key).
+    '''
+    record = {'id': None, 'output': None}
+    start = time.time()
+    try:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        try:
+            job = json.loads(line)
+        except ValueError:
+            raise ValueError(u'job is not a valid JSON')
+        if not isinstance(job, dict):
+            raise ValueError(u'job must be a JSON object')
+        record['id'] = job.get('id')
+        record['output'] = job.get('output')
+
+        unknown = set(job) - _JOB_KEYS
+        if unknown:
+            raise ValueError(u'unexpected job keys: ' +
+                             u', '.join(sorted(unknown)))
+        if not job.get('output'):
+            raise ValueError(u'job needs an output path')
+
+        kwargs = dict((str(key), val) for key, val in job.items()
+                      if key in OPTIONS)
+        image = _dom2img.dom2img(content=_job_content(job), pool=pool,
+                                 **kwargs)
+        with open(job['output'], 'wb') as f:
+            f.write(image)
+    except Exception as e:
+        record['status'] = u'error'
+        record['error'] = type(e).__name__
+        record['message'] = _compat.text(e)
+    else:
+        record['status'] = u'ok'
+        record['size'] = len(image)
+    record['seconds'] = round(time.time() - start, 3)
+    return record
+
+
+def run(jobs_file, records_file, jobs=1, phantomjs_path=None, nice=0):
+    '''
+    Render all jobs from a file, using warm PhantomJS processes.
+
+    Jobs are read lazily, so inputs of any length can be processed.
+    Empty lines are skipped.
+
+    Args:
+        jobs_file: file object (or any iterable) with JSON Lines jobs.
+        records_file: text file object, that status records will be
+            written to.
+        jobs: int, number of jobs processed in parallel.
+        phantomjs_path: unicode text with path to PhantomJS binary,
+            or None to look it up in $DOM2IMG_PHANTOMJS and $PATH.
+        nice: int, niceness increment of PhantomJS processes, so that
+            batch renders don't slow down interactive ones.
+
+    Returns:
+        int, number of failed jobs.
+
+    Raises:
+        ValueError: jobs is less than 1.
+        PhantomJSNotInPath: There's no PhantomJS in $PATH.
+    '''
+    queue = _compat.queue.Queue(maxsize=2 * jobs)
+    lock = threading.Lock()
+    failures = [0]
+
+    def worker():
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            line_number, line = item
+            record = run_job(line, pool)
+            record['line'] = line_number
+            with lock:
+                if record['status'] != u'ok':
+                    failures[0] += 1
+                records_file.write(
+                    _compat.text(json.dumps(record, sort_keys=True)) + u'\n')
+                records_file.flush()
+
+    with _pool.PhantomJSPool(size=jobs, phantomjs_path=phantomjs_path,
+                             nice=nice) as pool:
+        threads = [threading.Thread(target=worker) for _ in range(jobs)]
+        for thread in threads:
+            thread.start()
+        try:
+            for line_number, line in enumerate(jobs_file, 1):
+                if line.strip():
+                    queue.put((line_number, line))
+        finally:
+            for _ in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+    return failures[0]
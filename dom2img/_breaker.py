@@ -0,0 +1,226 @@
+'''
+Circuit breaker isolating origins of slow or failing pages.
+'''
+import collections
+import math
+import threading
+import time
+
+from dom2img import _compat, _exceptions
+
+
+# failures caused by the page itself rather than by its origin's hosts
+_PAGE_FAILURES = (_exceptions.PhantomJSMemoryLimit,
+                  _exceptions.PhantomJSCPULimit,
+                  _exceptions.PhantomJSOutputLimit)
+
+
+def origin(prefix):
+    '''
+    Get origin of a prefix URL.
+
+    Args:
+        prefix: Ascii-only unicode text containing absolute URL.
+
+    Returns:
+        unicode text with lowercase scheme://host[:port].
+
+    >>> origin(u'HTTP://Example.com:8000/path?key=val') == \
+        u'http://example.com:8000'
+    True
+    '''
+    parsed = _compat.urlparse(prefix)
+    return (parsed.scheme + u'://' + parsed.netloc).lower()
+
+
+class _Circuit(object):
+    '''
+    Recent render outcomes and state of a single origin.
+    '''
+
+    def __init__(self, window):
+        self.outcomes = collections.deque(maxlen=window)
+        self.opened_at = None
+        # ticket of the probe render of an open circuit
+        self.probe = None
+
+
+class _Ticket(object):
+    '''
+    Render let through by CircuitBreaker.before_render().
+    '''
+
+    def __init__(self, offline=False):
+        self.offline = offline
+        self.started = time.time()
+
+
+class CircuitBreaker(object):
+    '''
+    Thread-safe circuit breaker, that tracks recent render failures
+    (PhantomJS timeouts, crashes and partial renders) of every origin
+    (scheme, host and port of prefix).
+
+    When too many of the recent renders of an origin have failed,
+    its circuit opens: renders of that origin fail right away with
+    CircuitOpen, or, in offline mode, are rendered without network
+    access (requests of images, stylesheets etc. are aborted, such
+    screenshots are marked as partial), so a slow asset host doesn't
+    take render capacity away from other origins. After cooldown
+    seconds a single render of the origin is let through as a probe,
+    and its success closes the circuit again. Probe, that hasn't
+    finished in probe_timeout seconds (e.g. its after_render() call
+    has been lost), is abandoned, and the next render becomes a probe.
+
+    Failures caused by the page itself (exceeded ResourceLimits) and
+    by render capacity (deadlines, queue timeouts, cancellation) aren't
+    counted.
+
+    It can be passed to dom2img() using its breaker argument.
+    '''
+
+    def __init__(self, failure_rate=0.5, min_renders=5, window=20,
+                 cooldown=30, offline=False, max_origins=1000,
+                 probe_timeout=None):
+        '''
+        Args:
+            failure_rate: float, fraction of failed recent renders
+                that opens the circuit.
+            min_renders: int, minimal number of recent renders needed
+                to open the circuit.
+            window: int, number of recent renders of every origin
+                that are tracked.
+            cooldown: float, number of seconds after which an open
+                circuit lets a probe render through.
+            offline: bool, if True renders of origins with open circuits
+                are rendered without network access, instead of failing.
+            max_origins: int, maximal number of tracked origins, least
+                recently used closed circuits are forgotten first.
+            probe_timeout: float, number of seconds after which an
+                unfinished probe is abandoned, defaults to cooldown.
+        '''
+        self.failure_rate = failure_rate
+        self.min_renders = min_renders
+        self.window = window
+        self.cooldown = cooldown
+        self.offline = offline
+        self.max_origins = max_origins
+        self.probe_timeout = cooldown if probe_timeout is None \
+            else probe_timeout
+        self._lock = threading.Lock()
+        # in order of use, the most recently used last
+        self._circuits = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._circuits)
+
+    def _circuit(self, prefix):
+        key = origin(prefix)
+        circuit = self._circuits.pop(key, None)
+        if circuit is None:
+            circuit = _Circuit(self.window)
+            self._evict(self.max_origins - 1)
+        self._circuits[key] = circuit
+        return key, circuit
+
+    def _evict(self, size):
+        '''
+        Forget least recently used circuits, until at most size are left.
+
+        Closed circuits go first, open ones (and ones with running
+        probes) only if there's no closed one left.
+        '''
+        for closed_only in [True, False]:
+            for key in list(self._circuits):
+                if len(self._circuits) <= size:
+                    return
+                circuit = self._circuits[key]
+                if not closed_only or (circuit.opened_at is None and
+                                       circuit.probe is None):
+                    del self._circuits[key]
+
+    def is_open(self, prefix):
+        '''
+        Check if the circuit of prefix's origin is open.
+        '''
+        with self._lock:
+            return self._circuit(prefix)[1].opened_at is not None
+
+    def before_render(self, prefix):
+        '''
+        Decide how a render of prefix's origin should be done.
+
+        Every call that doesn't raise has to be followed by
+        after_render() call with the returned ticket.
+
+        Args:
+            prefix: Ascii-only unicode text containing absolute URL.
+
+        Returns:
+            ticket object, with offline attribute: bool, True if the render
+            has to be done without network access.
+
+        Raises:
+            CircuitOpen: circuit is open and offline mode isn't used.
+        '''
+        with self._lock:
+            key, circuit = self._circuit(prefix)
+            if circuit.opened_at is None:
+                return _Ticket()
+            now = time.time()
+            remaining = circuit.opened_at + self.cooldown - now
+            if circuit.probe is not None and \
+                    circuit.probe.started + self.probe_timeout <= now:
+                circuit.probe = None
+            if remaining <= 0 and circuit.probe is None:
+                circuit.probe = _Ticket()
+                return circuit.probe
+        if self.offline:
+            return _Ticket(offline=True)
+        raise _exceptions.CircuitOpen(key, max(1, int(math.ceil(remaining))))
+
+    def after_render(self, prefix, ticket, failed):
+        '''
+        Record outcome of a render.
+
+        Args:
+            prefix: the same as for before_render().
+            ticket: ticket returned by before_render().
+            failed: bool, True if the render has failed because of its
+                origin, or None if the outcome says nothing about it.
+        '''
+        if ticket.offline:
+            return
+        with self._lock:
+            _, circuit = self._circuit(prefix)
+            probe = circuit.probe is ticket
+            if probe:
+                circuit.probe = None
+            if failed is None:
+                return
+            if probe:
+                circuit.outcomes.clear()
+                circuit.opened_at = time.time() if failed else None
+            circuit.outcomes.append(failed)
+            if circuit.opened_at is None and \
+                    len(circuit.outcomes) >= self.min_renders and \
+                    sum(circuit.outcomes) >= \
+                    self.failure_rate * len(circuit.outcomes):
+                circuit.opened_at = time.time()
+
+    def outcome(self, exc):
+        '''
+        Classify render failure for after_render().
+
+        Args:
+            exc: Dom2ImgError raised by the render.
+
+        Returns:
+            True if the failure is counted, or None if it's not
+            related to the origin.
+        '''
+        if isinstance(exc, _PAGE_FAILURES) or \
+                not isinstance(exc, (_exceptions.PhantomJSFailure,
+                                     _exceptions.PhantomJSTimeout)):
+            return None
+        return True
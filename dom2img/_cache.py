@@ -0,0 +1,192 @@
+'''
+Cache of decoded renders, reused between screenshots of the same document.
+'''
+import hashlib
+import threading
+
+from dom2img import _compat
+
+
+def cache_key(*parts):
+    '''
+    Compute cache key of render inputs.
+
+    Args:
+        *parts: bytes, unicode texts or ints that identify a render.
+
+    Returns:
+        Unicode text with hex digest of parts.
+    '''
+    digest = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = _compat.text(part).encode('utf-8')
+        digest.update(_compat.text(len(part)).encode('ascii') + b':')
+        digest.update(part)
+    return _compat.text(digest.hexdigest())
+
+
+def _image_size(image):
+    '''
+    Approximate memory usage of decoded image, in bytes.
+    '''
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class RenderCache(object):
+    '''
+    Thread-safe LRU cache of decoded full-page PhantomJS renders.
+
+    When passed to dom2img() using its cache argument, a document is
+    rendered in full only once per (content, prefix, width, cookies)
+    and every screenshot with a different top, left or height is cropped
+    from the cached bitmap, instead of running PhantomJS again.
+
+    Renders are cached unscaled, so screenshots with every scale
+    are produced from the same render. With pyramid enabled, downscaled
+    copies of renders (see PYRAMID_LEVELS) are kept as well, and small
+    screenshots are resampled from the closest level that isn't smaller
+    than them, instead of the full-size render.
+
+    Cached renders use viewport height of the first screenshot, so pages
+    that depend on viewport height (e.g. CSS vh units) may look different
+    than after rendering with other heights.
+    '''
+
+    PYRAMID_LEVELS = (100, 50, 25)
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024,
+                 pyramid=False):
+        '''
+        Args:
+            max_entries: int, maximal number of cached renders.
+            max_bytes: int, maximal memory used by cached decoded renders
+                (including their pyramid levels).
+                Renders bigger than that are not cached at all.
+            pyramid: bool, if True, downscaled levels of renders
+                are cached too.
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.pyramid = pyramid
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._bytes = 0
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        '''
+        Get cached render.
+
+        Args:
+            key: unicode text with cache key (see cache_key()).
+
+        Returns:
+            Pillow image, or None if it isn't cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            entry[0] = self._clock
+            return entry[1][100]
+
+    def level_for(self, scale):
+        '''
+        Choose pyramid level used for producing a screenshot.
+
+        Args:
+            scale: int with percentage scale of the screenshot.
+
+        Returns:
+            int, the smallest level that is not smaller than scale
+            (100 if pyramid is disabled).
+        '''
+        if not self.pyramid:
+            return 100
+        return min(level for level in self.PYRAMID_LEVELS
+                   if level >= min(scale, 100))
+
+    def get_level(self, key, level):
+        '''
+        Get cached pyramid level of a render (without counting a hit).
+
+        Args:
+            key: unicode text with cache key (see cache_key()).
+            level: int, one of PYRAMID_LEVELS.
+
+        Returns:
+            Pillow image, or None if it isn't cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry[1].get(level)
+
+    def put_level(self, key, level, image):
+        '''
+        Cache pyramid level of a render, that is already cached.
+
+        Levels of renders that have been evicted in the meantime,
+        and levels that don't fit in max_bytes are dropped.
+
+        Args:
+            key: unicode text with cache key (see cache_key()).
+            level: int, one of PYRAMID_LEVELS.
+            image: loaded Pillow image, it must not be modified afterwards.
+        '''
+        size = _image_size(image)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or level in entry[1] or \
+                    self._bytes + size > self.max_bytes:
+                return
+            entry[1][level] = image
+            entry[2] += size
+            self._bytes += size
+
+    def put(self, key, image):
+        '''
+        Cache a render, evicting least recently used ones if necessary.
+
+        Args:
+            key: unicode text with cache key (see cache_key()).
+            image: loaded Pillow image, it must not be modified afterwards.
+        '''
+        size = _image_size(image)
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+        with self._lock:
+            self._remove(key)
+            while self._entries and \
+                    (len(self._entries) >= self.max_entries or
+                     self._bytes + size > self.max_bytes):
+                lru_key = min(self._entries,
+                              key=lambda k: self._entries[k][0])
+                self._remove(lru_key)
+            self._clock += 1
+            self._entries[key] = [self._clock, {100: image}, size]
+            self._bytes += size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self):
+        '''
+        Drop all cached renders.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
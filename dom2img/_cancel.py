@@ -0,0 +1,82 @@
+'''
+Cancellation of renders in progress.
+'''
+import threading
+
+from dom2img import _exceptions
+
+
+class CancelToken(object):
+    '''
+    Thread-safe token, that cancels renders it has been passed to
+    (e.g. when the client that requested a screenshot has disconnected).
+
+    Cancelled renders stop waiting for scheduler/semaphore/pool slots,
+    their PhantomJS processes (and process groups) are killed right away,
+    and they fail with RenderCancelled.
+
+    It can be passed to dom2img() using its cancel argument.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        '''
+        True if cancel() has been called.
+        '''
+        return self._event.is_set()
+
+    def cancel(self):
+        '''
+        Cancel renders using this token.
+        '''
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            del self._callbacks[:]
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout=None):
+        '''
+        Wait until the token is cancelled.
+
+        Returns:
+            bool, True if the token has been cancelled.
+        '''
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback):
+        '''
+        Register function, that will be called (without arguments) when
+        the token is cancelled, or right away if it's already cancelled.
+        '''
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        '''
+        Unregister function added with add_callback().
+        '''
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def raise_if_cancelled(self):
+        '''
+        Raises:
+            RenderCancelled: token has been cancelled.
+        '''
+        if self._event.is_set():
+            raise _exceptions.RenderCancelled()
@@ -8,6 +8,16 @@ try:
 except ImportError:
     import urllib.parse as urllib
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
 try:
     import StringIO
     BytesIO = StringIO.StringIO
@@ -18,6 +28,7 @@ except ImportError:
 
 urlparse = urllib.urlparse
 urljoin = urllib.urljoin
+parse_qs = urllib.parse_qs
 
 if sys.version_info < (3,):
     text = unicode
@@ -0,0 +1,321 @@
+'''
+Long-running render server and its client.
+
+Used by dom2img script in --serve and --client modes, so shell pipelines
+don't have to pay Python and PhantomJS startup cost for every document.
+
+Every message is made of two frames, and a frame is a 4-byte big-endian
+payload length followed by the payload:
+    * request: JSON object with dom2img() options, then utf-8 encoded HTML,
+    * response: JSON object with "status" key (using dom2img script exit
+        codes), then PNG image data (status 0) or utf-8 encoded error
+        message.
+Connection can be used for many requests.
+'''
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+
+from dom2img import _compat, _dom2img, _exceptions
+
+
+STATUS_OK = 0
+STATUS_INVALID_ARGS = 1
+STATUS_FAILURE = 2
+STATUS_TIMEOUT = 3
+
+# dom2img() arguments that can be sent by clients
+OPTIONS = frozenset(['width', 'height', 'prefix', 'top', 'left',
+                     'scale', 'timeout', 'load_timeout', 'render_timeout',
+                     'settle_timeout', 'cookies'])
+
+_FRAME_HEADER = struct.Struct('>I')
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    '''
+    Parse server address.
+
+    Args:
+        address: unicode text with either HOST:PORT (HOST defaults
+            to 127.0.0.1 if it's empty), or a path to Unix socket.
+
+    Returns:
+        tuple with socket address family and socket address.
+
+    >>> parse_address(u':7000') == (socket.AF_INET, (u'127.0.0.1', 7000))
+    True
+    >>> parse_address(u'/tmp/dom2img.sock') == \
+        (socket.AF_UNIX, u'/tmp/dom2img.sock')
+    True
+    '''
+    host, sep, port = address.rpartition(u':')
+    if sep and port.isdigit() and u'/' not in address:
+        return socket.AF_INET, (host or u'127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def is_loopback(host):
+    '''
+    Check if all addresses of a host are loopback addresses.
+
+    Args:
+        host: unicode text with host name or IP address.
+
+    Returns:
+        bool, False if host isn't local, or it can't be resolved.
+
+    >>> is_loopback(u'127.0.0.1'), is_loopback(u'0.0.0.0')
+    (True, False)
+    '''
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.error:
+        return False
+    return bool(infos) and all(
+        info[4][0].startswith(u'127.') or info[4][0] == u'::1'
+        for info in infos)
+
+
+def check_bind_host(host, allow_remote=False):
+    '''
+    Check that a server doesn't listen on a non-local address by accident.
+
+    Render servers are unauthenticated, and render pages with prefix
+    chosen by clients, so remote clients could make them fetch any URL
+    reachable from the host.
+
+    Raises:
+        ValueError: host isn't a loopback address and allow_remote
+            is False.
+    '''
+    if not allow_remote and not is_loopback(host):
+        raise ValueError(u'refusing to listen on non-loopback address ' +
+                         host + u' (use --allow-remote to allow it)')
+
+
+def _recv_exactly(sock, size):
+    '''
+    Receive exactly size bytes from socket.
+
+    Returns:
+        bytes with received data, or None if connection was closed
+        before receiving anything.
+
+    Raises:
+        EOFError: connection was closed in the middle of the data.
+    '''
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            if remaining == size:
+                return None
+            raise EOFError(u'connection closed in the middle of a frame')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frame(sock):
+    header = _recv_exactly(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = _FRAME_HEADER.unpack(header)
+    payload = _recv_exactly(sock, size)
+    if payload is None and size:
+        raise EOFError(u'connection closed in the middle of a frame')
+    return payload or b''
+
+
+def read_message(sock):
+    '''
+    Read a single message from socket.
+
+    Args:
+        sock: connected socket object.
+
+    Returns:
+        tuple with dict decoded from the JSON frame and bytes
+        with the data frame, or None if connection was closed.
+
+    Raises:
+        EOFError: connection was closed in the middle of the message.
+        ValueError: message doesn't contain a proper JSON object.
+    '''
+    header = _read_frame(sock)
+    if header is None:
+        return None
+    data = _read_frame(sock)
+    if data is None:
+        raise EOFError(u'connection closed in the middle of a message')
+    header = json.loads(header.decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError(u'message header must be a JSON object')
+    return header, data
+
+
+def write_message(sock, header, data):
+    '''
+    Write a single message to socket.
+
+    Args:
+        sock: connected socket object.
+        header: dict that can be serialized to JSON.
+        data: bytes with message data.
+    '''
+    header = json.dumps(header).encode('ascii')
+    sock.sendall(_FRAME_HEADER.pack(len(header)) + header)
+    sock.sendall(_FRAME_HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def handle_request(options, content, pool):
+    '''
+    Render a single request.
+
+    Args:
+        options: dict with dom2img() options (see OPTIONS).
+        content: utf-8 encoded bytes with HTML.
+        pool: PhantomJSPool used for rendering.
+
+    Returns:
+        tuple with int status and bytes with PNG image data (status 0)
+        or utf-8 encoded error message.
+    '''
+    unknown = set(options) - OPTIONS
+    if unknown:
+        err_msg = u'unexpected options: ' + u', '.join(sorted(unknown))
+        return STATUS_INVALID_ARGS, err_msg.encode('utf-8')
+    kwargs = dict((str(key), val) for key, val in options.items())
+    try:
+        image = _dom2img.dom2img(content=content, pool=pool, **kwargs)
+    except (TypeError, ValueError) as e:
+        return STATUS_INVALID_ARGS, _compat.text(e).encode('utf-8')
+    except _exceptions.PhantomJSTimeout as e:
+        return STATUS_TIMEOUT, str(e).encode('utf-8')
+    except _exceptions.Dom2ImgError as e:
+        return STATUS_FAILURE, str(e).encode('utf-8')
+    except Exception as e:  # e.g. OSError or MemoryError
+        _logger.exception(u'render request failed')
+        err_msg = u'internal error: ' + _compat.text(e)
+        return STATUS_FAILURE, err_msg.encode('utf-8')
+    return STATUS_OK, image
+
+
+class _Handler(_compat.socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.request)
+            except (EOFError, ValueError, socket.error):
+                return
+            if message is None:
+                return
+            options, content = message
+            status, data = handle_request(options, content, self.server.pool)
+            write_message(self.request, {'status': status}, data)
+
+
+class _TCPServer(_compat.socketserver.ThreadingMixIn,
+                 _compat.socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(_compat.socketserver.ThreadingMixIn,
+                  _compat.socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(path):
+    '''
+    Remove Unix socket file left by a previous server, other files are kept.
+    '''
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def make_server(address, pool, allow_remote=False):
+    '''
+    Create render server, that handles every connection in a new thread.
+
+    Args:
+        address: unicode text with server address (see parse_address()).
+        pool: PhantomJSPool used for rendering.
+        allow_remote: bool, if True TCP server can listen on non-loopback
+            addresses (see check_bind_host()).
+
+    Returns:
+        SocketServer server object.
+
+    Raises:
+        ValueError: TCP address isn't a loopback address, and allow_remote
+            is False.
+    '''
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        _remove_stale_socket(address)
+        server = _UnixServer(address, _Handler)
+    else:
+        check_bind_host(address[0], allow_remote)
+        server = _TCPServer(address, _Handler)
+    server.pool = pool
+    return server
+
+
+def serve(address, pool, allow_remote=False):
+    '''
+    Serve render requests until interrupted.
+
+    Args:
+        The same as for make_server().
+    '''
+    server = make_server(address, pool, allow_remote)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            _remove_stale_socket(server.server_address)
+
+
+def request(address, options, content):
+    '''
+    Send a render request to server.
+
+    Args:
+        address: unicode text with server address (see parse_address()).
+        options: dict with dom2img() options (see OPTIONS).
+        content: utf-8 encoded bytes with HTML.
+
+    Returns:
+        tuple with int status and bytes with PNG image data (status 0)
+        or utf-8 encoded error message.
+
+    Raises:
+        socket.error: server couldn't be reached.
+        EOFError: server closed the connection without a response.
+    '''
+    family, address = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        write_message(sock, options, content)
+        message = read_message(sock)
+    finally:
+        sock.close()
+    if message is None:
+        raise EOFError(u'connection closed without a response')
+    header, data = message
+    return header['status'], data
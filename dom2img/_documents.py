@@ -0,0 +1,218 @@
+'''
+Store of uploaded documents, that later uploads can be applied to as deltas.
+'''
+import binascii
+import os
+import threading
+
+from dom2img import _compat, _exceptions
+
+
+# parser of stored documents, it keeps their element structure as it is
+# (e.g. lxml moves some misplaced elements), so that paths computed
+# by browsers match
+_PARSER = 'html.parser'
+
+
+def _element_children(tag):
+    '''
+    Get children of a BeautifulSoup tag that are tags themselves.
+    '''
+    from bs4 import Tag  # slow to import, only needed here
+
+    return [child for child in tag.children if isinstance(child, Tag)]
+
+
+def _find_element(doc, path):
+    '''
+    Find element of a document using its path from the html element.
+
+    Args:
+        doc: BeautifulSoup document.
+        path: list of [index, tag name] pairs, where index is the position
+            of an element among element children of its parent.
+
+    Returns:
+        BeautifulSoup tag.
+
+    Raises:
+        ValueError: path is invalid, or doesn't match the document.
+    '''
+    node = doc.html
+    if node is None:
+        raise ValueError(u'document has no html element')
+    if not isinstance(path, list) or not path:
+        raise ValueError(u'change path must be a non-empty list')
+    for step in path:
+        try:
+            index, name = step
+            index = int(index)
+            children = _element_children(node)
+            if not 0 <= index < len(children) or \
+                    children[index].name != name.lower():
+                raise LookupError
+        except (TypeError, ValueError, LookupError, AttributeError):
+            raise ValueError(u"change path doesn't match the document")
+        node = children[index]
+    return node
+
+
+def changed_document(content, changes):
+    '''
+    Parse a HTML document and replace its subtrees.
+
+    Args:
+        content: Utf-8 encoded bytes with HTML.
+        changes: list of dicts with keys:
+            * path: path of the replaced element (see _find_element()),
+            * html: unicode text with HTML of the new subtree(s).
+
+    Returns:
+        BeautifulSoup document with the changes.
+
+    Raises:
+        ValueError: changes are invalid, or don't match the document.
+    '''
+    from bs4 import BeautifulSoup  # slow to import, only needed here
+
+    if not isinstance(changes, list):
+        raise ValueError(u'changes must be a list')
+    doc = BeautifulSoup(content, _PARSER)
+    for change in changes:
+        if not isinstance(change, dict) or \
+                not isinstance(change.get('html'), _compat.text):
+            raise ValueError(u'change must be an object with path and html')
+        old = _find_element(doc, change.get('path'))
+        new = BeautifulSoup(change['html'], _PARSER)
+        for node in list(new.contents):
+            old.insert_before(node.extract())
+        old.decompose()
+    return doc
+
+
+def apply_changes(content, changes):
+    '''
+    Replace subtrees of a HTML document.
+
+    Args:
+        The same as for changed_document().
+
+    Returns:
+        Utf-8 encoded bytes with the changed HTML.
+
+    Raises:
+        ValueError: changes are invalid, or don't match the document.
+    '''
+    return changed_document(content, changes).encode('utf-8')
+
+
+class DocumentStore(object):
+    '''
+    Thread-safe LRU store of uploaded HTML documents.
+
+    Documents belong to sessions (e.g. user sessions of a web application)
+    and can only be used within the session that uploaded them.
+    Clients that take several screenshots of the same page can upload
+    only the subtrees that have changed (see update()), instead of the
+    whole document.
+    '''
+
+    def __init__(self, max_documents=1000, max_bytes=64 * 1024 * 1024):
+        '''
+        Args:
+            max_documents: int, maximal number of stored documents.
+            max_bytes: int, maximal size of all stored documents.
+                Documents bigger than that are not stored at all.
+        '''
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._bytes = 0
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def put(self, session, content):
+        '''
+        Store a document, evicting least recently used ones if necessary.
+
+        Args:
+            session: hashable session identifier (e.g. unicode text).
+            content: Utf-8 encoded bytes with HTML.
+
+        Returns:
+            Unicode text with the new document id.
+        '''
+        document_id = binascii.hexlify(os.urandom(16)).decode('ascii')
+        size = len(content)
+        if size > self.max_bytes or self.max_documents < 1:
+            return document_id
+        with self._lock:
+            while self._documents and \
+                    (len(self._documents) >= self.max_documents or
+                     self._bytes + size > self.max_bytes):
+                lru_key = min(self._documents,
+                              key=lambda k: self._documents[k][0])
+                self._remove(lru_key)
+            self._clock += 1
+            self._documents[(session, document_id)] = [self._clock, content]
+            self._bytes += size
+        return document_id
+
+    def get(self, session, document_id):
+        '''
+        Get a stored document.
+
+        Args:
+            session: hashable session identifier.
+            document_id: unicode text with document id (see put()).
+
+        Returns:
+            Utf-8 encoded bytes with HTML.
+
+        Raises:
+            DocumentNotFound: document has been evicted, or it has
+                never been stored within that session.
+        '''
+        with self._lock:
+            entry = self._documents.get((session, document_id))
+            if entry is None:
+                raise _exceptions.DocumentNotFound(document_id)
+            self._clock += 1
+            entry[0] = self._clock
+            return entry[1]
+
+    def update(self, session, document_id, changes):
+        '''
+        Store a new version of a document.
+
+        Args:
+            session: hashable session identifier.
+            document_id: unicode text with id of the base document.
+            changes: list of changes (see apply_changes()).
+
+        Returns:
+            (document id, content) tuple with unicode text id of the new
+            document and utf-8 encoded bytes with its HTML.
+
+        Raises:
+            DocumentNotFound: base document isn't stored.
+            ValueError: changes are invalid, or don't match the document.
+        '''
+        content = apply_changes(self.get(session, document_id), changes)
+        return self.put(session, content), content
+
+    def _remove(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def clear(self):
+        '''
+        Drop all stored documents.
+        '''
+        with self._lock:
+            self._documents.clear()
+            self._bytes = 0
@@ -1,19 +1,14 @@
+import math
 import os
-import pipes
+import re
 import subprocess
-import sys
-import tempfile
-from distutils import spawn
-
-import pkg_resources
-from PIL import Image
-from bs4 import BeautifulSoup
+import time
 
 from dom2img import _cookies, _url_utils, _arg_utils, \
-    _compat, _subprocess, _exceptions
+    _compat, _subprocess, _exceptions, _phantomjs, _cache, _screenshot
 
 
-def _clean_up_html(content, prefix):
+def _clean_up_html(content, prefix, volatile=None, base_href=False):
     '''
     Remove all script tags and make relative URLs absolute.
 
@@ -21,25 +16,85 @@ def _clean_up_html(content, prefix):
         content: Utf-8 encoded bytes with HTML.
         prefix: Ascii-only unicode URL, that will be used to make
             absolute URLs.
+        volatile: VolatileContent, describing content that should be
+            normalized, or None to keep it as it is.
+        base_href: bool, if True a single base tag with prefix is added
+            to the document, instead of rewriting URLs of every tag.
 
     Returns:
         Utf-8 encoded bytes with HTML that doesn't contain any script tags,
-        and all relative URLs were made absolute.
+        and all relative URLs were made absolute (or are resolved
+        against prefix).
     '''
-    doc = BeautifulSoup(content)
+    from bs4 import BeautifulSoup  # slow to import, only needed here
+
+    return _clean_up_document(BeautifulSoup(content), prefix, volatile,
+                              base_href)
 
+
+def _clean_up_document(doc, prefix, volatile=None, base_href=False):
+    '''
+    Clean up a parsed HTML document (see _clean_up_html()).
+
+    Args:
+        doc: BeautifulSoup document, that gets modified.
+        Other arguments are the same as for _clean_up_html().
+
+    Returns:
+        Utf-8 encoded bytes with the cleaned up HTML.
+    '''
     for tag in doc.findAll('script'):
         tag.decompose()
 
-    _url_utils.absolutize_urls(doc, 'link', u'href', prefix)
-    _url_utils.absolutize_urls(doc, 'a', u'href', prefix)
-    _url_utils.absolutize_urls(doc, 'img', u'src', prefix)
+    if base_href:
+        _url_utils.set_base_href(doc, prefix)
+    else:
+        _url_utils.absolutize_urls(doc, 'link', u'href', prefix)
+        _url_utils.absolutize_urls(doc, 'a', u'href', prefix)
+        _url_utils.absolutize_urls(doc, 'img', u'src', prefix)
+
+    if volatile is not None:
+        volatile.normalize(doc)
 
     return doc.prettify().encode('utf-8')
 
 
+_SCRIPT_TAG_RE = re.compile(br'<\s*script', re.IGNORECASE)
+
+
+def _prepare_html(content, prefix, volatile=None, base_href=False,
+                  precleaned=False):
+    '''
+    Clean up HTML, unless it has already been cleaned up by dom2img.js.
+
+    Pre-cleaned HTML is used as it is (without parsing it), as long as
+    it doesn't contain anything that looks like a script tag and
+    no volatile content has to be normalized, otherwise it's cleaned up
+    like any other HTML.
+
+    Args:
+        content: Utf-8 encoded bytes with HTML.
+        prefix: Ascii-only unicode URL, that will be used to make
+            absolute URLs.
+        volatile: the same as for _clean_up_html().
+        base_href: the same as for _clean_up_html().
+        precleaned: bool, if True scripts have been removed and URLs have
+            been made absolute already.
+
+    Returns:
+        Utf-8 encoded bytes with HTML that doesn't contain any script tags,
+        and all relative URLs were made absolute.
+    '''
+    if precleaned and volatile is None and \
+            _SCRIPT_TAG_RE.search(content) is None:
+        return content
+    return _clean_up_html(content, prefix, volatile, base_href)
+
+
 def _phantomjs_invocation(width, height, top, left,
-                          prefix, cookie_string):
+                          prefix, cookie_string, phantomjs_path=None,
+                          full_page=False, load_timeout=None,
+                          offline=False, settle_timeout=None):
     '''
     Prepare command line arguments for running PhantomJS renderer.
 
@@ -52,6 +107,16 @@ def _phantomjs_invocation(width, height, top, left,
             with origin of the HTML.
         cookie_string: bytes containing cookies using "key1=val1;key2=val2"
             format.
+        phantomjs_path: unicode text with path to PhantomJS binary,
+            or None to look it up in $DOM2IMG_PHANTOMJS and $PATH.
+        full_page: bool, if True whole page is rendered, instead of
+            the viewport at top/left offsets.
+        load_timeout: int, number of seconds after which the page
+            is rendered, even if it hasn't finished loading (or settling),
+            or None.
+        offline: bool, if True network requests of the page are aborted.
+        settle_timeout: int, number of seconds to wait after the page
+            has loaded, before it's rendered, or None.
 
     Returns:
         list of unicode text objects that contains cli args for running
@@ -61,28 +126,68 @@ def _phantomjs_invocation(width, height, top, left,
         PhantomJSNotInPath: There's no phantomjs in $PATH.
     '''
     cookie_domain = _cookies.get_cookie_domain(prefix)
+    phantomjs_binary = _phantomjs.find_phantomjs(phantomjs_path)
 
-    render_file_phantom_js_location = \
-        os.path.realpath(pkg_resources.resource_filename(
-            __name__, 'render_file.phantom.js'))
-    phantomjs_binary = spawn.find_executable('phantomjs')
-    if phantomjs_binary is None:
-        raise _exceptions.PhantomJSNotInPath()
-
-    if isinstance(render_file_phantom_js_location, bytes):
-        render_file_phantom_js_location = \
-            render_file_phantom_js_location.decode(sys.getfilesystemencoding())
-        phantomjs_binary = phantomjs_binary.decode(sys.getfilesystemencoding())
-
-    return [phantomjs_binary, render_file_phantom_js_location,
+    args = [phantomjs_binary, _phantomjs.render_script_path(),
             _compat.text(width), _compat.text(height),
             _compat.text(top), _compat.text(left),
             cookie_domain.decode('ascii'),
             cookie_string.decode('ascii')]
+    if full_page:
+        args.append(u'--full-page')
+    if load_timeout is not None:
+        args.append(u'--load-timeout=%d' % int(load_timeout * 1000))
+    if offline:
+        args.append(u'--offline')
+    if settle_timeout:
+        args.append(u'--settle=%d' % (settle_timeout * 1000))
+    return args
+
+
+# seconds left for rendering and writing the image after load timeout,
+# if only load_timeout is given
+_DEFAULT_RENDER_TIMEOUT = 1
+
+
+def _load_budget(timeout, load_timeout=None, render_timeout=None):
+    '''
+    Compute PhantomJS load timeout, that leaves enough of the remaining
+    time for rendering whatever has been loaded before PhantomJS is killed.
+
+    Args:
+        timeout: int, number of seconds after which PhantomJS will be killed.
+        load_timeout: int, requested number of seconds for loading
+            the page, or None.
+        render_timeout: int, number of seconds needed for rendering
+            and writing the image, or None.
+
+    Returns:
+        int number of seconds for loading (and settling) the page,
+        or None if page load isn't limited.
+
+    >>> _load_budget(30, load_timeout=5)
+    5
+    >>> _load_budget(4, load_timeout=5)
+    3
+    >>> _load_budget(10, render_timeout=2)
+    8
+    >>> _load_budget(10) is None
+    True
+    '''
+    if load_timeout is None and render_timeout is None:
+        return None
+    if render_timeout is None:
+        render_timeout = _DEFAULT_RENDER_TIMEOUT
+    budget = max(timeout - render_timeout, 0)
+    if load_timeout is not None:
+        budget = min(budget, load_timeout)
+    return budget
 
 
 def _render(content, width, height, top, left, prefix,
-            cookie_string, timeout):
+            cookie_string, timeout, phantomjs_path=None, full_page=False,
+            nice=0, limits=None, stderr_hook=None, cancel=None,
+            load_timeout=None, offline=False, settle_timeout=None):
     '''
     Renders HTML content using PhantomJS.
 
@@ -97,36 +202,156 @@ def _render(content, width, height, top, left, prefix,
         cookie_string: bytes containing cookies using "key1=val1;key2=val2"
             format.
         timeout: int, number of seconds after which PhantomJS will be killed.
+        phantomjs_path: unicode text with path to PhantomJS binary,
+            or None to look it up in $DOM2IMG_PHANTOMJS and $PATH.
+        full_page: bool, if True whole page is rendered, instead of
+            the viewport at top/left offsets.
+        nice: int, niceness increment of PhantomJS process.
+        limits: ResourceLimits of PhantomJS process, or None.
+        stderr_hook: function called with every line of PhantomJS stderr
+            output (unicode text), or None.
+        cancel: CancelToken, that kills PhantomJS process group, or None.
+        load_timeout: int, number of seconds after which PhantomJS
+            renders the page, even if it hasn't finished loading, or None.
+        offline: bool, if True the page is rendered without network
+            access (see CircuitBreaker).
+        settle_timeout: int, number of seconds PhantomJS waits after
+            the page has loaded, before rendering it, or None.
 
     Returns:
-        bytes with PNG data of the render.
+        Screenshot with PNG data of the render (partial, if page load
+        has been cut short by load_timeout, or it's an offline render).
 
     Raises:
         PhantomJSFailure: PhantomJS process failed/crashed.
+        PhantomJSMemoryLimit, PhantomJSCPULimit, PhantomJSOutputLimit:
+            PhantomJS process has exceeded limits.
         PhantomJSTimeout: PhantomJS took more than timeout seconds to finish.
         PhantomJSNotInPath: There's no PhantomJS in $PATH.
+        RenderCancelled: cancel token has been cancelled.
     '''
+    if cancel is not None:
+        cancel.raise_if_cancelled()
     phantomjs_args = _phantomjs_invocation(width=width, height=height,
                                            top=top, left=left, prefix=prefix,
-                                           cookie_string=cookie_string)
+                                           cookie_string=cookie_string,
+                                           phantomjs_path=phantomjs_path,
+                                           full_page=full_page,
+                                           settle_timeout=settle_timeout,
+                                           load_timeout=load_timeout,
+                                           offline=offline)
     proc = subprocess.Popen(phantomjs_args,
                             stdin=subprocess.PIPE,
                             stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    result = _subprocess.communicate_with_timeout(proc, timeout, content)
+                            stderr=subprocess.PIPE,
+                            preexec_fn=_subprocess.preexec_fn(
+                                nice, limits, new_session=cancel is not None))
+    max_output = None if limits is None else limits.max_output
+    marker_hook = _screenshot.PartialMarkerHook(stderr_hook)
+    # only head and tail of (possibly huge) stderr output is kept
+    stderr_capture = _subprocess.OutputCapture(hook=marker_hook)
+
+    def kill():
+        _subprocess.kill_process_group(proc)
+
+    if cancel is not None:
+        cancel.add_callback(kill)
+    try:
+        result = _subprocess.communicate_with_timeout(
+            proc, timeout, content, max_output, stderr_capture)
+    finally:
+        if cancel is not None:
+            cancel.remove_callback(kill)
+    if cancel is not None:
+        cancel.raise_if_cancelled()
     if result is None:
         raise _exceptions.PhantomJSTimeout(timeout)
     else:
         stdout, stderr = result
         if proc.returncode:
             stderr = stderr.decode('ascii', 'ignore') or None
+            if limits is not None:
+                raise limits.failure(proc.returncode, stderr)
             raise _exceptions.PhantomJSFailure(return_code=proc.returncode,
                                                stderr=stderr)
         else:
-            return stdout
+            return _screenshot.Screenshot(stdout,
+                                          marker_hook.partial or offline)
+
+
+def _decode_image(img_string):
+    '''
+    Decode PNG image data.
+
+    Args:
+        img_string: bytes containing PNG image data.
+
+    Returns:
+        loaded Pillow image.
+    '''
+    from PIL import Image  # slow to import, only needed here
+
+    img = Image.open(_compat.BytesIO(img_string))
+    img.load()
+    return img
+
+
+def _encode_image(img):
+    '''
+    Encode an image as PNG.
+
+    Args:
+        img: Pillow image.
+
+    Returns:
+        bytes containing PNG image data.
+    '''
+    buff = _compat.BytesIO()
+    img.save(buff, format='PNG')
+    return buff.getvalue()
+
+
+def _scaled(length, scale):
+    '''
+    Scale a pixel length.
+
+    Args:
+        length: int, number of pixels.
+        scale: int with percentage number of the resize.
+
+    Returns:
+        int, number of pixels after the resize.
+    '''
+    return int(round(length * (scale / 100.)))
 
 
-def _resize(img_string, scale, resize_filter=Image.ANTIALIAS):
+def _resize_image(img, scale, resize_filter=None, size=None):
+    '''
+    Resize a decoded image.
+
+    Args:
+        img: Pillow image.
+        scale: int with percentage number of the resize, 50 (percent)
+            means 2 times smaller image.
+        resize_filter: Pillow resize filter, abstracted for tests,
+            defaults to antialias filter.
+        size: (width, height) tuple with size of the result, overrides
+            the size computed from scale.
+
+    Returns:
+        Pillow image, resized.
+    '''
+    from PIL import Image  # slow to import, only needed here
+
+    if resize_filter is None:
+        resize_filter = Image.ANTIALIAS
+    if size is None:
+        width, height = img.size
+        size = (_scaled(width, scale), _scaled(height, scale))
+    return img.resize(size, resize_filter)
+
+
+def _resize(img_string, scale, resize_filter=None):
     '''
     Resize an image.
 
@@ -134,24 +359,229 @@ def _resize(img_string, scale, resize_filter=Image.ANTIALIAS):
         img_string: bytes containing PNG image data.
         scale: int with percentage number of the resize, 50 (percent)
             means 2 times smaller image.
-        resize_filter: Pillow resize filter, abstracted for tests.
+        resize_filter: Pillow resize filter, abstracted for tests,
+            defaults to antialias filter.
 
     Returns:
         bytes containing PNG image data of the resized image.
     '''
     if scale != 100:  # no point in resizing to 100%
-        img = Image.open(_compat.BytesIO(img_string))
-        width, height = img.size
-        new_width = int(round(width * (scale / 100.)))
-        new_height = int(round(height * (scale / 100.)))
-        result = img.resize((new_width, new_height), resize_filter)
-        buff = _compat.BytesIO()
-        result.save(buff, format='PNG')
-        return buff.getvalue()
+        img = _resize_image(_decode_image(img_string), scale, resize_filter)
+        return _encode_image(img)
     else:
         return img_string
 
 
+def _crop(img, top, left, width, height):
+    '''
+    Cut a viewport out of a full-page render.
+
+    Parts of the viewport that lie outside of the render are white.
+
+    Args:
+        img: Pillow image with the full-page render.
+        top: int, pixel offset from the top/vertical scroll position.
+        left: int, pixel offset from the left/horizontal scroll position.
+        width: int, non-negative width of the viewport in pixels.
+        height: int, non-negative height of the viewport in pixels.
+
+    Returns:
+        Pillow image with width x height size.
+    '''
+    from PIL import Image  # slow to import, only needed here
+
+    img_width, img_height = img.size
+    if left + width <= img_width and top + height <= img_height:
+        return img.crop((left, top, left + width, top + height))
+    white = (255,) * len(img.getbands())
+    result = Image.new(img.mode, (width, height), white)
+    visible = img.crop((left, top,
+                        min(left + width, img_width),
+                        min(top + height, img_height)))
+    result.paste(visible, (0, 0))
+    return result
+
+
+def _pyramid_level(cache, key, img, scale):
+    '''
+    Get the pyramid level of a cached render, used for a screenshot.
+
+    Missing levels are resampled from the full-size render and cached.
+
+    Args:
+        cache: RenderCache with the render.
+        key: unicode text with cache key of the render.
+        img: Pillow image with the full-size render.
+        scale: int with percentage scale of the screenshot.
+
+    Returns:
+        (level, image) tuple, with int percentage scale of the level
+        and Pillow image with the render at that scale.
+    '''
+    level = cache.level_for(scale)
+    if level == 100:
+        return level, img
+    level_img = cache.get_level(key, level)
+    if level_img is None:
+        level_img = _resize_image(img, level)
+        cache.put_level(key, level, level_img)
+    return level, level_img
+
+
+def _run_renderer(pool, phantomjs_path, deadline, scheduler=None,
+                  priority=None, semaphore=None, load_timeout=None,
+                  render_timeout=None, **kwargs):
+    '''
+    Render HTML using pool, or a new PhantomJS process if pool is None.
+
+    Args:
+        pool: PhantomJSPool or None.
+        phantomjs_path: unicode text with path to PhantomJS binary,
+            or None (ignored if pool is used).
+        deadline: float, time.time() value by which rendering has
+            to finish, or None.
+        scheduler: RenderScheduler, that has to give a slot for rendering,
+            or None.
+        priority: unicode text with priority class name (if scheduler
+            is used).
+        semaphore: HostSemaphore, that has to give a slot for rendering,
+            or None.
+        load_timeout: int, number of seconds for loading the page,
+            or None (see _load_budget()).
+        render_timeout: int, number of seconds for rendering the page
+            after load timeout, or None (see _load_budget()).
+        **kwargs: the same as for _render().
+
+    Returns:
+        Screenshot with PNG data of the render.
+
+    Raises:
+        DeadlineExceeded: deadline has passed before rendering started,
+            or there's no time left for loading the page (see
+            _load_budget()).
+        RenderQueueTimeout: semaphore's wait timeout has passed.
+        RenderCancelled: render has been cancelled (see _render()
+            cancel argument).
+        Other exceptions are the same as for _render().
+    '''
+    cancel = kwargs.get('cancel')
+    if scheduler is not None:
+        with scheduler.slot(priority, deadline, cancel):
+            if pool is None:
+                kwargs['nice'] = scheduler.niceness(priority)
+            return _run_renderer(pool, phantomjs_path, deadline,
+                                 semaphore=semaphore,
+                                 load_timeout=load_timeout,
+                                 render_timeout=render_timeout, **kwargs)
+    if semaphore is not None:
+        with semaphore.slot(deadline=deadline, cancel=cancel):
+            return _run_renderer(pool, phantomjs_path, deadline,
+                                 load_timeout=load_timeout,
+                                 render_timeout=render_timeout, **kwargs)
+
+    wait_timeout = None
+    if deadline is not None:
+        wait_timeout = deadline - time.time()
+        if wait_timeout <= 0:
+            raise _exceptions.DeadlineExceeded(deadline)
+        kwargs['timeout'] = min(kwargs['timeout'],
+                                int(math.ceil(wait_timeout)))
+    # time spent waiting for slots is taken from the load budget
+    kwargs['load_timeout'] = _load_budget(kwargs['timeout'], load_timeout,
+                                          render_timeout)
+    if deadline is not None and kwargs['load_timeout'] == 0 and \
+            load_timeout != 0:
+        # there's no time left to load anything, only a blank page
+        raise _exceptions.DeadlineExceeded(deadline)
+    if pool is None:
+        return _render(phantomjs_path=phantomjs_path, **kwargs)
+    else:
+        kwargs.pop('limits', None)
+        kwargs.pop('stderr_hook', None)
+        return pool.render(wait_timeout=wait_timeout, **kwargs)
+
+
+def _check_deadline(deadline):
+    '''
+    Raise DeadlineExceeded if deadline (or None) has passed.
+    '''
+    if deadline is not None and time.time() > deadline:
+        raise _exceptions.DeadlineExceeded(deadline)
+
+
+def _run_with_retries(retry, pool, phantomjs_path, deadline, breaker=None,
+                      **kwargs):
+    '''
+    Render HTML (see _run_renderer()), retrying transient failures.
+
+    Every attempt waits for scheduler/semaphore/pool slots again,
+    so they aren't held during backoff. Attempts aren't retried
+    if backoff would end after deadline.
+
+    Args:
+        retry: RetryPolicy or None.
+        breaker: CircuitBreaker, that records outcome of every attempt,
+            or None.
+        Other arguments are the same as for _run_renderer().
+
+    Returns:
+        Screenshot with PNG data of the render and number of attempts.
+
+    Raises:
+        CircuitOpen: breaker's circuit of prefix's origin is open, its
+            failure attribute has the failure of the previous attempt
+            (or None).
+        Other exceptions are the same as for _run_renderer(). If retry
+        is used, exceptions have attempts attribute with the number
+        of attempts.
+    '''
+    cancel = kwargs.get('cancel')
+    prefix = kwargs['prefix']
+    attempt = 1
+    failure = None
+    while True:
+        ticket = None
+        if breaker is not None:
+            try:
+                ticket = breaker.before_render(prefix)
+            except _exceptions.CircuitOpen as e:
+                # retry has opened the circuit, don't hide its cause
+                e.failure = e.__cause__ = failure
+                raise
+        offline = ticket is not None and ticket.offline
+        try:
+            result = _run_renderer(pool, phantomjs_path, deadline,
+                                   offline=offline, **kwargs)
+        except _exceptions.Dom2ImgError as e:
+            if breaker is not None:
+                breaker.after_render(prefix, ticket, breaker.outcome(e))
+            if retry is None:
+                raise
+            failure = e
+            e.attempts = attempt
+            delay = retry.delay(e, attempt)
+            if delay is None or \
+                    (deadline is not None and time.time() + delay >= deadline):
+                raise
+            if cancel is not None:
+                cancel.wait(delay)
+                cancel.raise_if_cancelled()
+            else:
+                time.sleep(delay)
+            attempt += 1
+        except:
+            if breaker is not None:
+                breaker.after_render(prefix, ticket, None)
+            raise
+        else:
+            if breaker is not None:
+                # renders cut short by load timeout count as failures
+                breaker.after_render(prefix, ticket, result.partial)
+            return _screenshot.Screenshot(result, result.partial, attempt)
+
+
+_optional_seconds = _arg_utils.optional_non_negative_int
+
 _dom2img_args_validator = \
     _arg_utils.validate_and_unify(content=_arg_utils.utf8_byte_string,
                                   height=_arg_utils.non_negative_int,
@@ -160,12 +590,22 @@ _dom2img_args_validator = \
                                   left=_arg_utils.non_negative_int,
                                   scale=_arg_utils.non_negative_int,
                                   timeout=_arg_utils.non_negative_int,
-                                  prefix=_arg_utils.absolute_url)
+                                  load_timeout=_optional_seconds,
+                                  render_timeout=_optional_seconds,
+                                  settle_timeout=_optional_seconds,
+                                  prefix=_arg_utils.absolute_url,
+                                  phantomjs_path=_arg_utils.optional_path)
 
 
 @_dom2img_args_validator
 def dom2img(content, width, height, prefix, top=0,
-            left=0, scale=100, cookies=None, timeout=30):
+            left=0, scale=100, cookies=None, timeout=30,
+            phantomjs_path=None, pool=None, cache=None, volatile=None,
+            base_href=False, precleaned=False, deadline=None,
+            scheduler=None, priority=u'interactive', semaphore=None,
+            limits=None, stderr_hook=None, cancel=None, load_timeout=None,
+            render_timeout=None, best_effort=False, retry=None,
+            breaker=None, settle_timeout=None):
     '''
     Renders HTML using PhantomJS.
 
@@ -207,28 +647,172 @@ def dom2img(content, width, height, prefix, top=0,
                 * dict with cookie bytes/unicode text keys and values.
                     Neither keys nor values should contain semicolons.
                     Keys cannot contain '=' character.
+        phantomjs_path: bytes or unicode text with path to PhantomJS binary
+            (or its name, that will be looked up in $PATH). If it's None,
+            $DOM2IMG_PHANTOMJS environment variable is used, or phantomjs
+            is looked up in $PATH.
+        pool: PhantomJSPool with warm PhantomJS processes that should be used
+            for rendering, or None to start a new PhantomJS process.
+            phantomjs_path is ignored if pool is used.
+        cache: RenderCache, that will be used to keep unscaled full-page
+            renders and to produce screenshots with different
+            top/left/height/scale from them, or None to render only
+            the requested viewport.
+        volatile: VolatileContent, describing content (e.g. CSRF tokens)
+            that should be normalized before rendering, so that repeated
+            dumps of the same page share cache entries, or None to keep
+            content as it is.
+        base_href: bool, if True relative URLs are resolved using a single
+            <base href="prefix"> tag, instead of rewriting URLs of all
+            links and images, which is faster for big documents.
+        precleaned: bool, if True content comes from a trusted source,
+            that has already removed scripts and made URLs absolute
+            (e.g. dom2img.js with preclean option), so it isn't parsed
+            at all. Content that contains anything that looks like
+            a script tag is cleaned up anyway.
+        deadline: float, time.time() value by which the screenshot has
+            to be rendered, or None. PhantomJS timeout and waiting for
+            a free pool worker are limited accordingly, screenshots
+            resized or cropped after the deadline are discarded.
+        scheduler: RenderScheduler, that limits the number of concurrent
+            renders and orders them by priority and deadline, or None
+            to render right away.
+        priority: unicode text with name of scheduler's priority class
+            (interactive or background by default), ignored if scheduler
+            is None.
+        semaphore: HostSemaphore, that limits the number of concurrent
+            renders of all processes on the host, or None.
+        limits: ResourceLimits (memory, CPU time, open files, output size)
+            of PhantomJS process, or None. It's ignored if pool is used.
+        stderr_hook: function called with every line of PhantomJS stderr
+            output (unicode text) as it arrives, e.g. to log console
+            errors of rendered pages, or None. It's ignored if pool is used.
+            Exceptions keep only the first and the last 32KB of stderr.
+        cancel: CancelToken, that can be used (e.g. by another thread)
+            to stop the render, or None. Cancelled render stops waiting
+            for scheduler, semaphore or pool, its PhantomJS process
+            (and its children) gets killed right away, and it fails with
+            RenderCancelled.
+        load_timeout: None, int, bytes or unicode text containing decimal
+            representation of a non-negative integer with the number
+            of seconds PhantomJS waits for the page (and its resources)
+            to load. After that, whatever has been loaded so far is
+            rendered, instead of failing with PhantomJSTimeout.
+        render_timeout: None, int, bytes or unicode text containing
+            decimal representation of a non-negative integer with the
+            number of seconds reserved for rendering the page after load
+            timeout (1 by default). If either of them is given, page load
+            is cut short in time for rendering to finish before timeout
+            and deadline (time spent waiting for scheduler, semaphore
+            or pool is taken from the load budget).
+        best_effort: bool, if True page load is always cut short
+            in time for rendering (as if render_timeout was 1), so that
+            slow pages are rendered with whatever has been loaded,
+            instead of failing with PhantomJSTimeout.
+        retry: RetryPolicy, that decides which PhantomJS failures
+            (e.g. crashes) are retried with a fresh process, or None
+            to fail right away.
+        breaker: CircuitBreaker, that tracks failures of prefix's origin,
+            and makes its renders fail fast (or render without network
+            access), while they keep failing, or None.
+        settle_timeout: None, int, bytes or unicode text containing
+            decimal representation of a non-negative integer with the
+            number of seconds PhantomJS waits after the page has loaded,
+            before rendering it, so that e.g. web fonts and layout
+            changes settle. Settling counts towards the load budget
+            (see load_timeout), page that is still settling when it runs
+            out is rendered as it is (such renders aren't partial).
 
     Returns:
-        bytes containing PNG image data with the render.
+        Screenshot (bytes) containing PNG image data with the render.
+        Its partial attribute is True if page load has been cut short
+        (see load_timeout and best_effort), such renders aren't cached.
+        Its attempts attribute has the number of render attempts
+        (see retry). Offline renders (see breaker) are partial too.
 
     Raises:
         TypeError: arguments are not the right type.
-        ValueError: arguments have invalid values.
+        ValueError: arguments have invalid values (e.g. render_timeout
+            leaves no time for loading the page).
         PhantomJSFailure: PhantomJS process failed/crashed.
+        PhantomJSMemoryLimit, PhantomJSCPULimit, PhantomJSOutputLimit:
+            PhantomJS process has exceeded limits.
         PhantomJSTimeout: PhantomJS took too long to finish.
         PhantomJSNotInPath: There's no PhantomJS in $PATH.
+        DeadlineExceeded: deadline has passed before rendering started,
+            no pool worker became available before it, or scheduler
+            has rejected the render, because it couldn't finish in time,
+            or there's no time left for loading the page before it,
+            or it has passed while the image was resized or cropped.
+        RenderQueueTimeout: semaphore has no free slot, and its timeout
+            has passed.
+        RenderCancelled: cancel token has been cancelled.
+        If retry is used, PhantomJS failures have attempts attribute
+        with the number of render attempts.
+        CircuitOpen: breaker's circuit of prefix's origin is open.
     '''
     cookie_string = _cookies.cookie_string(cookies, u'cookies')
-    cleaned_up_content = _clean_up_html(content, prefix)
-    img_string = _render(content=cleaned_up_content, width=width,
-                         height=height, top=top, left=left, prefix=prefix,
-                         cookie_string=cookie_string, timeout=timeout)
-    return _resize(img_string, scale)
+    if best_effort and load_timeout is None and render_timeout is None and \
+            timeout > _DEFAULT_RENDER_TIMEOUT:
+        render_timeout = _DEFAULT_RENDER_TIMEOUT
+    if render_timeout is not None and render_timeout >= timeout:
+        raise ValueError(u'render_timeout must be less than timeout, ' +
+                         u'to leave time for loading the page')
+    cleaned_up_content = _prepare_html(content, prefix, volatile, base_href,
+                                       precleaned)
+    if cache is None:
+        img_string = _run_with_retries(
+            retry, pool, phantomjs_path, deadline, breaker=breaker,
+            scheduler=scheduler, priority=priority, semaphore=semaphore,
+            limits=limits, stderr_hook=stderr_hook, cancel=cancel,
+            load_timeout=load_timeout, render_timeout=render_timeout,
+            settle_timeout=settle_timeout,
+            content=cleaned_up_content, width=width, height=height,
+            top=top, left=left, prefix=prefix, cookie_string=cookie_string,
+            timeout=timeout)
+        img_string = _screenshot.Screenshot(_resize(img_string, scale),
+                                            img_string.partial,
+                                            img_string.attempts)
+        _check_deadline(deadline)
+        return img_string
+
+    key = _cache.cache_key(cleaned_up_content, prefix, width, cookie_string)
+    img = cache.get(key)
+    partial = False
+    attempts = 0
+    if img is None:
+        img_string = _run_with_retries(
+            retry, pool, phantomjs_path, deadline, breaker=breaker,
+            scheduler=scheduler, priority=priority, semaphore=semaphore,
+            limits=limits, stderr_hook=stderr_hook, cancel=cancel,
+            load_timeout=load_timeout, render_timeout=render_timeout,
+            settle_timeout=settle_timeout,
+            content=cleaned_up_content, width=width, height=height,
+            top=0, left=0, prefix=prefix, cookie_string=cookie_string,
+            timeout=timeout, full_page=True)
+        img = _decode_image(img_string)
+        partial = img_string.partial
+        attempts = img_string.attempts
+        if not partial:
+            cache.put(key, img)
+    if partial:
+        level = 100
+    else:
+        level, img = _pyramid_level(cache, key, img, scale)
+    img = _crop(img, _scaled(top, level), _scaled(left, level),
+                _scaled(width, level), _scaled(height, level))
+    size = (_scaled(width, scale), _scaled(height, scale))
+    if img.size != size:
+        img = _resize_image(img, scale, size=size)
+    img_string = _encode_image(img)
+    _check_deadline(deadline)
+    return _screenshot.Screenshot(img_string, partial, attempts)
 
 
 @_dom2img_args_validator
 def dom2img_debug(content, width, height, prefix, timeout=30,
-                  top=0, left=0, scale=100, cookies=None):
+                  top=0, left=0, scale=100, cookies=None,
+                  phantomjs_path=None):
     '''
     Build a command to run PhantomJS renderer in debug mode.
 
@@ -244,6 +828,9 @@ def dom2img_debug(content, width, height, prefix, timeout=30,
         ValueError: arguments have invalid values.
         PhantomJSNotInPath: There's no PhantomJS in $PATH.
     '''
+    import pipes
+    import tempfile
+
     cookie_string = _cookies.cookie_string(cookies, u'cookies')
 
     (fd, content_path) = tempfile.mkstemp(suffix='.html',
@@ -256,7 +843,8 @@ def dom2img_debug(content, width, height, prefix, timeout=30,
     phantomjs_args = \
         _phantomjs_invocation(width=width, height=height,
                               top=top, left=left, prefix=prefix,
-                              cookie_string=cookie_string)
+                              cookie_string=cookie_string,
+                              phantomjs_path=phantomjs_path)
 
     command = list(map(pipes.quote, phantomjs_args)) + \
         [u'--debug', u'<', pipes.quote(content_path)]
@@ -9,6 +9,11 @@ class PhantomJSFailure(Dom2ImgError):
         self.stderr = stderr
 
     def __str__(self):
+        if self.return_code is None:  # process couldn't be started
+            result = u"PhantomJS couldn't be run"
+            if self.stderr:
+                result += u': ' + self.stderr
+            return result
         result = u'PhantomJS failed with status ' + str(self.return_code)
         if self.stderr:
             result += u', and stderr output:\n' + self.stderr
@@ -28,5 +33,93 @@ class PhantomJSTimeout(Dom2ImgError):
 
 class PhantomJSNotInPath(Dom2ImgError):
 
+    def __init__(self, path=None):
+        self.path = path
+
     def __str__(self):
+        if self.path is not None:
+            return u"Couldn't find phantomjs binary: " + self.path
         return u"Couldn't find phantomjs binary in $PATH"
+
+
+class DocumentNotFound(Dom2ImgError):
+
+    def __init__(self, document_id):
+        self.document_id = document_id
+
+    def __str__(self):
+        return u'Document not found: ' + self.document_id
+
+
+class DeadlineExceeded(Dom2ImgError):
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+
+    def __str__(self):
+        return u'Screenshot deadline has been exceeded before ' + \
+            u'rendering could finish'
+
+
+class RenderQueueTimeout(Dom2ImgError):
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __str__(self):
+        return u'No render slot became available in ' + \
+            str(self.timeout) + u' seconds'
+
+
+class PhantomJSMemoryLimit(PhantomJSFailure):
+
+    def __init__(self, limit, return_code, stderr=None):
+        PhantomJSFailure.__init__(self, return_code, stderr)
+        self.limit = limit
+
+    def __str__(self):
+        return u'PhantomJS exceeded memory limit of ' + str(self.limit) + \
+            u' bytes: ' + PhantomJSFailure.__str__(self)
+
+
+class PhantomJSCPULimit(PhantomJSFailure):
+
+    def __init__(self, limit, return_code, stderr=None):
+        PhantomJSFailure.__init__(self, return_code, stderr)
+        self.limit = limit
+
+    def __str__(self):
+        return u'PhantomJS exceeded CPU time limit of ' + str(self.limit) + \
+            u' seconds: ' + PhantomJSFailure.__str__(self)
+
+
+class PhantomJSOutputLimit(PhantomJSFailure):
+
+    def __init__(self, limit):
+        PhantomJSFailure.__init__(self, return_code=None)
+        self.limit = limit
+
+    def __str__(self):
+        return u'PhantomJS process has been killed, because its output ' + \
+            u'exceeded ' + str(self.limit) + u' bytes'
+
+
+class RenderCancelled(Dom2ImgError):
+
+    def __str__(self):
+        return u'Render has been cancelled'
+
+
+class CircuitOpen(Dom2ImgError):
+
+    def __init__(self, origin, retry_after, failure=None):
+        self.origin = origin
+        self.retry_after = retry_after
+        self.failure = failure
+
+    def __str__(self):
+        msg = u'Renders of ' + self.origin + u' are failing, ' + \
+            u'next attempt in ' + str(self.retry_after) + u' seconds'
+        if self.failure is not None:
+            msg += u', last failure: ' + str(self.failure)
+        return msg
@@ -0,0 +1,120 @@
+'''
+Resource limits of PhantomJS processes.
+'''
+import signal
+
+from dom2img import _exceptions
+
+try:
+    # imported in the parent process, because importing in preexec_fn
+    # (in a forked child of a multithreaded process) can deadlock
+    import resource
+except ImportError:  # POSIX only
+    resource = None
+
+
+# stderr messages of processes that couldn't allocate memory
+_MEMORY_ERRORS = (u'bad_alloc', u'out of memory', u'cannot allocate memory')
+
+# return code of processes killed by kernel at their CPU time soft limit
+# (SIGKILL at the hard limit isn't used, OOM killer sends it too)
+_CPU_LIMIT_RETURN_CODE = -getattr(signal, 'SIGXCPU', 0) or None
+
+
+class ResourceLimits(object):
+    '''
+    Limits of resources used by a single PhantomJS render.
+
+    Memory, CPU time and open files are limited with setrlimit() when
+    PhantomJS process is started (only on POSIX systems), and output size
+    is checked while it's being read, so that a single pathological page
+    can't slow down other renders on the host before timeout kills it.
+
+    Renders that hit the limits fail with PhantomJSMemoryLimit,
+    PhantomJSCPULimit or PhantomJSOutputLimit (subclasses of
+    PhantomJSFailure). Processes don't report which limit they've hit,
+    so failures are only classified as limit failures if there's
+    evidence of it: allocation failure in stderr output for memory,
+    death by SIGXCPU (sent only at the CPU time limit) for CPU time.
+    Other crashes (e.g. transient crashes on fonts, that RetryPolicy
+    retries) are plain PhantomJSFailures.
+
+    Limits are set in subprocess.Popen preexec_fn, which runs between
+    fork() and exec(), and Python documents it as unsafe in multithreaded
+    processes (child can deadlock on a lock held by another thread during
+    fork()). apply() only makes setrlimit() calls of a module imported
+    in advance, but if that's not good enough for an application, PhantomJS
+    can be started through a wrapper instead, e.g. with phantomjs_path
+    pointing to a script running "prlimit --cpu=10 phantomjs "$@"".
+
+    It can be passed to dom2img() using its limits argument.
+    '''
+
+    def __init__(self, memory=None, cpu_seconds=None, open_files=None,
+                 max_output=None):
+        '''
+        Args:
+            memory: int, maximal size of process' virtual memory
+                (address space) in bytes, or None.
+            cpu_seconds: int, maximal CPU time of process in seconds,
+                or None.
+            open_files: int, maximal number of file descriptors
+                opened by process, or None.
+            max_output: int, maximal size of rendered image in bytes,
+                or None.
+        '''
+        self.memory = memory
+        self.cpu_seconds = cpu_seconds
+        self.open_files = open_files
+        self.max_output = max_output
+
+    def apply(self):
+        '''
+        Set resource limits of the current process.
+
+        It's called by PhantomJS processes before they start (see
+        subprocess.Popen preexec_fn argument).
+        '''
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (self.memory, self.memory))
+        if self.cpu_seconds is not None:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (self.cpu_seconds, self.cpu_seconds + 1))
+        if self.open_files is not None:
+            resource.setrlimit(resource.RLIMIT_NOFILE,
+                               (self.open_files, self.open_files))
+
+    def failure(self, return_code, stderr=None):
+        '''
+        Classify failure of PhantomJS process.
+
+        Args:
+            return_code: int, process' return code.
+            stderr: unicode text with process' stderr output, or None.
+
+        Returns:
+            PhantomJSFailure (or its subclass) instance.
+
+        >>> limits = ResourceLimits(memory=1024, cpu_seconds=10)
+        >>> type(limits.failure(1, u'std::bad_alloc')).__name__
+        'PhantomJSMemoryLimit'
+        >>> type(limits.failure(-11, u'ReferenceError')).__name__
+        'PhantomJSFailure'
+        >>> type(limits.failure(-signal.SIGXCPU)).__name__
+        'PhantomJSCPULimit'
+        >>> type(limits.failure(-signal.SIGKILL)).__name__
+        'PhantomJSFailure'
+        '''
+        if self.cpu_seconds is not None and \
+                return_code == _CPU_LIMIT_RETURN_CODE:
+            return _exceptions.PhantomJSCPULimit(self.cpu_seconds,
+                                                 return_code, stderr)
+        if self.memory is not None and \
+                any(msg in (stderr or u'').lower() for msg in _MEMORY_ERRORS):
+            return _exceptions.PhantomJSMemoryLimit(self.memory,
+                                                    return_code, stderr)
+        return _exceptions.PhantomJSFailure(return_code=return_code,
+                                            stderr=stderr)
+
@@ -0,0 +1,195 @@
+'''
+Locating PhantomJS binary and renderer script.
+
+Both are resolved once per process and cached, so that preparing
+a render doesn't have to scan $PATH and the package resources every time.
+'''
+import os
+import subprocess
+import sys
+import threading
+
+from dom2img import _exceptions, _subprocess
+
+
+# environment variable overriding PhantomJS binary lookup in $PATH
+PHANTOMJS_PATH_ENV = 'DOM2IMG_PHANTOMJS'
+
+_lock = threading.Lock()
+_binaries = {}
+_render_script = []
+
+
+def _decode_path(path):
+    '''
+    Turn filesystem path into an unicode text.
+
+    Args:
+        path: bytes or unicode text with a filesystem path.
+
+    Returns:
+        Unicode text with the path.
+    '''
+    if isinstance(path, bytes):
+        return path.decode(sys.getfilesystemencoding())
+    return path
+
+
+def _is_executable(path):
+    '''
+    Check if path points to an executable file.
+
+    Args:
+        path: unicode text with a filesystem path.
+
+    Returns:
+        bool value indicating if path is an executable file.
+    '''
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _lookup_phantomjs(phantomjs_path):
+    '''
+    Find PhantomJS binary, without using the cache.
+
+    Args:
+        phantomjs_path: unicode text with path to PhantomJS binary, or None.
+
+    Returns:
+        Unicode text with absolute path to PhantomJS binary.
+
+    Raises:
+        PhantomJSNotInPath: PhantomJS binary couldn't be found.
+    '''
+    from distutils import spawn  # slow to import, only needed here
+
+    if phantomjs_path is None:
+        phantomjs_path = os.environ.get(PHANTOMJS_PATH_ENV) or None
+
+    if phantomjs_path is None:
+        binary = spawn.find_executable('phantomjs')
+        if binary is None:
+            raise _exceptions.PhantomJSNotInPath()
+        return _decode_path(binary)
+
+    phantomjs_path = _decode_path(phantomjs_path)
+    if os.path.dirname(phantomjs_path):
+        binary = os.path.abspath(phantomjs_path)
+        if not _is_executable(binary):
+            raise _exceptions.PhantomJSNotInPath(phantomjs_path)
+    else:  # bare binary name, look for it in $PATH
+        binary = spawn.find_executable(phantomjs_path)
+        if binary is None:
+            raise _exceptions.PhantomJSNotInPath(phantomjs_path)
+    return _decode_path(binary)
+
+
+def find_phantomjs(phantomjs_path=None):
+    '''
+    Find PhantomJS binary.
+
+    Binary is looked up using (in this order):
+        * phantomjs_path argument,
+        * $DOM2IMG_PHANTOMJS environment variable,
+        * phantomjs executable in $PATH.
+
+    Results are cached for the lifetime of the process. Cached entry is
+    dropped (and the lookup repeated) if the binary disappears, or if
+    the environment variables used for the lookup change.
+
+    Args:
+        phantomjs_path: bytes or unicode text with path to PhantomJS binary,
+            or a name of the binary that will be looked up in $PATH,
+            or None.
+
+    Returns:
+        Unicode text with absolute path to PhantomJS binary.
+
+    Raises:
+        PhantomJSNotInPath: PhantomJS binary couldn't be found.
+    '''
+    key = (phantomjs_path, os.environ.get(PHANTOMJS_PATH_ENV),
+           os.environ.get('PATH'))
+    binary = _binaries.get(key)
+    if binary is not None and _is_executable(binary):
+        return binary
+
+    binary = _lookup_phantomjs(phantomjs_path)
+    with _lock:
+        _binaries[key] = binary
+    return binary
+
+
+def render_script_path():
+    '''
+    Find PhantomJS renderer script.
+
+    Path is resolved only once per process.
+
+    Returns:
+        Unicode text with absolute path to render_file.phantom.js script.
+    '''
+    if not _render_script:
+        import pkg_resources  # slow to import, only needed here
+        path = os.path.realpath(pkg_resources.resource_filename(
+            __name__, 'render_file.phantom.js'))
+        with _lock:
+            if not _render_script:
+                _render_script.append(_decode_path(path))
+    return _render_script[0]
+
+
+def clear_cache():
+    '''
+    Forget all cached PhantomJS binary and renderer script locations.
+    '''
+    with _lock:
+        _binaries.clear()
+        del _render_script[:]
+
+
+def check_phantomjs(phantomjs_path=None, timeout=10):
+    '''
+    Check if PhantomJS renderer can be used.
+
+    Meant to be called at service startup, so misconfiguration is detected
+    before the first render. Resolved locations are cached and reused
+    by later renders.
+
+    Args:
+        phantomjs_path: bytes or unicode text with path to PhantomJS binary,
+            or a name of the binary that will be looked up in $PATH,
+            or None (see find_phantomjs()).
+        timeout: int with number of seconds after which PhantomJS
+            will be killed.
+
+    Returns:
+        Unicode text with PhantomJS version.
+
+    Raises:
+        PhantomJSNotInPath: PhantomJS binary couldn't be found.
+        PhantomJSFailure: PhantomJS binary or renderer script is broken.
+        PhantomJSTimeout: PhantomJS took more than timeout seconds to finish.
+    '''
+    binary = find_phantomjs(phantomjs_path)
+    if not os.path.isfile(render_script_path()):
+        stderr = u'missing renderer script: ' + render_script_path()
+        raise _exceptions.PhantomJSFailure(return_code=None, stderr=stderr)
+
+    try:
+        proc = subprocess.Popen([binary, '--version'],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    except OSError as e:  # e.g. not an executable for this platform
+        stderr = binary + u': ' + _decode_path(e.strerror or str(e))
+        raise _exceptions.PhantomJSFailure(return_code=None, stderr=stderr)
+    result = _subprocess.communicate_with_timeout(proc, timeout)
+    if result is None:
+        raise _exceptions.PhantomJSTimeout(timeout)
+    stdout, stderr = result
+    if proc.returncode:
+        stderr = stderr.decode('ascii', 'ignore') or None
+        raise _exceptions.PhantomJSFailure(return_code=proc.returncode,
+                                           stderr=stderr)
+    return stdout.decode('ascii', 'ignore').strip()
@@ -0,0 +1,335 @@
+'''
+Pool of long-running PhantomJS renderer processes.
+'''
+import base64
+import json
+import subprocess
+import tempfile
+import threading
+import time
+
+from dom2img import _compat, _cookies, _exceptions, _phantomjs, \
+    _screenshot, _subprocess
+
+
+_CHUNK_SIZE = 64 * 1024
+
+# interval between checks of cancel token while waiting for a worker
+_CANCEL_POLL_INTERVAL = 0.05
+
+
+class _Worker(object):
+    '''
+    PhantomJS process running renderer script in the loop mode.
+    '''
+
+    def __init__(self, phantomjs_path, nice=0):
+        '''
+        Start PhantomJS process.
+
+        Args:
+            phantomjs_path: unicode text with path to PhantomJS binary,
+                or None to look it up in $DOM2IMG_PHANTOMJS and $PATH.
+            nice: int, niceness increment of PhantomJS process.
+
+        Raises:
+            PhantomJSNotInPath: There's no PhantomJS in $PATH.
+        '''
+        self.renders = 0
+        self._killed = False
+        self._stderr = tempfile.TemporaryFile()
+        args = [_phantomjs.find_phantomjs(phantomjs_path),
+                _phantomjs.render_script_path(), u'--loop']
+        self._proc = subprocess.Popen(args,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=self._stderr,
+                                      preexec_fn=_subprocess.preexec_fn(
+                                          nice, new_session=True))
+
+    def alive(self):
+        '''
+        Check if worker can still be used for rendering.
+        '''
+        return not self._killed and self._proc.poll() is None
+
+    def kill(self):
+        '''
+        Kill PhantomJS process together with its children.
+        '''
+        self._killed = True
+        _subprocess.kill_process_group(self._proc)
+
+    def close(self):
+        '''
+        Kill PhantomJS process and release its resources.
+        '''
+        self.kill()
+        self._proc.wait()
+        for f in [self._proc.stdin, self._proc.stdout, self._stderr]:
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+
+    def _read_stderr(self, hook=None):
+        '''
+        Read stderr output of the current job.
+
+        Args:
+            hook: function called with every line of output, or None.
+
+        Returns:
+            bytes with head and tail of (possibly huge) stderr output.
+        '''
+        self._stderr.seek(0)
+        capture = _subprocess.OutputCapture(hook=hook)
+        while True:
+            chunk = self._stderr.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            capture.feed(chunk)
+        capture.close()
+        return capture.getvalue()
+
+    def render(self, job, timeout, cancel=None):
+        '''
+        Render a single job.
+
+        Worker is not usable after this method raises an exception.
+
+        Args:
+            job: dict with renderer loop mode job (see render_file.phantom.js).
+            timeout: int, number of seconds after which PhantomJS
+                will be killed.
+            cancel: CancelToken, that kills PhantomJS process, or None.
+
+        Returns:
+            Screenshot with PNG data of the render.
+
+        Raises:
+            PhantomJSFailure: PhantomJS process failed/crashed.
+            PhantomJSTimeout: PhantomJS took more than timeout seconds
+                to finish.
+            RenderCancelled: cancel token has been cancelled.
+        '''
+        # stderr file offset is shared with PhantomJS process,
+        # so rewinding it drops output of the previous jobs
+        self._stderr.seek(0)
+        self._stderr.truncate()
+
+        line = json.dumps(job).encode('ascii') + b'\n'
+        timer = threading.Timer(float(timeout), self.kill)
+        timer.start()
+        if cancel is not None:
+            cancel.add_callback(self.kill)
+        try:
+            self._proc.stdin.write(line)
+            self._proc.stdin.flush()
+            result = self._proc.stdout.readline()
+        except (IOError, OSError):
+            result = b''
+        finally:
+            timer.cancel()
+            if cancel is not None:
+                cancel.remove_callback(self.kill)
+
+        if result.endswith(b'\n'):
+            self.renders += 1
+            marker_hook = _screenshot.PartialMarkerHook()
+            self._read_stderr(marker_hook)
+            return _screenshot.Screenshot(
+                base64.b64decode(result),
+                marker_hook.partial or job.get('offline', False))
+
+        self._proc.wait()
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if self._killed:
+            raise _exceptions.PhantomJSTimeout(timeout)
+        stderr = self._read_stderr().decode('ascii', 'ignore') or None
+        raise _exceptions.PhantomJSFailure(return_code=self._proc.returncode,
+                                           stderr=stderr)
+
+
+class PhantomJSPool(object):
+    '''
+    Pool of warm PhantomJS processes, reused between renders.
+
+    PhantomJS startup cost is paid once per worker, instead of once
+    per render. Crashed and timed out workers are replaced with fresh
+    processes, just like workers that have reached max_renders renders
+    (to keep memory leaks in check).
+
+    Pool is thread-safe, render() blocks until a worker is available.
+    It can be passed to dom2img() using its pool argument.
+    '''
+
+    def __init__(self, size=2, phantomjs_path=None, max_renders=100,
+                 nice=0):
+        '''
+        Start PhantomJS workers.
+
+        Args:
+            size: int, number of PhantomJS processes.
+            phantomjs_path: bytes or unicode text with path to PhantomJS
+                binary (or its name, that will be looked up in $PATH),
+                or None to look it up in $DOM2IMG_PHANTOMJS and $PATH.
+            max_renders: int, number of renders after which a worker
+                gets replaced with a fresh process.
+            nice: int, niceness increment of PhantomJS processes
+                (e.g. for a pool used only for background renders).
+
+        Raises:
+            ValueError: size is less than 1.
+            PhantomJSNotInPath: There's no PhantomJS in $PATH.
+        '''
+        if size < 1:
+            raise ValueError(u'pool size must be at least 1, not %d' % size)
+        self._phantomjs_path = phantomjs_path
+        self._max_renders = max_renders
+        self._nice = nice
+        self._closed = False
+        self._idle = _compat.queue.LifoQueue()
+        # None is a slot for a worker that will be started when needed
+        for _ in range(size):
+            self._idle.put(None)
+        workers = []
+        try:
+            for _ in range(size):
+                workers.append(self._acquire())
+        except:
+            for worker in workers:
+                worker.close()
+            raise
+        for worker in workers:
+            self._release(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _acquire(self, timeout=None, cancel=None):
+        '''
+        Take a running worker from the pool, waiting for one if necessary.
+
+        Args:
+            timeout: float, maximal number of seconds to wait for a worker,
+                or None to wait as long as it takes.
+            cancel: CancelToken, that stops waiting, or None.
+
+        Raises:
+            DeadlineExceeded: No worker became available in time.
+            PhantomJSNotInPath: There's no PhantomJS in $PATH.
+            RenderCancelled: cancel token has been cancelled.
+        '''
+        if cancel is None:
+            try:
+                worker = self._idle.get(timeout=timeout)
+            except _compat.queue.Empty:
+                raise _exceptions.DeadlineExceeded()
+        else:
+            worker = self._wait_for_worker(timeout, cancel)
+        if worker is not None and worker.alive():
+            return worker
+        if worker is not None:
+            worker.close()
+        try:
+            return _Worker(self._phantomjs_path, self._nice)
+        except:
+            self._idle.put(None)
+            raise
+
+    def _wait_for_worker(self, timeout, cancel):
+        '''
+        Take a worker slot from the idle queue, checking cancel token
+        every _CANCEL_POLL_INTERVAL seconds (queue can't be woken up).
+        '''
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            cancel.raise_if_cancelled()
+            interval = _CANCEL_POLL_INTERVAL
+            if end is not None:
+                interval = min(interval, end - time.time())
+                if interval <= 0:
+                    raise _exceptions.DeadlineExceeded()
+            try:
+                return self._idle.get(timeout=interval)
+            except _compat.queue.Empty:
+                pass
+
+    def _release(self, worker):
+        '''
+        Give the worker back to the pool, replacing it if it's unusable.
+        '''
+        if self._closed or not worker.alive() or \
+                worker.renders >= self._max_renders:
+            worker.close()
+            self._idle.put(None)
+        else:
+            self._idle.put(worker)
+
+    def render(self, content, width, height, top, left, prefix,
+               cookie_string, timeout, full_page=False, wait_timeout=None,
+               cancel=None, load_timeout=None, offline=False,
+               settle_timeout=None):
+        '''
+        Renders HTML content using one of the pool's PhantomJS processes.
+
+        Args:
+            wait_timeout: float, maximal number of seconds to wait for
+                a free worker, or None to wait as long as it takes.
+            cancel: CancelToken, that stops waiting for a worker or kills
+                the worker rendering the job, or None.
+            Other arguments are the same as for dom2img._dom2img._render().
+
+        Returns:
+            Screenshot with PNG data of the render.
+
+        Raises:
+            PhantomJSFailure: PhantomJS process failed/crashed.
+            PhantomJSTimeout: PhantomJS took more than timeout seconds
+                to finish.
+            PhantomJSNotInPath: There's no PhantomJS in $PATH.
+            DeadlineExceeded: No worker became available in wait_timeout
+                seconds.
+            RenderCancelled: cancel token has been cancelled.
+        '''
+        if self._closed:
+            raise ValueError(u'render on closed PhantomJS pool')
+        job = {'width': width,
+               'height': height,
+               'top': top,
+               'left': left,
+               'cookie_domain':
+                   _cookies.get_cookie_domain(prefix).decode('ascii'),
+               'cookie_string': cookie_string.decode('ascii'),
+               'content': content.decode('utf-8'),
+               'full_page': full_page,
+               'load_timeout': None if load_timeout is None
+               else int(load_timeout * 1000),
+               'settle': int((settle_timeout or 0) * 1000),
+               'offline': offline}
+        worker = self._acquire(wait_timeout, cancel)
+        try:
+            return worker.render(job, timeout, cancel)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        '''
+        Stop all PhantomJS processes.
+
+        Workers that are rendering at the moment will be stopped
+        as soon as they finish.
+        '''
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except _compat.queue.Empty:
+                break
+            if worker is not None:
+                worker.close()
@@ -0,0 +1,95 @@
+'''
+Retries of failed PhantomJS renders.
+'''
+from dom2img import _exceptions
+
+
+# failures caused by exceeded resource limits, which would happen again
+_LIMIT_FAILURES = (_exceptions.PhantomJSMemoryLimit,
+                   _exceptions.PhantomJSCPULimit,
+                   _exceptions.PhantomJSOutputLimit)
+
+
+class RetryPolicy(object):
+    '''
+    Policy of retrying renders, that failed because of PhantomJS failures.
+
+    PhantomJS occasionally crashes on specific fonts or images, so by
+    default only renders of processes killed by a signal (e.g. SIGSEGV)
+    are retried. Failures with an exit status and timeouts usually happen
+    again for the same page, and retrying them just multiplies the load,
+    but they can be retried too. Renders that have exceeded their resource
+    limits (see ResourceLimits) are never retried.
+
+    Every attempt uses a fresh PhantomJS process (crashed pool workers
+    are replaced), after exponential backoff: backoff seconds before
+    the second attempt, backoff * multiplier before the third one, etc.
+
+    It can be passed to dom2img() using its retry argument.
+    '''
+
+    def __init__(self, max_attempts=3, backoff=0.1, multiplier=2,
+                 retry_signals=True, retry_exit_codes=False,
+                 retry_timeouts=False):
+        '''
+        Args:
+            max_attempts: int, maximal number of attempts (including
+                the first one).
+            backoff: float, number of seconds to wait before the second
+                attempt.
+            multiplier: float, factor of every following wait.
+            retry_signals: bool, if True renders of PhantomJS processes
+                killed by a signal are retried.
+            retry_exit_codes: bool, if True renders of PhantomJS processes
+                that exited with non-zero status are retried.
+            retry_timeouts: bool, if True timed out renders are retried.
+        '''
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.retry_signals = retry_signals
+        self.retry_exit_codes = retry_exit_codes
+        self.retry_timeouts = retry_timeouts
+
+    def retryable(self, exc):
+        '''
+        Check if a render failure is transient.
+
+        Args:
+            exc: Dom2ImgError raised by the render.
+
+        Returns:
+            bool, True if a render with this failure should be retried.
+
+        >>> policy = RetryPolicy()
+        >>> policy.retryable(_exceptions.PhantomJSFailure(return_code=-11))
+        True
+        >>> policy.retryable(_exceptions.PhantomJSFailure(return_code=1))
+        False
+        >>> policy.retryable(_exceptions.PhantomJSTimeout(30))
+        False
+        '''
+        if isinstance(exc, _exceptions.PhantomJSTimeout):
+            return self.retry_timeouts
+        if isinstance(exc, _LIMIT_FAILURES) or \
+                not isinstance(exc, _exceptions.PhantomJSFailure):
+            return False
+        if exc.return_code is not None and exc.return_code < 0:
+            return self.retry_signals
+        return self.retry_exit_codes
+
+    def delay(self, exc, attempt):
+        '''
+        Decide whether to retry a failed attempt.
+
+        Args:
+            exc: Dom2ImgError raised by the attempt.
+            attempt: int, number of the failed attempt, starting at 1.
+
+        Returns:
+            float number of seconds to wait before the next attempt,
+            or None if the failure shouldn't be retried.
+        '''
+        if attempt >= self.max_attempts or not self.retryable(exc):
+            return None
+        return self.backoff * self.multiplier ** (attempt - 1)
@@ -0,0 +1,180 @@
+'''
+Scheduling of renders that share PhantomJS capacity.
+'''
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+from dom2img import _compat, _exceptions
+
+
+# priority classes, from the most important one
+INTERACTIVE = u'interactive'
+BACKGROUND = u'background'
+
+
+class RenderScheduler(object):
+    '''
+    Thread-safe scheduler, that limits the number of concurrent renders.
+
+    Renders waiting for a slot are ordered by their priority class
+    (renders of a more important class always go first) and within
+    a class by their deadline (earliest deadline first, renders without
+    a deadline go last, in order of arrival).
+
+    Render times of every class are tracked, and renders that can't
+    finish before their deadline (because it's closer than the average
+    render time of their class) are rejected with DeadlineExceeded
+    right away, instead of taking a slot.
+
+    Renders of some classes can be run by PhantomJS processes with lowered
+    OS priority (see nice), so that background renders don't compete
+    with interactive ones for CPU time either.
+
+    It can be passed to dom2img() using its scheduler argument.
+    '''
+
+    def __init__(self, slots=2, classes=(INTERACTIVE, BACKGROUND),
+                 nice=None):
+        '''
+        Args:
+            slots: int, maximal number of concurrent renders.
+            classes: iterable of unicode texts with names of priority
+                classes, from the most important one.
+            nice: dict mapping class names to int niceness increments
+                of PhantomJS processes started for renders of that class,
+                defaults to 10 for background class.
+        '''
+        self.slots = slots
+        self.classes = tuple(classes)
+        if nice is None:
+            nice = {BACKGROUND: 10}
+        self.nice = dict(nice)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = []
+        self._counter = itertools.count()
+        # exponential moving average of render time of every class
+        self._estimates = {}
+
+    def _rank(self, priority):
+        try:
+            return self.classes.index(priority)
+        except ValueError:
+            raise ValueError(u'unknown priority class: ' +
+                             _compat.text(priority))
+
+    def niceness(self, priority):
+        '''
+        Get niceness increment for PhantomJS processes of a priority class.
+        '''
+        return self.nice.get(priority, 0)
+
+    def estimate(self, priority):
+        '''
+        Get average render time of a priority class.
+
+        Returns:
+            float number of seconds, or None if no render
+            of that class has finished yet.
+        '''
+        with self._cond:
+            return self._estimates.get(priority)
+
+    def _check_deadline(self, priority, deadline):
+        if deadline is None:
+            return
+        remaining = deadline - time.time()
+        if remaining <= 0 or remaining < self._estimates.get(priority, 0):
+            raise _exceptions.DeadlineExceeded(deadline)
+
+    def acquire(self, priority=INTERACTIVE, deadline=None, cancel=None):
+        '''
+        Wait for a render slot.
+
+        Args:
+            priority: unicode text with name of priority class.
+            deadline: float, time.time() value by which the render has
+                to finish, or None.
+            cancel: CancelToken, that stops waiting, or None.
+
+        Returns:
+            float, time.time() value when the slot was acquired,
+            that has to be passed to release().
+
+        Raises:
+            ValueError: priority class is unknown.
+            DeadlineExceeded: render can't finish before deadline.
+            RenderCancelled: cancel token has been cancelled.
+        '''
+        entry = (self._rank(priority),
+                 float('inf') if deadline is None else deadline,
+                 next(self._counter))
+
+        def wake_up():
+            with self._cond:
+                self._cond.notify_all()
+
+        if cancel is not None:
+            cancel.add_callback(wake_up)
+        try:
+            with self._cond:
+                self._check_deadline(priority, deadline)
+                heapq.heappush(self._waiting, entry)
+                try:
+                    while self._running >= self.slots or \
+                            self._waiting[0] != entry:
+                        if cancel is not None:
+                            cancel.raise_if_cancelled()
+                        timeout = None
+                        if deadline is not None:
+                            timeout = max(deadline - time.time(), 0)
+                        self._cond.wait(timeout)
+                        self._check_deadline(priority, deadline)
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                except:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise
+                heapq.heappop(self._waiting)
+                self._running += 1
+                # next waiter might be able to take another free slot
+                self._cond.notify_all()
+        finally:
+            if cancel is not None:
+                cancel.remove_callback(wake_up)
+        return time.time()
+
+    def release(self, priority, start):
+        '''
+        Give back a render slot.
+
+        Args:
+            priority: unicode text with name of priority class,
+                the same as for acquire().
+            start: float returned by acquire().
+        '''
+        seconds = time.time() - start
+        with self._cond:
+            self._running -= 1
+            average = self._estimates.get(priority)
+            if average is None:
+                self._estimates[priority] = seconds
+            else:
+                self._estimates[priority] = 0.8 * average + 0.2 * seconds
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority=INTERACTIVE, deadline=None, cancel=None):
+        '''
+        Context manager, that holds a render slot (see acquire()).
+        '''
+        start = self.acquire(priority, deadline, cancel)
+        try:
+            yield
+        finally:
+            self.release(priority, start)
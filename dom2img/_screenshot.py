@@ -0,0 +1,46 @@
+'''
+Screenshots returned by dom2img().
+'''
+
+
+# stderr line written by render_file.phantom.js, when it renders a page
+# that hasn't finished loading before its load timeout
+PARTIAL_MARKER = u'dom2img: partial render'
+
+
+class Screenshot(bytes):
+    '''
+    Bytes with PNG image data of a screenshot, with details of the render.
+
+    Attributes:
+        partial: bool, True if the page hasn't finished loading before
+            its load timeout, so only what had been loaded was rendered.
+        attempts: int, number of render attempts (see RetryPolicy).
+    '''
+
+    def __new__(cls, data=b'', partial=False, attempts=1):
+        self = bytes.__new__(cls, data)
+        self.partial = partial
+        self.attempts = attempts
+        return self
+
+
+class PartialMarkerHook(object):
+    '''
+    PhantomJS stderr hook (see OutputCapture), that detects partial
+    render marker and forwards other lines to another hook.
+    '''
+
+    def __init__(self, hook=None):
+        '''
+        Args:
+            hook: function called with other stderr lines, or None.
+        '''
+        self.hook = hook
+        self.partial = False
+
+    def __call__(self, line):
+        if line == PARTIAL_MARKER:
+            self.partial = True
+        elif self.hook is not None:
+            self.hook(line)
@@ -2,10 +2,106 @@ from __future__ import print_function
 
 import argparse
 import os
+import signal
+import socket
 import sys
 
 import dom2img
-from dom2img import _cookies, _dom2img, _arg_utils, _exceptions
+from dom2img import _compat, _cookies, _dom2img, _arg_utils, _exceptions
+
+
+def _exit_bad_address(e):
+    '''
+    Report address that server can't listen on, exit like on argument error.
+    '''
+    os.write(sys.stderr.fileno(), _compat.text(e).encode('utf-8') + b'\n')
+    sys.exit(1)
+
+
+def _run_server(args):
+    '''
+    Run render server with warm PhantomJS processes until interrupted.
+    '''
+    from dom2img import _daemon, _pool
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+    pool = _pool.PhantomJSPool(size=args['workers'],
+                               phantomjs_path=args['phantomjs_path'])
+    try:
+        _daemon.serve(args['serve'], pool, args['allow_remote'])
+    except KeyboardInterrupt:
+        pass
+    except ValueError as e:
+        _exit_bad_address(e)
+    finally:
+        pool.close()
+
+
+def _run_http(args):
+    '''
+    Run HTTP screenshot service for dom2img.js until interrupted.
+    '''
+    from dom2img import _service
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+    service = _service.ScreenshotService(
+        args['prefix'], workers=args['workers'], deadline=args['timeout'],
+        phantomjs_path=args['phantomjs_path'])
+    try:
+        server = _service.make_server(args['http'], service,
+                                      args['allow_remote'])
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+    except KeyboardInterrupt:
+        pass
+    except ValueError as e:
+        _exit_bad_address(e)
+    finally:
+        service.close()
+
+
+def _run_client(args):
+    '''
+    Send render request to server, exit the same way as a local render would.
+    '''
+    from dom2img import _daemon
+
+    options = dict((key, args[key]) for key in _daemon.OPTIONS)
+    options['cookies'] = \
+        _cookies.serialize_cookies(options['cookies']).decode('ascii')
+    content = _arg_utils.utf8_byte_string(args['content'])
+    try:
+        status, output = _daemon.request(args['client'], options, content)
+    except (socket.error, EOFError) as e:
+        err_msg = u"Couldn't talk to dom2img server: " + _compat.text(e)
+        os.write(sys.stderr.fileno(), err_msg.encode('utf-8') + b'\n')
+        sys.exit(_daemon.STATUS_FAILURE)
+    if status == _daemon.STATUS_OK:
+        os.write(sys.stdout.fileno(), output)
+    else:
+        os.write(sys.stderr.fileno(), output + b'\n')
+        sys.exit(status)
+
+
+def _run_batch(args):
+    '''
+    Render JSON Lines jobs from stdin, write status records to stdout.
+    '''
+    from dom2img import _batch
+
+    failures = _batch.run(sys.stdin, sys.stdout, jobs=args['jobs'],
+                          phantomjs_path=args['phantomjs_path'],
+                          nice=args['nice'])
+    if failures:
+        sys.exit(2)
 
 
 def main():
@@ -20,21 +116,32 @@ Return status can be:
 1: if arguments are in improper format
 2: if PhantomJS process failed
 3: if PhantomJS process timed out
+
+With --serve, it runs a render server with warm PhantomJS processes
+instead, listening on a Unix socket or on a local TCP port. Calling
+the script with --client, using the same address, makes the server
+do the rendering (with the same arguments, input, output and return status).
+
+With --http, it runs a HTTP service for dom2img.js uploads instead,
+that responds with PNG images (using --prefix, --timeout as the
+deadline of every request, and --workers warm PhantomJS processes).
+
+With --batch, stdin is read as JSON Lines job descriptions, rendered
+in parallel (see --jobs) and a JSON Lines status record is written
+to stdout for every job. Return status is 0 if all jobs succeeded,
+2 otherwise.
 '''
     formatter = argparse.RawDescriptionHelpFormatter
     parser = argparse.ArgumentParser(description=prolog,
                                      formatter_class=formatter)
 
     parser.add_argument('--width', type=_arg_utils.non_negative_int,
-                        required=True,
                         help='non-negative int with the width ' +
                         'of virtual render viewport (using pixels unit)')
     parser.add_argument('--height', type=_arg_utils.non_negative_int,
-                        required=True,
                         help='non-negative int with the height ' +
                         'of virtual render viewport (using pixels unit)')
     parser.add_argument('--prefix', type=_arg_utils.absolute_url,
-                        required=True,
                         help='absolute URL that will be used to handle ' +
                         'relative URLs in html (for images, css scripts) ' +
                         'and optionally for cookies')
@@ -57,25 +164,106 @@ Return status can be:
                         default='30',
                         help='non-negative int with number of seconds after ' +
                         'which PhantomJS will be killed')
+    parser.add_argument('--load-timeout',
+                        type=_arg_utils.optional_non_negative_int,
+                        default=None,
+                        help='non-negative int with number of seconds after ' +
+                        'which the page is rendered, even if it has not ' +
+                        'finished loading')
+    parser.add_argument('--render-timeout',
+                        type=_arg_utils.optional_non_negative_int,
+                        default=None,
+                        help='non-negative int with number of seconds ' +
+                        'reserved for rendering the page after load timeout ' +
+                        '(defaults to 1 if --load-timeout is used)')
+    parser.add_argument('--settle-timeout',
+                        type=_arg_utils.optional_non_negative_int,
+                        default=None,
+                        help='non-negative int with number of seconds ' +
+                        'to wait after the page has loaded, before ' +
+                        'rendering it')
     parser.add_argument('--cookies', type=_cookies.parse_cookie_string,
                         default='',
                         help='semicolon-separated string containing ' +
                         'cookie elems using key=val format')
+    parser.add_argument('--phantomjs-path', type=_arg_utils.optional_path,
+                        default=None,
+                        help='path to PhantomJS binary (defaults to ' +
+                        '$DOM2IMG_PHANTOMJS or phantomjs found in $PATH)')
     parser.add_argument('--debug', action='store_true',
                         help='print a shell command, that runs PhantomJS ' +
                         'renderer in a debug mode')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--serve', metavar='ADDRESS',
+                      help='run render server on ADDRESS, which is either ' +
+                      'a path to Unix socket, or [HOST]:PORT ' +
+                      '(HOST defaults to 127.0.0.1)')
+    mode.add_argument('--client', metavar='ADDRESS',
+                      help='send render request to a server started ' +
+                      'with --serve ADDRESS')
+    mode.add_argument('--http', metavar='ADDRESS',
+                      help='run HTTP screenshot service on ADDRESS, ' +
+                      'which is [HOST]:PORT (HOST defaults to 127.0.0.1)')
+    parser.add_argument('--allow-remote', action='store_true',
+                        help='let --serve and --http listen on ' +
+                        'non-loopback addresses (servers are not ' +
+                        'authenticated, and their renders can fetch any ' +
+                        'URL reachable from this host)')
+    mode.add_argument('--batch', action='store_true',
+                      help='render JSON Lines jobs from stdin')
+    parser.add_argument('--jobs', type=_arg_utils.positive_int,
+                        default='1',
+                        help='positive int with number of jobs ' +
+                        'rendered in parallel by --batch')
+    parser.add_argument('--nice', type=_arg_utils.non_negative_int,
+                        default='0',
+                        help='non-negative int with niceness increment ' +
+                        'of PhantomJS processes used by --batch, so that ' +
+                        'it does not slow down interactive renders')
+    parser.add_argument('--workers', type=_arg_utils.positive_int,
+                        default='2',
+                        help='positive int with number of warm ' +
+                        'PhantomJS processes used by --serve and --http')
     parser.add_argument('-v', '-V', '--version', action='version',
                         version='%(prog)s ' + dom2img.__version__)
 
     try:
         args = vars(parser.parse_args())
+        if args['serve'] is None and not args['batch']:
+            required = ['width', 'height', 'prefix']
+            if args['http'] is not None:
+                required = ['prefix']
+            missing = [u'--' + arg for arg in required if args[arg] is None]
+            if missing:
+                parser.error(u'the following arguments are required: ' +
+                             u', '.join(missing))
     except SystemExit as e:
         code = 1 if e.code != 0 else 0  # only change failure status
         sys.exit(code)
+
+    if args['serve'] is not None:
+        _run_server(args)
+        return
+    if args['http'] is not None:
+        _run_http(args)
+        return
+    if args['batch']:
+        _run_batch(args)
+        return
+
     args['content'] = sys.stdin.read()
+    for arg in ['serve', 'http', 'workers', 'batch', 'jobs', 'nice',
+                'allow_remote']:
+        del args[arg]
+    if args['client'] is not None and not args['debug']:
+        _run_client(args)
+        return
+    del args['client']
 
     try:
         if args.pop('debug'):
+            for arg in ['load_timeout', 'render_timeout', 'settle_timeout']:
+                del args[arg]
             result = _dom2img.dom2img_debug(**args)
             output = result.encode(sys.stdout.encoding or 'utf-8') + b'\n'
         else:
@@ -0,0 +1,349 @@
+'''
+Limit of concurrent renders shared by all processes on a host.
+'''
+import contextlib
+import errno
+import os
+import tempfile
+import threading
+import time
+
+from dom2img import _exceptions
+
+
+# bounds of the interval between checks of busy slots, in seconds
+_MIN_POLL_INTERVAL = 0.01
+_MAX_POLL_INTERVAL = 0.1
+
+# age in seconds after which unlocked wait files are considered stale
+_STALE_WAIT_FILE_AGE = 60
+
+
+def _process_exists(pid):
+    '''
+    Check if a process with pid exists.
+
+    >>> _process_exists(os.getpid())
+    True
+    '''
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class HostSemaphore(object):
+    '''
+    Semaphore limiting the number of concurrent renders of all processes
+    on a host (e.g. gunicorn workers), that use the same lock directory.
+
+    It's built on flock() file locks: every slot is a lock file,
+    so slots held by crashed processes are released by the kernel.
+    Waiting renders take tickets from a counter file and are admitted
+    in ticket order (first come, first served), so renders of one
+    process can't starve those of another: only the waiting render
+    with the lowest ticket takes a free slot. Every waiting render holds
+    the lock of its wait file, so renders that have given up (or crashed)
+    drop out of line.
+
+    It's only available on POSIX systems. It can be passed to dom2img()
+    using its semaphore argument.
+    '''
+
+    def __init__(self, slots=4, directory=None, name=u'dom2img',
+                 timeout=None):
+        '''
+        Args:
+            slots: int, maximal number of concurrent renders on the host.
+            directory: unicode text with path of directory for lock files,
+                defaults to dom2img-locks in the temporary directory.
+                It's created if it doesn't exist.
+            name: unicode text with prefix of lock file names, processes
+                share the semaphore if they use the same directory
+                and name (and they should use the same number of slots).
+            timeout: float, default maximal number of seconds to wait
+                for a slot, or None to wait as long as it takes.
+
+        Raises:
+            ImportError: platform doesn't support flock().
+        '''
+        import fcntl  # POSIX only
+
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'dom2img-locks')
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._fcntl = fcntl
+        self.slots = slots
+        self.directory = directory
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, self.name + u'.' + suffix)
+
+    def _open(self, suffix):
+        return os.open(self._path(suffix), os.O_RDWR | os.O_CREAT, 0o666)
+
+    def _try_lock(self, fd):
+        '''
+        Take exclusive lock of a file without waiting.
+
+        Returns:
+            bool, True if the lock was taken.
+        '''
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno not in [errno.EAGAIN, errno.EACCES]:
+                raise
+            return False
+        return True
+
+    def _poll(self, try_fn, deadline, cancel=None):
+        '''
+        Call try_fn until it succeeds, with growing intervals between
+        the calls.
+
+        Args:
+            try_fn: function returning a result, or None if it failed.
+            deadline: float, time.time() value, or None.
+            cancel: CancelToken or None.
+
+        Returns:
+            result of try_fn, or None if deadline has passed or cancel
+            token has been cancelled first.
+        '''
+        interval = _MIN_POLL_INTERVAL
+        while True:
+            result = try_fn()
+            if result is not None:
+                return result
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                interval = min(interval, remaining)
+            if cancel is not None:
+                if cancel.wait(interval):
+                    return None
+            else:
+                time.sleep(interval)
+            interval = min(2 * interval, _MAX_POLL_INTERVAL)
+
+    def _try_slots(self):
+        '''
+        Take a free slot without waiting.
+
+        Returns:
+            int, file descriptor of locked slot file, or None
+            if all slots are busy.
+        '''
+        for i in range(self.slots):
+            fd = self._open(u'slot.%d' % i)
+            if self._try_lock(fd):
+                # owner's pid is used by stats()
+                os.ftruncate(fd, 0)
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                return fd
+            os.close(fd)
+        return None
+
+    def _take_ticket(self):
+        '''
+        Take the next ticket and line up with a locked wait file.
+
+        Wait file is locked before the counter file lock is released,
+        so waiters see wait files of all waiters with lower tickets.
+
+        Returns:
+            (ticket, suffix, fd) tuple with int ticket, unicode text
+            with suffix of the wait file and its file descriptor.
+        '''
+        counter = self._open(u'ticket')
+        try:
+            self._fcntl.flock(counter, self._fcntl.LOCK_EX)
+            data = os.read(counter, 32).strip()
+            ticket = int(data) if data.isdigit() else 0
+            os.ftruncate(counter, 0)
+            os.lseek(counter, 0, os.SEEK_SET)
+            os.write(counter, str(ticket + 1).encode('ascii'))
+            suffix = u'wait.%d.%d.%d' % (ticket, os.getpid(),
+                                         threading.current_thread().ident)
+            waiting = self._open(suffix)
+            self._try_lock(waiting)
+        finally:
+            os.close(counter)
+        return ticket, suffix, waiting
+
+    def _first_in_line(self, ticket):
+        '''
+        Check if there's no live waiter with a lower ticket.
+        '''
+        prefix_length = len(self.name) + len(u'.wait.')
+        for path in self._filenames(u'wait.'):
+            other = os.path.basename(path)[prefix_length:].split(u'.')[0]
+            if not other.isdigit() or int(other) >= ticket:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                if not self._try_lock(fd):
+                    return False
+            finally:
+                os.close(fd)
+        return True
+
+    def acquire(self, timeout=None, deadline=None, cancel=None):
+        '''
+        Wait for a render slot.
+
+        Args:
+            timeout: float, maximal number of seconds to wait, or None
+                to use the default timeout.
+            deadline: float, time.time() value by which rendering has
+                to finish, or None.
+            cancel: CancelToken, that stops waiting, or None.
+
+        Returns:
+            Slot token, that has to be passed to release().
+
+        Raises:
+            RenderQueueTimeout: No slot became available in timeout seconds.
+            DeadlineExceeded: No slot became available before deadline.
+            RenderCancelled: cancel token has been cancelled.
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        start = time.time()
+        limit = deadline
+        if timeout is not None and (limit is None or start + timeout < limit):
+            limit = start + timeout
+
+        # locked wait file of every waiting render, for admission order
+        # and queue depth metrics
+        ticket, waiting_suffix, waiting = self._take_ticket()
+        try:
+            slot = self._poll(lambda: self._try_slots()
+                              if self._first_in_line(ticket) else None,
+                              limit, cancel)
+        finally:
+            try:
+                os.remove(self._path(waiting_suffix))
+            except OSError:
+                pass
+            os.close(waiting)
+
+        with self._lock:
+            self._wait_seconds += time.time() - start
+            if slot is None:
+                self._timeouts += 1
+            else:
+                self._acquired += 1
+        if slot is not None:
+            return slot
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if limit == deadline:
+            raise _exceptions.DeadlineExceeded(deadline)
+        raise _exceptions.RenderQueueTimeout(timeout)
+
+    def release(self, slot):
+        '''
+        Give back a render slot.
+
+        Args:
+            slot: token returned by acquire().
+        '''
+        try:
+            os.ftruncate(slot, 0)
+        finally:
+            os.close(slot)
+
+    @contextlib.contextmanager
+    def slot(self, timeout=None, deadline=None, cancel=None):
+        '''
+        Context manager, that holds a render slot (see acquire()).
+        '''
+        slot = self.acquire(timeout, deadline, cancel)
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+    def _filenames(self, prefix):
+        prefix = self.name + u'.' + prefix
+        return [os.path.join(self.directory, filename)
+                for filename in os.listdir(self.directory)
+                if filename.startswith(prefix)]
+
+    def _count_waiting(self):
+        '''
+        Count wait files, that are locked (by their waiting renders),
+        and remove stale ones.
+        '''
+        count = 0
+        for path in self._filenames(u'wait.'):
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                if not self._try_lock(fd):
+                    count += 1
+                elif time.time() - os.fstat(fd).st_mtime > \
+                        _STALE_WAIT_FILE_AGE:
+                    os.remove(path)
+            finally:
+                os.close(fd)
+        return count
+
+    def _count_running(self):
+        '''
+        Count slot files with pids of live owners.
+
+        Slot files aren't locked for that, which would make renders
+        waiting for slots fail to take them.
+        '''
+        count = 0
+        for path in self._filenames(u'slot.'):
+            try:
+                with open(path, 'rb') as f:
+                    pid = f.read()
+            except (IOError, OSError):
+                continue
+            if pid.isdigit() and _process_exists(int(pid)):
+                count += 1
+        return count
+
+    def stats(self):
+        '''
+        Get queue metrics.
+
+        Returns:
+            dict with keys:
+                * slots: number of slots,
+                * running: number of renders holding a slot on the host,
+                * waiting: number of renders waiting for a slot on the host,
+                * acquired: number of slots acquired by this process,
+                * timeouts: number of waits that timed out in this process,
+                * wait_seconds: total time this process spent waiting.
+        '''
+        with self._lock:
+            result = {'slots': self.slots,
+                      'acquired': self._acquired,
+                      'timeouts': self._timeouts,
+                      'wait_seconds': self._wait_seconds}
+        result['running'] = self._count_running()
+        result['waiting'] = self._count_waiting()
+        return result
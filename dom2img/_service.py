@@ -0,0 +1,535 @@
+'''
+WSGI screenshot service for static/dom2img.js uploads.
+
+Accepts POST requests in all dom2img.js upload modes (url-encoded form,
+raw and compressed text/html body, delta uploads if a DocumentStore
+is used) and responds with PNG images.
+'''
+import hashlib
+import math
+import threading
+import time
+
+from dom2img import _compat, _exceptions, _pool, _upload
+
+
+_STATUS_LINES = {200: '200 OK',
+                 304: '304 Not Modified',
+                 400: '400 Bad Request',
+                 404: '404 Not Found',
+                 405: '405 Method Not Allowed',
+                 411: '411 Length Required',
+                 413: '413 Request Entity Too Large',
+                 415: '415 Unsupported Media Type',
+                 429: '429 Too Many Requests',
+                 500: '500 Internal Server Error',
+                 503: '503 Service Unavailable',
+                 504: '504 Gateway Timeout'}
+
+
+class _BodyTooBig(ValueError):
+    '''
+    Request body (of unknown length) is bigger than allowed.
+    '''
+
+
+def _read_errors(fun):
+    '''
+    Decorator of read methods, that raises errors of the underlying
+    stream (e.g. client's connection reset) as ValueError, because they
+    mean the request is invalid.
+    '''
+    def wrapper(*args, **kwargs):
+        try:
+            return fun(*args, **kwargs)
+        except (IOError, OSError) as e:  # socket.error too
+            raise ValueError(u"request body couldn't be read: " +
+                             _compat.text(e))
+    return wrapper
+
+
+class _LimitedReader(object):
+    '''
+    File object wrapper, that doesn't read past request's Content-Length,
+    or, if it's unknown (None), reads until the end of the stream,
+    but not more than max_size bytes.
+    '''
+
+    def __init__(self, stream, length, max_size=None):
+        self._stream = stream
+        self._remaining = length
+        self._max_size = max_size
+        self._size = 0
+
+    @_read_errors
+    def read(self, size=-1):
+        if self._remaining is None:
+            data = self._stream.read(size)
+            self._size += len(data)
+            if self._max_size is not None and self._size > self._max_size:
+                raise _BodyTooBig(u'request body is too big')
+            return data
+        if self._remaining <= 0:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        if not data:
+            self._remaining = 0
+        return data
+
+
+class _ChunkedReader(object):
+    '''
+    File object decoding chunked request body (Transfer-Encoding: chunked),
+    for WSGI servers that pass it as it is (e.g. wsgiref).
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._remaining = 0
+        self._done = False
+
+    def _line(self):
+        line = self._stream.readline(1024)
+        if not line.endswith(b'\n'):
+            raise ValueError(u'invalid chunked request body')
+        return line.strip()
+
+    @_read_errors
+    def read(self, size=-1):
+        if self._remaining == 0 and not self._done:
+            try:
+                self._remaining = int(self._line().split(b';')[0], 16)
+            except ValueError:
+                raise ValueError(u'invalid chunked request body')
+            if self._remaining == 0:
+                while self._line():  # trailer headers
+                    pass
+                self._done = True
+        if self._done:
+            return b''
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        if not data:
+            raise ValueError(u'truncated chunked request body')
+        self._remaining -= len(data)
+        if self._remaining == 0 and self._line():
+            raise ValueError(u'invalid chunked request body')
+        return data
+
+
+def image_etag(image):
+    '''
+    Compute strong ETag of an image.
+
+    Args:
+        image: bytes with image data.
+
+    Returns:
+        str with quoted ETag header value.
+    '''
+    return '"' + hashlib.sha1(image).hexdigest() + '"'
+
+
+def _etag_matches(etag, if_none_match):
+    '''
+    Test if ETag matches If-None-Match header value (weak comparison).
+
+    >>> _etag_matches('"a"', 'W/"b", "a"')
+    True
+    >>> _etag_matches('"a"', '"b"')
+    False
+    '''
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag in ['*', etag]:
+            return True
+    return False
+
+
+def image_response(image, if_none_match=None, content_type='image/png'):
+    '''
+    Build binary HTTP response with an image.
+
+    Response has Content-Type, Content-Length and strong ETag headers,
+    so that clients can make conditional requests and get 304 responses
+    without a body if the image hasn't changed (ETag is computed from
+    the image, so it only saves sending the image, not rendering it),
+    e.g. in Flask:
+        status, headers, body = image_response(
+            screenshot, request.headers.get('If-None-Match'))
+        return body, status, headers
+
+    Args:
+        image: bytes with image data.
+        if_none_match: str with If-None-Match request header value, or None.
+        content_type: str with image mimetype.
+
+    Returns:
+        (status, headers, body) tuple with int status (200 or 304),
+        list of (name, value) header tuples and bytes with response body.
+    '''
+    etag = image_etag(image)
+    headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+    if if_none_match and _etag_matches(etag, if_none_match):
+        return 304, headers, b''
+    headers += [('Content-Type', content_type),
+                ('Content-Length', str(len(image)))]
+    return 200, headers, image
+
+
+def _printable_ascii(text):
+    '''
+    Check if text contains only printable ascii characters (no spaces).
+    '''
+    return all('!' <= c <= '~' for c in text)
+
+
+def _request_cookies(environ):
+    '''
+    Parse request cookies.
+
+    Cookies that can't be passed to PhantomJS (with non-ascii or control
+    characters) are skipped, instead of failing the request.
+
+    Returns:
+        dict mapping unicode text cookie keys to cookie values.
+
+    >>> _request_cookies({'HTTP_COOKIE': 'a=1; b=\\xe9; c=x=y'}) == \\
+    ...     {u'a': u'1', u'c': u'x=y'}
+    True
+    '''
+    cookies = {}
+    for elem in environ.get('HTTP_COOKIE', '').split(';'):
+        key, sep, val = elem.partition('=')
+        key, val = key.strip(), val.strip()
+        if not sep or not _printable_ascii(key + val.replace(' ', '')):
+            continue
+        cookies[_compat.text(key)] = _compat.text(val)
+    return cookies
+
+
+def _first_values(query):
+    '''
+    Parse query string into a dict with the first value of every key.
+    '''
+    return dict((key, vals[0]) for key, vals in
+                _compat.parse_qs(query, keep_blank_values=True).items())
+
+
+class ScreenshotService(object):
+    '''
+    WSGI application rendering screenshots uploaded by dom2img.js.
+
+    Requests are rendered by a pool of warm PhantomJS processes.
+    At most workers + queue_size requests are handled at the same time,
+    additional requests are rejected right away with 429 status
+    and Retry-After header, based on recent render times. Every request
+    has to be rendered in deadline seconds since it arrived (including
+    time spent waiting for a worker), otherwise it fails with 504 status.
+
+    Request bodies are read incrementally (and decompressed, see
+    dom2img_upload()), bodies without Content-Length (e.g. dom2img.js
+    stream uploads) are accepted if they're chunked, or if the WSGI
+    server marks the end of wsgi.input (wsgi.input_terminated).
+
+    Responses are PNG images (with ETag, so that clients can make
+    conditional requests and get 304 responses, see image_response(),
+    pages are rendered for conditional requests too,
+    and with X-Dom2Img-Partial: 1 header if the page hasn't finished
+    loading in time, see best_effort), or text/plain error messages
+    with 400 (invalid request), 404 (unknown delta base document),
+    411 (body of unknown length), 413 (body too big), 415 (multipart
+    form, which isn't supported), 500 (PhantomJS failure), 503 (no host-wide
+    render slot, see HostSemaphore, or open circuit, see CircuitBreaker)
+    or 504 (deadline exceeded) status.
+    '''
+
+    def __init__(self, prefix, workers=2, queue_size=None, deadline=30,
+                 max_content_size=_upload.MAX_CONTENT_SIZE, store=None,
+                 session_cookie=u'session', forward_cookies=True,
+                 trust_precleaned=False, phantomjs_path=None, pool=None,
+                 scheduler=None, semaphore=None, best_effort=False,
+                 retry=None, breaker=None):
+        '''
+        Args:
+            prefix: Ascii-only unicode text containing absolute URL,
+                the same as for dom2img().
+            workers: int, number of PhantomJS processes.
+            queue_size: int, number of requests that can wait for a worker,
+                defaults to twice the number of workers.
+            deadline: int, number of seconds in which every request
+                has to be rendered.
+            max_content_size: int, maximal size of uploaded (decompressed)
+                HTML in bytes.
+            store: DocumentStore, that enables delta uploads, or None.
+            session_cookie: unicode text with name of the cookie, that
+                identifies sessions for delta uploads.
+            forward_cookies: bool, if True request cookies are sent with
+                resource requests during rendering, or collection
+                of unicode text names of the only cookies that are sent.
+            trust_precleaned: bool, the same as for dom2img_upload().
+            phantomjs_path: the same as for PhantomJSPool.
+            pool: PhantomJSPool to use instead of starting a new one
+                (it won't be closed by close()).
+            scheduler: RenderScheduler shared with other (e.g. background)
+                renders, requests are rendered with interactive priority.
+            semaphore: HostSemaphore shared with other processes,
+                requests that time out waiting for it get 503 status.
+            best_effort: bool, if True slow pages are rendered with
+                whatever has been loaded before the deadline (see dom2img()),
+                instead of failing with 504 status.
+            retry: RetryPolicy for PhantomJS failures, or None.
+            breaker: CircuitBreaker, requests for origins with open
+                circuits get 503 status (unless it's in offline mode).
+        '''
+        if queue_size is None:
+            queue_size = 2 * workers
+        self.prefix = prefix
+        self.deadline = deadline
+        self.max_content_size = max_content_size
+        self.store = store
+        self.session_cookie = session_cookie
+        self.forward_cookies = forward_cookies
+        self.trust_precleaned = trust_precleaned
+        self._own_pool = pool is None
+        if pool is None:
+            pool = _pool.PhantomJSPool(size=workers,
+                                       phantomjs_path=phantomjs_path)
+        self._pool = pool
+        self._scheduler = scheduler
+        self._semaphore = semaphore
+        self.best_effort = best_effort
+        self.retry = retry
+        self.breaker = breaker
+        self._workers = max(workers, 1)
+        self._capacity = self._workers + queue_size
+        self._slots = threading.Semaphore(self._capacity)
+        self._lock = threading.Lock()
+        # exponential moving average of request handling time
+        self._average_seconds = 1.0
+
+    def close(self):
+        '''
+        Stop PhantomJS processes started by the service.
+        '''
+        if self._own_pool:
+            self._pool.close()
+
+    def retry_after(self):
+        '''
+        Estimate number of seconds after which a rejected request
+        should be retried.
+        '''
+        with self._lock:
+            average = self._average_seconds
+        return max(1, int(math.ceil(average * self._capacity /
+                                    self._workers)))
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return self._respond(start_response, 405, u'POST only',
+                                 [('Allow', 'POST')])
+        content_type = environ.get('CONTENT_TYPE', '')
+        if content_type.lower().startswith('multipart/'):
+            return self._respond(start_response, 415,
+                                 u'multipart uploads are not supported')
+        body = self._body(environ)
+        if body is None:
+            return self._respond(start_response, 411,
+                                 u'Content-Length is required')
+        if body is False:
+            return self._respond(start_response, 413,
+                                 u'request body is too big')
+
+        if not self._slots.acquire(False):
+            return self._respond(start_response, 429,
+                                 u'too many screenshot requests',
+                                 [('Retry-After', str(self.retry_after()))])
+        start = time.time()
+        try:
+            status, headers, body = \
+                self._handle(environ, body, start + self.deadline)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._average_seconds = 0.8 * self._average_seconds + \
+                    0.2 * (time.time() - start)
+        if status != 304 and not any(name == 'Content-Length'
+                                     for name, _ in headers):
+            headers = headers + [('Content-Length', str(len(body)))]
+        start_response(_STATUS_LINES[status], headers)
+        return [body]
+
+    def _body(self, environ):
+        '''
+        Wrap request body in a reader, that doesn't read past its end.
+
+        Returns:
+            file object, None if length of the body is unknown,
+            or False if it's too big.
+        '''
+        stream = environ['wsgi.input']
+        length = environ.get('CONTENT_LENGTH') or ''
+        if length.isdigit():
+            if int(length) > self.max_content_size:
+                return False
+            return _LimitedReader(stream, int(length))
+        if environ.get('wsgi.input_terminated'):  # already de-chunked
+            return _LimitedReader(stream, None, self.max_content_size)
+        if environ.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked':
+            return _LimitedReader(_ChunkedReader(stream), None,
+                                  self.max_content_size)
+        return None
+
+    def _respond(self, start_response, status, message, headers=[]):
+        body = message.encode('utf-8')
+        headers = headers + [('Content-Type', 'text/plain; charset=utf-8'),
+                             ('Content-Length', str(len(body)))]
+        start_response(_STATUS_LINES[status], headers)
+        return [body]
+
+    def _handle(self, environ, body, deadline):
+        '''
+        Render a screenshot request.
+
+        Returns:
+            (status, headers, body) tuple.
+        '''
+        headers = []
+        try:
+            image, document_id = self._render(environ, body, deadline)
+            if document_id is not None:
+                headers.append(('X-Dom2Img-Document', str(document_id)))
+            if getattr(image, 'partial', False):
+                headers.append(('X-Dom2Img-Partial', '1'))
+            status, image_headers, body = image_response(
+                image, environ.get('HTTP_IF_NONE_MATCH'))
+            return status, headers + image_headers, body
+        except _BodyTooBig as e:
+            status = 413
+            message = _compat.text(e)
+        except (TypeError, ValueError) as e:
+            status = 400
+            message = _compat.text(e)
+        except _exceptions.DocumentNotFound as e:
+            status = 404
+            message = _compat.text(e)
+        except _exceptions.RenderQueueTimeout as e:
+            status = 503
+            message = _compat.text(e)
+            headers.append(('Retry-After', str(self.retry_after())))
+        except _exceptions.CircuitOpen as e:
+            status = 503
+            message = _compat.text(e)
+            headers.append(('Retry-After', str(e.retry_after)))
+        except (_exceptions.PhantomJSTimeout,
+                _exceptions.DeadlineExceeded) as e:
+            status = 504
+            message = _compat.text(e)
+        except _exceptions.Dom2ImgError as e:
+            status = 500
+            message = _compat.text(e)
+        except (IOError, OSError) as e:  # e.g. PhantomJS couldn't be run
+            status = 500
+            message = _compat.text(e)
+        headers.append(('Content-Type', 'text/plain; charset=utf-8'))
+        return status, headers, message.encode('utf-8')
+
+    def _render(self, environ, body, deadline):
+        '''
+        Read request and render it.
+
+        Args:
+            environ: WSGI environment of the request.
+            body: file object with request body (see _body()).
+            deadline: float, time.time() value by which the request
+                has to be rendered.
+
+        Returns:
+            (image, document id) tuple with bytes containing PNG image
+            and unicode text with id of the uploaded document (or None,
+            if it isn't a delta upload).
+        '''
+        params = _first_values(environ.get('QUERY_STRING', ''))
+        content_encoding = environ.get('HTTP_CONTENT_ENCODING')
+        content_type = environ.get('CONTENT_TYPE', '')
+        content_type = content_type.split(';')[0].strip().lower()
+        cookies = _request_cookies(environ)
+        kwargs = {'pool': self._pool,
+                  'deadline': deadline,
+                  'timeout': int(math.ceil(self.deadline)),
+                  'trust_precleaned': self.trust_precleaned,
+                  'max_content_size': self.max_content_size,
+                  'best_effort': self.best_effort,
+                  'retry': self.retry,
+                  'breaker': self.breaker}
+        if self._scheduler is not None:
+            kwargs['scheduler'] = self._scheduler
+            kwargs['priority'] = u'interactive'
+        if self._semaphore is not None:
+            kwargs['semaphore'] = self._semaphore
+        if self.forward_cookies is True:
+            kwargs['cookies'] = cookies
+        elif self.forward_cookies:
+            kwargs['cookies'] = dict(
+                (key, val) for key, val in cookies.items()
+                if key in self.forward_cookies)
+
+        if content_type == 'application/x-www-form-urlencoded':
+            form = _upload.read_content(body, content_encoding,
+                                        self.max_content_size)
+            params.update(_first_values(form.decode('utf-8')))
+            if 'content' not in params:
+                raise ValueError(u'missing upload parameter: content')
+            body = params.pop('content').encode('utf-8')
+            content_encoding = None
+
+        if self.store is not None:
+            session = cookies.get(self.session_cookie, u'')
+            document_id, image = _upload.dom2img_upload_document(
+                body, params, self.prefix, self.store, session,
+                content_encoding, **kwargs)
+            return image, document_id
+        if params.get('base'):
+            raise ValueError(u'delta uploads are not enabled')
+        return _upload.dom2img_upload(body, params, self.prefix,
+                                      content_encoding, **kwargs), None
+
+
+def make_server(address, service, allow_remote=False):
+    '''
+    Create a threaded HTTP server for a WSGI application.
+
+    Args:
+        address: unicode text with [HOST]:PORT (HOST defaults to 127.0.0.1).
+        service: WSGI application (e.g. ScreenshotService).
+        allow_remote: bool, if True server can listen on non-loopback
+            addresses (see dom2img._daemon.check_bind_host()).
+
+    Returns:
+        wsgiref server, not serving yet.
+
+    Raises:
+        ValueError: address is invalid, or it isn't a loopback address
+            and allow_remote is False.
+    '''
+    from dom2img import _daemon
+
+    from wsgiref import simple_server
+
+    class Server(_compat.socketserver.ThreadingMixIn,
+                 simple_server.WSGIServer):
+        daemon_threads = True
+
+    host, sep, port = address.rpartition(u':')
+    if not sep or not port.isdigit():
+        raise ValueError(u'HTTP address must be [HOST]:PORT')
+    _daemon.check_bind_host(host or u'127.0.0.1', allow_remote)
+    return simple_server.make_server(host or u'127.0.0.1', int(port),
+                                     service, server_class=Server)
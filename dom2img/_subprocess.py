@@ -1,7 +1,227 @@
+import os
+import signal
 import threading
 
+from dom2img import _exceptions
 
-def communicate_with_timeout(proc, timeout, input_=None):
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def preexec_fn(nice=0, limits=None, new_session=False):
+    '''
+    Build Popen preexec_fn, that lowers priority of the process,
+    sets its resource limits and starts a new session for it.
+
+    Args:
+        nice: int, niceness increment (ignored if the platform
+            doesn't support it).
+        limits: ResourceLimits or None.
+        new_session: bool, if True the process becomes a leader of a new
+            session and process group, so that it can be killed with
+            its children (see kill_process_group()).
+
+    Returns:
+        function, or None if there's nothing to do.
+
+    Function runs in a forked child before exec(), so it must not take
+    locks or import modules (see ResourceLimits about multithreaded
+    processes).
+    '''
+    if not hasattr(os, 'nice'):
+        nice = 0
+    if not hasattr(os, 'setsid'):
+        new_session = False
+    if not nice and limits is None and not new_session:
+        return None
+
+    def fn():
+        if new_session:
+            os.setsid()
+        if nice:
+            os.nice(nice)
+        if limits is not None:
+            limits.apply()
+
+    return fn
+
+
+def kill_process_group(proc):
+    '''
+    Kill process started with a new session, and its children.
+
+    Falls back to killing just the process, if the platform doesn't
+    support process groups.
+    '''
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+class OutputCapture(object):
+    '''
+    Bounded capture of a process output stream.
+
+    Only the first and the last limit / 2 bytes of the output are kept,
+    bytes in between are just counted, so memory use doesn't depend
+    on how much the process writes. Complete lines can be forwarded
+    to a hook (e.g. a logger) as they arrive.
+    '''
+
+    def __init__(self, limit=64 * 1024, hook=None):
+        '''
+        Args:
+            limit: int, maximal number of kept bytes, or None to keep
+                all of the output.
+            hook: function called with every line of output (unicode text
+                without the newline), or None. Lines longer than limit
+                are split.
+        '''
+        self.limit = limit
+        self.hook = hook
+        self.size = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._line = bytearray()
+
+    def feed(self, data):
+        '''
+        Add a chunk of output.
+        '''
+        self.size += len(data)
+        if self.hook is not None:
+            self._forward(data)
+        if self.limit is None:
+            self._head += data
+            return
+        half = self.limit // 2
+        room = half - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data and half > 0:
+            self._tail += data
+            del self._tail[:-half]
+
+    def _forward(self, data):
+        self._line += data
+        lines = self._line.split(b'\n')
+        self._line = lines.pop()
+        if self.limit is not None:
+            lines.append(self._line)
+            lines = [line[i:i + self.limit]
+                     for line in lines
+                     for i in range(0, max(len(line), 1), self.limit)]
+            self._line = lines.pop()
+        for line in lines:
+            self.hook(bytes(line).decode('utf-8', 'replace'))
+
+    def close(self):
+        '''
+        Forward the last line, that didn't end with a newline.
+        '''
+        if self.hook is not None and self._line:
+            self.hook(bytes(self._line).decode('utf-8', 'replace'))
+        self._line = bytearray()
+
+    def getvalue(self):
+        '''
+        Get captured output.
+
+        Returns:
+            bytes with the output, or its head and tail separated
+            with a line saying how many bytes have been omitted.
+
+        >>> capture = OutputCapture(limit=4)
+        >>> capture.feed(b'abc')
+        >>> capture.feed(b'defgh')
+        >>> capture.getvalue() == b'ab\\n[... 4 bytes omitted ...]\\ngh'
+        True
+        '''
+        omitted = self.size - len(self._head) - len(self._tail)
+        if not omitted:
+            return bytes(self._head + self._tail)
+        marker = u'\n[... %d bytes omitted ...]\n' % omitted
+        return bytes(self._head + marker.encode('ascii') + self._tail)
+
+
+def _communicate(proc, input_, max_output=None, stderr_capture=None):
+    '''
+    Interact with process, reading its output as it streams in.
+
+    Args:
+        proc: Popen object.
+        input_: bytes object with stdin to pipe into proc, or None.
+        max_output: int, maximal size of stdout in bytes, or None.
+            If stdout gets bigger, process is killed right away.
+        stderr_capture: OutputCapture for stderr, or None to keep
+            all of it.
+
+    Returns:
+        (stdout, stderr) tuple of bytes.
+
+    Raises:
+        PhantomJSOutputLimit: stdout was bigger than max_output bytes.
+    '''
+    if stderr_capture is None:
+        stderr_capture = OutputCapture(limit=None)
+
+    def feed():
+        try:
+            if input_:
+                proc.stdin.write(input_)
+        except (IOError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def drain():
+        while True:
+            chunk = os.read(proc.stderr.fileno(), _CHUNK_SIZE)
+            if not chunk:
+                break
+            stderr_capture.feed(chunk)
+        stderr_capture.close()
+
+    threads = [threading.Thread(target=feed), threading.Thread(target=drain)]
+    for thread in threads:
+        thread.start()
+    parts = []
+    size = 0
+    exceeded = False
+    while True:
+        chunk = os.read(proc.stdout.fileno(), _CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_output is not None and size > max_output:
+            exceeded = True
+            try:
+                proc.kill()
+            except OSError:
+                pass
+            break
+        parts.append(chunk)
+    # children that are still writing get SIGPIPE instead of blocking
+    proc.stdout.close()
+    proc.wait()
+    for thread in threads:
+        thread.join()
+    proc.stderr.close()
+    if exceeded:
+        raise _exceptions.PhantomJSOutputLimit(max_output)
+    return b''.join(parts), stderr_capture.getvalue()
+
+
+def communicate_with_timeout(proc, timeout, input_=None, max_output=None,
+                             stderr_capture=None):
     '''
     Interact with process with timeout.
 
@@ -14,9 +234,16 @@ def communicate_with_timeout(proc, timeout, input_=None):
         proc: Popen object.
         timeout: int with number of seconds to wait for proc to finish.
         input_: bytes object with stdin to pipe into proc, or None.
+        max_output: int, maximal size of stdout in bytes, or None.
+            If stdout gets bigger, process is killed right away.
+        stderr_capture: OutputCapture, that keeps bounded stderr output
+            (returned instead of the whole stderr), or None.
 
     Returns:
         None if timeout seconds have passed, or result of proc.communicate().
+
+    Raises:
+        PhantomJSOutputLimit: stdout was bigger than max_output bytes.
     '''
     waker = threading.Event()
     proc_killed = [False]
@@ -32,9 +259,14 @@ def communicate_with_timeout(proc, timeout, input_=None):
 
     t = threading.Thread(target=killer)
     t.start()
-    result = proc.communicate(input=input_)
-    waker.set()
-    t.join()
+    try:
+        if max_output is None and stderr_capture is None:
+            result = proc.communicate(input=input_)
+        else:
+            result = _communicate(proc, input_, max_output, stderr_capture)
+    finally:
+        waker.set()
+        t.join()
     if proc_killed[0]:
         return None
     else:
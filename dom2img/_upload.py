@@ -0,0 +1,230 @@
+'''
+Server-side helpers for screenshots uploaded by static/dom2img.js.
+'''
+import json
+import zlib
+
+from dom2img import _arg_utils, _documents, _dom2img
+
+
+# viewport parameters sent by dom2img.js in the query string
+PARAMS = frozenset(['width', 'height', 'top', 'left', 'scale'])
+
+# default limit of (decompressed) uploaded HTML size in bytes
+MAX_CONTENT_SIZE = 64 * 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _decompressor(content_encoding):
+    '''
+    Create decompressor for a HTTP Content-Encoding.
+
+    Args:
+        content_encoding: unicode text or bytes with Content-Encoding
+            header value, or None.
+
+    Returns:
+        zlib decompression object, or None for identity encoding.
+
+    Raises:
+        ValueError: content encoding isn't supported.
+    '''
+    if isinstance(content_encoding, bytes):
+        content_encoding = content_encoding.decode('ascii', 'replace')
+    encoding = (content_encoding or u'identity').strip().lower()
+    if encoding == u'identity':
+        return None
+    elif encoding in [u'gzip', u'x-gzip']:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == u'deflate':
+        return zlib.decompressobj()
+    else:
+        raise ValueError(u'unsupported content encoding: ' + encoding)
+
+
+def _chunks(body):
+    '''
+    Iterate over chunks of request body (bytes or a file object).
+    '''
+    if isinstance(body, bytes):
+        yield body
+        return
+    while True:
+        chunk = body.read(_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_content(body, content_encoding=None, max_size=MAX_CONTENT_SIZE):
+    '''
+    Read (and decompress) uploaded HTML.
+
+    File objects are read and decompressed chunk by chunk, so only
+    a single chunk of compressed data is kept in memory, alongside
+    the decompressed HTML.
+
+    Args:
+        body: bytes or a file object (e.g. wsgi.input) with request body.
+        content_encoding: unicode text or bytes with Content-Encoding
+            header value (identity, gzip or deflate), or None.
+        max_size: int, maximal size of decompressed HTML in bytes.
+
+    Returns:
+        bytes with HTML.
+
+    Raises:
+        ValueError: content encoding isn't supported, compressed data
+            is invalid, or decompressed HTML is bigger than max_size.
+    '''
+    decompressor = _decompressor(content_encoding)
+    parts = []
+    size = 0
+    try:
+        for chunk in _chunks(body):
+            if decompressor is not None:
+                # decompress at most one byte more than allowed,
+                # to detect too big content without expanding all of it
+                chunk = decompressor.decompress(chunk, max_size - size + 1)
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(u'content is bigger than %d bytes'
+                                 % max_size)
+            parts.append(chunk)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            if size + len(chunk) > max_size:
+                raise ValueError(u'content is bigger than %d bytes'
+                                 % max_size)
+            parts.append(chunk)
+            if not getattr(decompressor, 'eof', True):
+                raise ValueError(u'truncated compressed content')
+    except zlib.error:
+        raise ValueError(u'invalid compressed content')
+    return b''.join(parts)
+
+
+def dom2img_upload(body, params, prefix, content_encoding=None,
+                   max_content_size=MAX_CONTENT_SIZE,
+                   trust_precleaned=False, **kwargs):
+    '''
+    Render a screenshot uploaded by dom2img.js in the raw upload mode.
+
+    In this mode, HTML is sent as the raw (text/html) request body,
+    optionally compressed, and viewport parameters are sent in the query
+    string, e.g. in Flask:
+        dom2img_upload(request.stream, request.args, prefix,
+                       request.headers.get('Content-Encoding'))
+    Body is passed to dom2img() without form decoding or re-encoding
+    (see read_content()).
+
+    Args:
+        body: bytes or a file object with request body, containing
+            Utf-8 encoded HTML.
+        params: dict (or any mapping) with query string parameters.
+            Only width, height, top, left, scale and precleaned keys
+            are used, other parameters are ignored.
+        prefix: Ascii-only bytes or unicode text containing absolute URL,
+            the same as for dom2img().
+        content_encoding: unicode text or bytes with Content-Encoding
+            header value (identity, gzip or deflate), or None.
+        max_content_size: int, maximal size of decompressed HTML in bytes.
+        trust_precleaned: bool, if True and dom2img.js has sent
+            precleaned=1 parameter (see its preclean option), HTML is
+            rendered without server-side clean up (see dom2img()
+            precleaned argument).
+        **kwargs: other dom2img() arguments (e.g. cookies, timeout, pool).
+
+    Returns:
+        bytes containing PNG image data with the render.
+
+    Raises:
+        TypeError: arguments are not the right type.
+        ValueError: arguments have invalid values, width/height
+            are missing, or body couldn't be read (see read_content()).
+        PhantomJSFailure: PhantomJS process failed/crashed.
+        PhantomJSTimeout: PhantomJS took too long to finish.
+        PhantomJSNotInPath: There's no PhantomJS in $PATH.
+    '''
+    _add_params(kwargs, params, trust_precleaned)
+    content = read_content(body, content_encoding, max_content_size)
+    return _dom2img.dom2img(content=content, prefix=prefix, **kwargs)
+
+
+def dom2img_upload_document(body, params, prefix, store, session,
+                            content_encoding=None,
+                            max_content_size=MAX_CONTENT_SIZE,
+                            trust_precleaned=False, **kwargs):
+    '''
+    Render a screenshot uploaded by dom2img.js in the delta upload mode.
+
+    In this mode, the first upload of a page is a raw upload (see
+    dom2img_upload()), that is stored in a DocumentStore. Following
+    uploads send id of the stored document as base parameter, and
+    a JSON body with changed subtrees ({"changes": [...]}, see
+    apply_changes()), that are applied to the stored document.
+    Id of the uploaded document has to be sent back to dom2img.js
+    in X-Dom2Img-Document response header.
+
+    Args:
+        store: DocumentStore for uploaded documents.
+        session: hashable session identifier (e.g. unicode text with
+            session id of the user), documents can only be used within
+            sessions that uploaded them.
+        Other arguments are the same as for dom2img_upload().
+
+    Returns:
+        (document id, image) tuple with unicode text id of the uploaded
+        document and bytes containing PNG image data with the render.
+
+    Raises:
+        DocumentNotFound: base document isn't stored (anymore), client
+            should upload the whole document.
+        Other exceptions are the same as for dom2img_upload(),
+        ValueError is raised for invalid changes too.
+    '''
+    _add_params(kwargs, params, trust_precleaned)
+    content = read_content(body, content_encoding, max_content_size)
+    base = params.get('base')
+    if base:
+        try:
+            delta = json.loads(content.decode('utf-8'))
+        except ValueError:
+            raise ValueError(u'delta is not a valid JSON')
+        if not isinstance(delta, dict):
+            raise ValueError(u'delta must be a JSON object')
+        doc = _documents.changed_document(store.get(session, base),
+                                          delta.get('changes'))
+        document_id = store.put(session, doc.encode('utf-8'))
+        # the changed document is cleaned up without parsing it again
+        content = _dom2img._clean_up_document(
+            doc, _arg_utils.absolute_url(prefix, u'prefix'),
+            kwargs.pop('volatile', None), kwargs.pop('base_href', False))
+        kwargs['precleaned'] = True
+    else:
+        document_id = store.put(session, content)
+    return document_id, _dom2img.dom2img(content=content, prefix=prefix,
+                                         **kwargs)
+
+
+def _add_params(kwargs, params, trust_precleaned):
+    '''
+    Add dom2img() arguments from upload parameters.
+
+    Args:
+        kwargs: dict with dom2img() arguments, that will be updated.
+        params: the same as for dom2img_upload().
+        trust_precleaned: the same as for dom2img_upload().
+
+    Raises:
+        ValueError: width or height is missing.
+    '''
+    for key in ['width', 'height']:
+        if key not in params:
+            raise ValueError(u'missing upload parameter: ' + key)
+    for key in PARAMS:
+        if key in params:
+            kwargs[key] = params[key]
+    if trust_precleaned and params.get('precleaned') == u'1':
+        kwargs['precleaned'] = True
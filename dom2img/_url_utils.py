@@ -52,3 +52,40 @@ def absolutize_urls(doc, tag_name, attr, prefix):
         if tag.has_attr(attr) and not is_absolute_url(tag[attr]):
             tag[attr] = _compat.urljoin(prefix, tag[attr])
     return doc
+
+
+def set_base_href(doc, prefix):
+    '''
+    Make a HTML document resolve relative URLs against prefix.
+
+    Replaces all base tags in a document with a single base tag at the
+    beginning of its head (that is created if necessary), instead of
+    rewriting URLs of every tag (like absolutize_urls() does).
+    Target attribute of the first base tag is kept.
+
+    Input document is modified and also returned.
+
+    Args:
+        doc: BeautifulSoup document.
+        prefix: Ascii-only unicode URL that will be used as a base URL.
+    Returns:
+        BeautifulSoup document that was passed as doc argument, but with
+        prefix as its base URL.
+
+    >>> import bs4
+    >>> set_base_href(bs4.BeautifulSoup('<head><base href="/x"></head>',\
+                                        'html.parser'),\
+                      u'http://127.0.0.1:8000/something')
+    <head><base href="http://127.0.0.1:8000/something"/></head>
+    '''
+    base = doc.new_tag('base', href=prefix)
+    for old_base in doc.findAll('base'):
+        if old_base.has_attr(u'target') and not base.has_attr(u'target'):
+            base[u'target'] = old_base[u'target']
+        old_base.decompose()
+    head = doc.head
+    if head is None:
+        head = doc.new_tag('head')
+        (doc.html or doc).insert(0, head)
+    head.insert(0, base)
+    return doc
@@ -0,0 +1,79 @@
+'''
+Normalization of volatile HTML content (CSRF tokens, nonces, request ids).
+'''
+import re
+
+
+class VolatileContent(object):
+    '''
+    Description of HTML content that changes between otherwise identical
+    documents, but doesn't change the way they look.
+
+    Values of matching attributes are replaced with empty strings
+    (attributes are kept, so CSS attribute selectors still match),
+    so that repeated dumps of the same page produce the same HTML
+    and hit the same RenderCache entries.
+    '''
+
+    def __init__(self, attributes=(u'nonce',), patterns=(u'data-csrf.*',),
+                 hidden_inputs=True):
+        '''
+        Args:
+            attributes: iterable of unicode texts with names of volatile
+                attributes, compared case-insensitively.
+            patterns: iterable of unicode texts with regular expressions,
+                that have to match whole names of volatile attributes.
+            hidden_inputs: bool, if True values of hidden input tags
+                are volatile too.
+        '''
+        self.attributes = frozenset(name.lower() for name in attributes)
+        self.patterns = [re.compile(u'(?:' + pattern + u')\\Z', re.IGNORECASE)
+                         for pattern in patterns]
+        self.hidden_inputs = hidden_inputs
+
+    def is_volatile(self, attr):
+        '''
+        Test if an attribute is volatile.
+
+        Args:
+            attr: unicode text with attribute name.
+
+        Returns:
+            bool, True if attr is one of attributes, or matches one
+            of patterns.
+
+        >>> VolatileContent().is_volatile(u'data-csrf-token')
+        True
+        >>> VolatileContent().is_volatile(u'class')
+        False
+        '''
+        return attr.lower() in self.attributes or \
+            any(pattern.match(attr) for pattern in self.patterns)
+
+    def normalize(self, doc):
+        '''
+        Canonicalize volatile content of a HTML document.
+
+        Input document is modified and also returned.
+
+        Args:
+            doc: BeautifulSoup document.
+
+        Returns:
+            BeautifulSoup document that was passed as doc argument,
+            with volatile attribute values replaced with empty strings.
+
+        >>> import bs4
+        >>> VolatileContent().normalize(bs4.BeautifulSoup(
+        ...     '<input type="hidden" name="t" value="123">', 'html.parser'))
+        <input name="t" type="hidden" value=""/>
+        '''
+        for tag in doc.findAll(True):
+            for attr in tag.attrs:
+                if self.is_volatile(attr):
+                    tag[attr] = u''
+            if self.hidden_inputs and tag.name == u'input' and \
+                    tag.get(u'type', u'').lower() == u'hidden' and \
+                    tag.has_attr(u'value'):
+                tag[u'value'] = u''
+        return doc
@@ -16,24 +16,49 @@
 //   * COOKIE_DOMAIN: cookie domain for cookies values from cookie_string
 //   * COOKIE_STRING: semicolon separated cookie values using key=val format
 // optional flag --debug (as a last parameter) enables interactive debug mode
+// optional flag --full-page renders the whole page, instead of the viewport
+// at TOP and LEFT scroll offsets
+// optional flag --load-timeout=MS renders the page after MS milliseconds,
+// with whatever has been loaded so far, if it hasn't finished loading yet
+// (such partial renders are marked with PARTIAL_MARKER line on stderr)
+// optional flag --offline aborts all network requests of the page
+// (e.g. for images and stylesheets), only data: URLs are loaded
+// optional flag --settle=MS renders the page MS milliseconds after it has
+// finished loading (e.g. for web fonts), or at load timeout, if it's sooner
 //
 // example usage:
 // phantomjs render_file.phantom.js 1920 1080 1000 0 127.0.0.1 key1=val1;key2=val2
+//
+// usage: phantomjs render_file.phantom.js --loop
+// loop mode keeps PhantomJS running and renders many documents, one by one.
+// Every job is a single line of standard input with JSON object with keys:
+// width, height, top, left, cookie_domain, cookie_string, content,
+// full_page, load_timeout, settle and offline (meaning the same as
+// parameters, flags and standard input above, load_timeout can be null).
+// For every job a single line with base64 encoded png screenshot is written
+// to standard output. Empty standard input line (or EOF) finishes the loop.
 
 var system = require('system');
-var page = require('webpage').create();
+var webpage = require('webpage');
+
+var PARTIAL_MARKER = 'dom2img: partial render';
 
-var width = system.args[1];
-var height = system.args[2];
-var top = system.args[3];
-var left = system.args[4];
-var cookie_domain = system.args[5];
-var cookie_string = system.args[6];
-var debug = system.args[5] === '--debug' || system.args[7] === '--debug';
+var flags = {};
+var args = [];
+for (var i = 1; i < system.args.length; i++) {
+  if (system.args[i].indexOf('--') === 0) {
+    var flag = system.args[i].substring(2).split('=');
+    flags[flag.shift()] = flag.length ? flag.join('=') : true;
+  } else {
+    args.push(system.args[i]);
+  }
+}
 
-var cookies = null;
-if (cookie_string !== undefined && cookie_string !== '') {
-  cookies = {};
+var parse_cookies = function(cookie_string) {
+  if (cookie_string === undefined || cookie_string === '') {
+    return null;
+  }
+  var cookies = {};
   var cookie_elems = cookie_string.split(';');
   for (var i = 0; i < cookie_elems.length; i++) {
     var cookie = cookie_elems[i].split('=');
@@ -41,54 +66,151 @@ if (cookie_string !== undefined && cookie_string !== '') {
     var cookie_value = cookie.join('=');
     cookies[cookie_key] = cookie_value;
   }
-}
-for (var key in cookies) {
-  var value = cookies[key];
-  phantom.addCookie({name: key,
-                     value: value,
-                     domain: cookie_domain});
-}
+  return cookies;
+};
+
+var add_cookies = function(cookies, cookie_domain) {
+  for (var key in cookies) {
+    var value = cookies[key];
+    phantom.addCookie({name: key,
+                       value: value,
+                       domain: cookie_domain});
+  }
+};
 
-var content = system.stdin.read();
-page.viewportSize = {width: width, height: height};
-page.clipRect = {top: top, left: left, width: width, height: height};
+var create_page = function(width, height, top, left, full_page, offline) {
+  var page = webpage.create();
+  page.viewportSize = {width: width, height: height};
+  if (!full_page) {
+    page.clipRect = {top: top, left: left, width: width, height: height};
+  }
+  if (offline) {
+    page.onResourceRequested = function(request_data, network_request) {
+      if (request_data.url.indexOf('data:') !== 0) {
+        network_request.abort();
+      }
+    };
+  }
+  return page;
+};
 
-if (debug) {
-  var start = new Date();
-  debugger;
-  var stop = new Date();
-  if (stop - start < 1000) {
-    // execution didn't stop at debugger stmt - first (auto) run
-    console.log('\n\n\n');
-    console.log('dom2img PhantomJS debug mode enabled.\n');
-    console.log('Viewport size: ' + width + 'x' + height);
-    console.log('Scroll offsets (left:top): ' + left + ':' + top);
-    if (cookies !== null) {
-      console.log('Cookie domain: ' + cookie_domain);
-      console.log('Cookies:');
-      for (var cookie_key in cookies) {
-        if (!cookies.hasOwnProperty(cookie_key)) {
-          break;
+// calls callback once, settle milliseconds after the page has finished
+// loading, or after load_timeout milliseconds (unless it's null/undefined),
+// so that whatever has been loaded so far can be rendered as a partial
+// render (pages that have loaded, but haven't settled, aren't partial)
+var on_loaded = function(page, load_timeout, settle, callback) {
+  var done = false;
+  var loaded = false;
+  var timer = null;
+  var finish = function(partial) {
+    if (done) {
+      return;
+    }
+    done = true;
+    if (timer !== null) {
+      clearTimeout(timer);
+    }
+    if (partial) {
+      system.stderr.writeLine(PARTIAL_MARKER);
+      system.stderr.flush();
+    }
+    callback();
+  };
+  page.onLoadFinished = function() {
+    loaded = true;
+    if (settle) {
+      setTimeout(function() {
+        finish(false);
+      }, Number(settle));
+    } else {
+      finish(false);
+    }
+  };
+  if (load_timeout !== null && load_timeout !== undefined) {
+    timer = setTimeout(function() {
+      finish(!loaded);
+    }, Number(load_timeout));
+  }
+};
+
+var run_loop = function() {
+  var line = system.stdin.readLine();
+  if (!line) {
+    phantom.exit();
+    return;
+  }
+  var job = JSON.parse(line);
+  phantom.clearCookies();
+  add_cookies(parse_cookies(job.cookie_string), job.cookie_domain);
+
+  var page = create_page(job.width, job.height, job.top, job.left,
+                         job.full_page, job.offline);
+  on_loaded(page, job.load_timeout, job.settle, function() {
+    system.stdout.writeLine(page.renderBase64('PNG'));
+    system.stdout.flush();
+    // don't close the page from inside of its own callback
+    setTimeout(function() {
+      page.close();
+      run_loop();
+    }, 0);
+  });
+  page.content = job.content;
+};
+
+if (flags['loop']) {
+  run_loop();
+} else {
+  var width = args[0];
+  var height = args[1];
+  var top = args[2];
+  var left = args[3];
+  var cookie_domain = args[4];
+  var cookie_string = args[5];
+  var debug = flags['debug'] === true;
+
+  var cookies = parse_cookies(cookie_string);
+  add_cookies(cookies, cookie_domain);
+
+  var content = system.stdin.read();
+  var page = create_page(width, height, top, left, flags['full-page'],
+                         flags['offline']);
+
+  if (debug) {
+    var start = new Date();
+    debugger;
+    var stop = new Date();
+    if (stop - start < 1000) {
+      // execution didn't stop at debugger stmt - first (auto) run
+      console.log('\n\n\n');
+      console.log('dom2img PhantomJS debug mode enabled.\n');
+      console.log('Viewport size: ' + width + 'x' + height);
+      console.log('Scroll offsets (left:top): ' + left + ':' + top);
+      if (cookies !== null) {
+        console.log('Cookie domain: ' + cookie_domain);
+        console.log('Cookies:');
+        for (var cookie_key in cookies) {
+          if (!cookies.hasOwnProperty(cookie_key)) {
+            break;
+          }
+          console.log('  ' + cookie_key + ': ' + cookies[cookie_key]);
         }
-        console.log('  ' + cookie_key + ': ' + cookies[cookie_key]);
       }
+      console.log('\nPlease follow the instructions:');
+      console.log('1. Open (in a Webkit-based browser) http://127.0.0.1:9000/webkit/inspector/inspector.html?page=1');
+      console.log('2. Go to console tab');
+      console.log('3. type "__run()" (without quotes) and hit enter');
+      console.log('4. Open (in a Webkit-based browser) in another browser tab http://127.0.0.1:9000/webkit/inspector/inspector.html?page=3');
+      console.log('5. Go back to the first browser tab and unpause script execution');
+      console.log('6. In the second browser tab you can debug your HTML');
+    } else {
+      // execution paused at the debugger statement - __run() was called in the browser
+      page.content = content;
     }
-    console.log('\nPlease follow the instructions:');
-    console.log('1. Open (in a Webkit-based browser) http://127.0.0.1:9000/webkit/inspector/inspector.html?page=1');
-    console.log('2. Go to console tab');
-    console.log('3. type "__run()" (without quotes) and hit enter');
-    console.log('4. Open (in a Webkit-based browser) in another browser tab http://127.0.0.1:9000/webkit/inspector/inspector.html?page=3');
-    console.log('5. Go back to the first browser tab and unpause script execution');
-    console.log('6. In the second browser tab you can debug your HTML');
   } else {
-    // execution paused at the debugger statement - __run() was called in the browser
+    on_loaded(page, flags['load-timeout'], flags['settle'], function() {
+      page.render('/dev/stdout');
+      phantom.exit();
+    });
     page.content = content;
   }
-} else {
-  page.content = content;
-
-  page.onLoadFinished = function() {
-    page.render('/dev/stdout');
-    phantom.exit();
-  };
 }
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+import re
 import sys
 try:
     from setuptools import setup
@@ -8,7 +10,9 @@ except ImportError:
     from setuptools import setup
 
 
-__version__ = '0.1'
+with open(os.path.join(os.path.dirname(__file__),
+                       'dom2img', '_version.py')) as f:
+    __version__ = re.search("__version__ = '(.*)'", f.read()).group(1)
 
 
 tests_require = ['nose == 1.3.1', 'flask == 0.10.1']
@@ -34,6 +34,67 @@
 //             If you don't have imagemagick on the backend,
 //             this (and zoom) params will be ignored.
 //   * params - extra post params
+//   * upload - 'form' (default) or 'raw'. In raw mode html is sent
+//              as the raw text/html request body (without url-encoding)
+//              and all other params are sent in the query string
+//              (see dom2img_upload() in the python library).
+//   * compress - bool (default false). If true, html is gzipped
+//                (using CompressionStream, or pako.gzip if available)
+//                and sent with Content-Encoding: gzip header,
+//                this implies raw upload mode. Html is sent uncompressed
+//                if the browser can't compress it.
+//   * prune - bool (default false). If true, elements that lie entirely
+//             outside of the viewport (and prune_margin) are sent
+//             as empty placeholders with the same size, instead of
+//             their whole subtrees. Useful for long pages.
+//   * prune_margin - number of pixels around the viewport, where
+//                    elements are kept (default 200).
+//   * preclean - bool (default false). If true, scripts are removed
+//                and link/a/img URLs are made absolute in the browser
+//                (on a copy of the document), and precleaned=1 param
+//                is sent, so that the backend can skip parsing html
+//                (see dom2img_upload() trust_precleaned argument).
+//   * delta - bool (default false). If true, the first screenshot uploads
+//             the whole html (in raw upload mode) and the following ones
+//             only upload subtrees changed since the previous screenshot
+//             (recorded using MutationObserver), as a JSON body with
+//             base param (see dom2img_upload_document() in the python
+//             library). Backend has to send id of the uploaded document
+//             in X-Dom2Img-Document response header. If the backend
+//             doesn't have the base document anymore, the whole html
+//             is uploaded again. prune, preclean and incremental
+//             options are ignored in this mode.
+//   * incremental - bool (default false). If true, html is serialized
+//                   in small time slices (when the browser is idle),
+//                   so that the page doesn't freeze, and assembled
+//                   (and compressed) in a Web Worker. This implies raw
+//                   upload mode. DOM changes made during serialization
+//                   can end up in the screenshot.
+//   * stream - bool (default false). If true (and incremental is true),
+//              html is uploaded using a streamed fetch() request, that
+//              starts before serialization finishes, if the browser
+//              supports it. callback gets response text (or parsed json
+//              if dataType is 'json'), error gets the fetch Response
+//              (or null), 'error' and the error. Browsers send streamed
+//              requests only over HTTP/2, so the backend needs an HTTP/2
+//              front end (e.g. nginx with http2, passing the body on
+//              chunked or with wsgi.input_terminated). If the streamed
+//              request can't be sent (TypeError) or the backend refuses
+//              it (411 Length Required), html is uploaded the usual
+//              incremental way instead, and later screenshots don't try
+//              streaming again.
+//   * responseType - 'blob' or 'arraybuffer'. If set, the backend
+//                    should respond with the binary image (e.g. using
+//                    image_response() in the python library), and
+//                    callback gets a Blob or an ArrayBuffer (see
+//                    Dom2Img.object_url() for displaying it). ETag
+//                    of the last response is sent in If-None-Match
+//                    header, and if the backend responds with 304 Not
+//                    Modified, callback gets the previous response again.
+//
+// Dom2Img.object_url(data, type) creates an object URL (e.g. for img src)
+// of a Blob or ArrayBuffer (with type mimetype, default 'image/png').
+// It should be released with URL.revokeObjectURL() when it's not needed.
 window.Dom2Img = (function() {
 
   // Grabs doctype from current page
@@ -51,14 +112,323 @@ window.Dom2Img = (function() {
     return '<html>';
   };
 
-  // get DOM's html of current page
-  var dom_html = function() {
+  // make url absolute, using document's base url
+  var absolute_url = function(url) {
+    var a = document.createElement('a');
+    a.href = url;
+    return a.href;
+  };
+
+  // remove script tags and make link/a/img urls absolute (like backend does)
+  var preclean_html = function(root) {
+    var scripts = root.getElementsByTagName('script');
+    while (scripts.length > 0) {
+      scripts[0].parentNode.removeChild(scripts[0]);
+    }
+    var absolutize = function(tag_name, attr) {
+      var elems = root.getElementsByTagName(tag_name);
+      for (var i = 0; i < elems.length; i++) {
+        if (elems[i].hasAttribute(attr)) {
+          elems[i].setAttribute(attr,
+                                absolute_url(elems[i].getAttribute(attr)));
+        }
+      }
+    };
+    absolutize('link', 'href');
+    absolutize('a', 'href');
+    absolutize('img', 'src');
+  };
+
+  // get html element that should be serialized, if prune_margin is given,
+  // elements outside of the viewport (and the margin) are pruned,
+  // if preclean is true, copy of the document is cleaned up
+  var html_root = function(prune_margin, preclean) {
+    var html_elem = document.body.parentNode;
+    if (prune_margin === undefined && !preclean) {
+      return html_elem;
+    }
+    var clone = html_elem.cloneNode(true);
+    if (prune_margin !== undefined) {
+      prune_outside_viewport(html_elem, clone, prune_margin);
+    }
+    if (preclean) {
+      preclean_html(clone);
+    }
+    return clone;
+  };
+
+  // get DOM's html of current page (see html_root for arguments)
+  var dom_html = function(prune_margin, preclean) {
     var doctype = get_doctype();
     var html_node = get_html_node();
-    var html_inner = document.body.parentNode.innerHTML;
+    var html_inner = html_root(prune_margin, preclean).innerHTML;
     return doctype + html_node + html_inner + '</html>';
   };
 
+  var VOID_ELEMENTS = {area: 1, base: 1, br: 1, col: 1, embed: 1, hr: 1,
+                       img: 1, input: 1, keygen: 1, link: 1, meta: 1,
+                       param: 1, source: 1, track: 1, wbr: 1};
+
+  // elements, which contents are serialized at once using innerHTML
+  var RAW_ELEMENTS = {script: 1, style: 1, xmp: 1, iframe: 1, noembed: 1,
+                      noframes: 1, noscript: 1, plaintext: 1, template: 1,
+                      textarea: 1, title: 1, svg: 1, math: 1};
+
+  var escape_text = function(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;')
+      .replace(/>/g, '&gt;').replace(/\u00a0/g, '&nbsp;');
+  };
+
+  var escape_attr = function(text) {
+    return text.replace(/&/g, '&amp;').replace(/"/g, '&quot;')
+      .replace(/\u00a0/g, '&nbsp;');
+  };
+
+  var start_tag = function(elem, name) {
+    var html = '<' + name;
+    for (var i = 0; i < elem.attributes.length; i++) {
+      var attr = elem.attributes[i];
+      html += ' ' + attr.name + '="' + escape_attr(attr.value) + '"';
+    }
+    return html + '>';
+  };
+
+  // run fn when the browser is idle
+  var when_idle = function(fn) {
+    if (window.requestIdleCallback !== undefined) {
+      window.requestIdleCallback(fn, {timeout: 100});
+    } else {
+      setTimeout(fn, 0);
+    }
+  };
+
+  // serialize contents of root (like innerHTML) in ~8ms time slices,
+  // on_chunk(html) is called after every slice, on_done() at the end
+  var serialize_incremental = function(root, on_chunk, on_done) {
+    // stack of nodes to serialize and closing tags
+    var stack = [];
+    var push_children = function(node) {
+      for (var i = node.childNodes.length - 1; i >= 0; i--) {
+        stack.push(node.childNodes[i]);
+      }
+    };
+
+    var slice = function() {
+      var start = new Date().getTime();
+      var buffer = [];
+      var steps = 0;
+      while (stack.length > 0) {
+        var node = stack.pop();
+        if (typeof node === 'string') {
+          buffer.push(node);
+        } else if (node.nodeType === 1) {
+          var name = node.tagName.toLowerCase();
+          buffer.push(start_tag(node, name));
+          if (RAW_ELEMENTS[name]) {
+            buffer.push(node.innerHTML + '</' + name + '>');
+          } else if (!VOID_ELEMENTS[name]) {
+            stack.push('</' + name + '>');
+            push_children(node);
+          }
+        } else if (node.nodeType === 3) {
+          buffer.push(escape_text(node.data));
+        } else if (node.nodeType === 8) {
+          buffer.push('<!--' + node.data + '-->');
+        }
+        steps++;
+        if (steps % 100 === 0 && new Date().getTime() - start > 8) {
+          break;
+        }
+      }
+      on_chunk(buffer.join(''));
+      if (stack.length > 0) {
+        when_idle(slice);
+      } else {
+        on_done();
+      }
+    };
+
+    push_children(root);
+    when_idle(slice);
+  };
+
+  // Web Worker, that joins html chunks and gzips them
+  var WORKER_SOURCE = [
+    'var chunks = [];',
+    'onmessage = function(e) {',
+    '  if (e.data.chunk !== undefined) {',
+    '    chunks.push(e.data.chunk);',
+    '    return;',
+    '  }',
+    '  var blob = new Blob(chunks, {type: "text/html"});',
+    '  chunks = [];',
+    '  if (e.data.compress && self.CompressionStream !== undefined',
+    '      && Blob.prototype.stream !== undefined) {',
+    '    var stream = blob.stream()',
+    '      .pipeThrough(new CompressionStream("gzip"));',
+    '    new Response(stream).blob().then(function(gzipped) {',
+    '      postMessage({body: gzipped, content_encoding: "gzip"});',
+    '    }, function() {',
+    '      postMessage({body: blob, content_encoding: null});',
+    '    });',
+    '  } else {',
+    '    postMessage({body: blob, content_encoding: null});',
+    '  }',
+    '};'].join('\n');
+
+  // start assembling Web Worker, or return null if it can't be started
+  // (e.g. it's not supported, or blocked by Content Security Policy)
+  var create_worker = function() {
+    if (window.Worker === undefined || window.Blob === undefined ||
+        window.URL === undefined) {
+      return null;
+    }
+    try {
+      var source = new Blob([WORKER_SOURCE], {type: 'text/javascript'});
+      return new Worker(URL.createObjectURL(source));
+    } catch (e) {
+      return null;
+    }
+  };
+
+  // check if fetch() supports ReadableStream request bodies
+  var supports_request_streams = function() {
+    if (window.fetch === undefined || window.ReadableStream === undefined ||
+        window.TextEncoder === undefined) {
+      return false;
+    }
+    var duplex_accessed = false;
+    try {
+      var has_content_type = new Request('', {
+        body: new ReadableStream(),
+        method: 'POST',
+        get duplex() {
+          duplex_accessed = true;
+          return 'half';
+        }
+      }).headers.has('Content-Type');
+      return duplex_accessed && !has_content_type;
+    } catch (e) {
+      return false;
+    }
+  };
+
+  // set when a streamed upload fails, because the connection (or the
+  // backend) doesn't support it
+  var streams_failed = false;
+
+  // upload html while it's being serialized, fallback() is called
+  // (instead of callbacks) if streamed upload isn't possible
+  var stream_upload = function(url, root, compress, dataType, responseType,
+                               callback, error_callback, fallback) {
+    var fail = function() {
+      streams_failed = true;
+      fallback();
+    };
+    var encoder = new TextEncoder();
+    var body = new ReadableStream({start: function(controller) {
+      var enqueue = function(html) {
+        controller.enqueue(encoder.encode(html));
+      };
+      enqueue(get_doctype() + get_html_node());
+      serialize_incremental(root, enqueue, function() {
+        enqueue('</html>');
+        controller.close();
+      });
+    }});
+    var headers = {'Content-Type': 'text/html; charset=UTF-8'};
+    if (compress && window.CompressionStream !== undefined) {
+      body = body.pipeThrough(new CompressionStream('gzip'));
+      headers['Content-Encoding'] = 'gzip';
+    }
+    var previous;
+    if (responseType) {
+      previous = binary_responses[binary_response_key(url)];
+      headers['Accept'] = 'image/png';
+      if (previous !== undefined) {
+        headers['If-None-Match'] = previous.etag;
+      }
+    }
+    var request;
+    try {
+      request = fetch(url, {method: 'POST', body: body, duplex: 'half',
+                            headers: headers, credentials: 'same-origin'});
+    } catch (e) {
+      fail();
+      return;
+    }
+    request.then(function(response) {
+      if (response.status === 304 && previous !== undefined) {
+        callback(previous.data);
+        return;
+      }
+      if (response.status === 411) {
+        fail();
+        return;
+      }
+      if (!response.ok) {
+        error_callback(response, 'error', response.statusText);
+        return;
+      }
+      var data;
+      if (responseType === 'blob') {
+        data = response.blob();
+      } else if (responseType === 'arraybuffer') {
+        data = response.arrayBuffer();
+      } else {
+        data = dataType === 'json' ? response.json() : response.text();
+      }
+      data.then(function(data) {
+        if (responseType) {
+          remember_binary_response(url, response.headers.get('ETag'), data);
+        }
+        callback(data);
+      }, function(e) {
+        error_callback(response, 'parsererror', e);
+      });
+    }, function(e) {
+      if (e instanceof TypeError) {
+        // e.g. HTTP/1.x connection
+        fail();
+      } else {
+        error_callback(null, 'error', e);
+      }
+    });
+  };
+
+  // serialize html in time slices, calls done(body, content_encoding)
+  // with the whole (and possibly compressed) html
+  var incremental_html = function(root, compress, done) {
+    var head = get_doctype() + get_html_node(), tail = '</html>';
+    var worker = create_worker();
+    if (worker !== null) {
+      worker.onmessage = function(e) {
+        worker.terminate();
+        done(e.data.body, e.data.content_encoding);
+      };
+      worker.postMessage({chunk: head});
+      serialize_incremental(root, function(html) {
+        worker.postMessage({chunk: html});
+      }, function() {
+        worker.postMessage({chunk: tail});
+        worker.postMessage({done: true, compress: compress});
+      });
+    } else {
+      var chunks = [head];
+      serialize_incremental(root, function(html) {
+        chunks.push(html);
+      }, function() {
+        chunks.push(tail);
+        var content = chunks.join('');
+        if (compress) {
+          gzip(content, done);
+        } else {
+          done(content, null);
+        }
+      });
+    }
+  };
+
   // get offsets of current view position from left/top of the document
   var get_offsets = function() {
     var get_offset = function(window_offset_prop, doc_elem_scroll_prop) {
@@ -101,6 +471,46 @@ window.Dom2Img = (function() {
     return {width: width, height: height};
   };
 
+  // replace subtrees of clone (deep copy of orig), that lie entirely
+  // outside of the viewport extended by margin, with empty elements
+  // of the same size (elements with inline layout are kept,
+  // because their size can't be set)
+  var prune_outside_viewport = function(orig, clone, margin) {
+    var viewport = get_viewport_size();
+    var is_outside = function(rect) {
+      return rect.bottom < -margin || rect.top > viewport.height + margin ||
+        rect.right < -margin || rect.left > viewport.width + margin;
+    };
+    var is_inside = function(rect) {
+      return rect.top >= 0 && rect.bottom <= viewport.height &&
+        rect.left >= 0 && rect.right <= viewport.width;
+    };
+    var prune = function(orig, clone) {
+      var orig_children = orig.children, clone_children = clone.children;
+      for (var i = 0; i < orig_children.length; i++) {
+        var orig_child = orig_children[i], clone_child = clone_children[i];
+        var display = window.getComputedStyle(orig_child).display;
+        if (display === 'none' || orig_child.tagName === 'HEAD') {
+          continue;
+        }
+        var rect = orig_child.getBoundingClientRect();
+        if (is_outside(rect) && display.indexOf('inline') !== 0) {
+          while (clone_child.firstChild) {
+            clone_child.removeChild(clone_child.firstChild);
+          }
+          clone_child.style.boxSizing = 'border-box';
+          clone_child.style.width = rect.width + 'px';
+          clone_child.style.height = rect.height + 'px';
+          clone_child.style.overflow = 'hidden';
+        } else if (!is_inside(rect)) {
+          // partially visible, or its children can be outside of it
+          prune(orig_child, clone_child);
+        }
+      }
+    };
+    prune(orig, clone);
+  };
+
   // get desired scale percentage (including zoom)
   var get_scale = function(zoom, scale) {
     if (zoom === undefined) {
@@ -113,8 +523,283 @@ window.Dom2Img = (function() {
     return Math.round(result);
   };
 
+  // add params to the query string of url
+  var add_query_params = function(url, params) {
+    var query = $.param(params);
+    if (query === '') {
+      return url;
+    }
+    return url + (url.indexOf('?') === -1 ? '?' : '&') + query;
+  };
+
+  // last binary response (ETag and data) of every backend url
+  // (without query string), used for conditional requests
+  var binary_responses = {};
+
+  var binary_response_key = function(url) {
+    return url.split('?')[0];
+  };
+
+  // remember binary response data, if the backend has sent its ETag
+  var remember_binary_response = function(url, etag, data) {
+    var key = binary_response_key(url);
+    if (etag) {
+      binary_responses[key] = {etag: etag, data: data};
+    } else {
+      delete binary_responses[key];
+    }
+  };
+
+  // POST request with binary response (responseType is 'blob'
+  // or 'arraybuffer'), with jQuery.ajax-like settings and callbacks.
+  // Previous response's ETag is sent in If-None-Match header,
+  // and if the backend responds with 304 Not Modified, success gets
+  // the previous response data (with 'notmodified' status).
+  var binary_ajax = function(settings) {
+    var xhr = new XMLHttpRequest();
+    var data = settings.data, content_type = settings.contentType;
+    if (settings.processData !== false && typeof data !== 'string') {
+      data = $.param(data);
+    }
+    if (content_type === undefined) {
+      content_type = 'application/x-www-form-urlencoded; charset=UTF-8';
+    }
+    var previous = binary_responses[binary_response_key(settings.url)];
+    xhr.open('POST', settings.url);
+    xhr.responseType = settings.responseType;
+    xhr.setRequestHeader('Content-Type', content_type);
+    xhr.setRequestHeader('Accept', 'image/png');
+    $.each(settings.headers || {}, function(name, value) {
+      xhr.setRequestHeader(name, value);
+    });
+    if (previous !== undefined) {
+      xhr.setRequestHeader('If-None-Match', previous.etag);
+    }
+    xhr.onload = function() {
+      if (xhr.status === 304 && previous !== undefined) {
+        settings.success(previous.data, 'notmodified', xhr);
+      } else if (xhr.status >= 200 && xhr.status < 300) {
+        remember_binary_response(settings.url, xhr.getResponseHeader('ETag'),
+                                 xhr.response);
+        settings.success(xhr.response, 'success', xhr);
+      } else {
+        settings.error(xhr, 'error', xhr.statusText);
+      }
+    };
+    xhr.onerror = function() {
+      settings.error(xhr, 'error', '');
+    };
+    xhr.send(data);
+  };
+
+  // jQuery.ajax POST request, or binary_ajax if settings.responseType is set
+  var ajax = function(settings) {
+    if (settings.responseType) {
+      binary_ajax(settings);
+    } else {
+      $.ajax(settings);
+    }
+  };
+
+  // create object URL (e.g. for img src) of a binary screenshot response
+  // (Blob or ArrayBuffer), it should be released with URL.revokeObjectURL
+  var object_url = function(data, type) {
+    if (!(data instanceof Blob)) {
+      data = new Blob([data], {type: type || 'image/png'});
+    }
+    return URL.createObjectURL(data);
+  };
+
+  // gzip content, calls done(data, content_encoding),
+  // falls back to uncompressed content (with null content_encoding)
+  var gzip = function(content, done) {
+    if (window.CompressionStream !== undefined && window.Response !== undefined
+        && window.Blob !== undefined && Blob.prototype.stream !== undefined) {
+      var stream = new Blob([content]).stream()
+            .pipeThrough(new CompressionStream('gzip'));
+      new Response(stream).blob().then(function(blob) {
+        done(blob, 'gzip');
+      }, function() {
+        done(content, null);
+      });
+    } else if (window.pako !== undefined) {
+      done(new Blob([pako.gzip(content)]), 'gzip');
+    } else {
+      done(content, null);
+    }
+  };
+
+  // state of delta uploads: id of the last uploaded document,
+  // elements changed since it was serialized, and number of the last upload
+  var delta_state = {document_id: null, observer: null, add_records: null,
+                     dirty: [], generation: 0};
+
+  // start recording DOM changes, returns false if it's not supported
+  var watch_mutations = function() {
+    if (window.MutationObserver === undefined) {
+      return false;
+    }
+    if (delta_state.observer === null) {
+      var add_records = function(records) {
+        for (var i = 0; i < records.length; i++) {
+          var node = records[i].target;
+          if (node.nodeType !== 1) {
+            node = node.parentNode;
+          }
+          if (node !== null && delta_state.dirty.indexOf(node) === -1) {
+            delta_state.dirty.push(node);
+          }
+        }
+      };
+      delta_state.add_records = add_records;
+      delta_state.observer = new MutationObserver(add_records);
+      delta_state.observer.observe(document.documentElement,
+                                   {childList: true, attributes: true,
+                                    characterData: true, subtree: true});
+    }
+    return true;
+  };
+
+  // get elements changed since the last call
+  var take_dirty = function() {
+    delta_state.add_records(delta_state.observer.takeRecords());
+    var dirty = delta_state.dirty;
+    delta_state.dirty = [];
+    return dirty;
+  };
+
+  // get path of elem from the html element, as a list
+  // of [index among element children, tag name] pairs
+  var element_path = function(elem) {
+    var html = document.documentElement, path = [];
+    while (elem !== html) {
+      var parent = elem.parentNode;
+      var index = Array.prototype.indexOf.call(parent.children, elem);
+      path.unshift([index, elem.tagName.toLowerCase()]);
+      elem = parent;
+    }
+    return path;
+  };
+
+  // get changes of dirty elements (subtrees of other changed elements
+  // are skipped), or null if the whole html should be uploaded
+  var dom_changes = function(dirty) {
+    var html = document.documentElement, changes = [];
+    if (dirty.length > 500) {
+      return null;
+    }
+    for (var i = 0; i < dirty.length; i++) {
+      var elem = dirty[i];
+      if (elem === html) {
+        return null;
+      }
+      if (!html.contains(elem)) {
+        // removal is recorded as a change of its ancestor
+        continue;
+      }
+      var ancestor = elem.parentNode, covered = false;
+      while (ancestor !== html && !covered) {
+        covered = dirty.indexOf(ancestor) !== -1;
+        ancestor = ancestor.parentNode;
+      }
+      if (!covered) {
+        changes.push({path: element_path(elem), html: elem.outerHTML});
+      }
+    }
+    return changes;
+  };
+
+  // number of seconds from Retry-After header of a response, or null
+  var retry_after = function(xhr) {
+    var value = xhr.getResponseHeader('Retry-After');
+    if (!value) {
+      return null;
+    }
+    if (/^\s*\d+\s*$/.test(value)) {
+      return parseInt(value, 10);
+    }
+    var date = Date.parse(value);
+    return isNaN(date) ? null : Math.max(0, (date - Date.now()) / 1000);
+  };
+
+  // upload whole html, or changes since the previous upload
+  var delta_upload = function(url, compress, dataType, responseType,
+                              callback, error_callback) {
+    var base_id = delta_state.document_id;
+    var generation = ++delta_state.generation;
+    // uploads that start before this one finishes can't use it as a base
+    delta_state.document_id = null;
+
+    var upload = function(body, content_type, base_id, retry) {
+      var upload_url = base_id === null ? url :
+            add_query_params(url, {base: base_id});
+      var send = function(body, content_encoding) {
+        var headers = {};
+        if (content_encoding) {
+          headers['Content-Encoding'] = content_encoding;
+        }
+        ajax({type: 'POST', url: upload_url, data: body,
+              processData: false, contentType: content_type,
+              headers: headers, dataType: dataType,
+              responseType: responseType,
+              success: function(data, status, xhr) {
+                if (generation === delta_state.generation) {
+                  delta_state.document_id =
+                    xhr.getResponseHeader('X-Dom2Img-Document');
+                }
+                callback(data, status, xhr);
+              },
+              error: function(xhr, status, error) {
+                var delay = retry_after(xhr);
+                if (retry && (xhr.status === 404 || xhr.status === 400)) {
+                  // base document is unknown (e.g. evicted), or changes
+                  // don't match it
+                  full_upload();
+                } else if (xhr.status === 429 && delay !== null &&
+                           !throttled) {
+                  throttled = true;
+                  setTimeout(function() {
+                    send(body, content_encoding);
+                  }, delay * 1000);
+                } else {
+                  error_callback(xhr, status, error);
+                }
+              }});
+      };
+      // 429 responses are retried once, after their Retry-After delay
+      var throttled = false;
+      if (compress) {
+        gzip(body, send);
+      } else {
+        send(body, null);
+      }
+    };
+
+    var full_upload = function() {
+      if (watch_mutations()) {
+        take_dirty();
+      }
+      upload(dom_html(), 'text/html; charset=UTF-8', null, false);
+    };
+
+    if (base_id === null || !watch_mutations()) {
+      full_upload();
+      return;
+    }
+    var changes = dom_changes(take_dirty());
+    if (changes === null) {
+      full_upload();
+    } else {
+      upload(JSON.stringify({changes: changes}),
+             'application/json; charset=UTF-8', base_id, true);
+    }
+  };
+
   var screenshot = function(opts) {
     var url, callback, error_callback, dataType, zoom, scale, extra_params = {};
+    var upload = 'form', compress = false, prune_margin;
+    var incremental = false, stream = false, preclean = false, delta = false;
+    var responseType;
     if (typeof opts === 'string') {
       url = opts;
       callback = function() {};
@@ -130,26 +815,92 @@ window.Dom2Img = (function() {
         error_callback = function() {};
       }
       dataType = opts['dataType'];
+      responseType = opts['responseType'];
       zoom = opts['zoom'];
       scale = opts['scale'];
       extra_params = opts['params'];
+      if (opts['upload'] !== undefined) {
+        upload = opts['upload'];
+      }
+      if (opts['prune']) {
+        prune_margin = opts['prune_margin'];
+        if (prune_margin === undefined) {
+          prune_margin = 200;
+        }
+      }
+      if (opts['preclean']) {
+        preclean = true;
+      }
+      if (opts['compress']) {
+        compress = true;
+        upload = 'raw';
+      }
+      if (opts['delta']) {
+        delta = true;
+        upload = 'raw';
+      }
+      if (opts['incremental']) {
+        incremental = true;
+        stream = Boolean(opts['stream']);
+        upload = 'raw';
+      }
     }
 
-    var content = dom_html();
     var offsets = get_offsets();
     scale = get_scale(zoom, scale);
     var viewport_size = get_viewport_size();
 
-    var data = {content: content,
-                height: viewport_size.height,
+    var data = {height: viewport_size.height,
                 width: viewport_size.width,
                 top: offsets.top,
                 left: offsets.left,
                 scale: scale};
+    if (preclean && !delta) {
+      data.precleaned = 1;
+    }
 
-    $.ajax({type: 'POST', url: url, data: $.extend(data, extra_params),
-            success: callback, error: error_callback, dataType: dataType});
+    if (upload === 'raw') {
+      var raw_url = add_query_params(url, $.extend(data, extra_params));
+      var send = function(body, content_encoding) {
+        var headers = {};
+        if (content_encoding) {
+          headers['Content-Encoding'] = content_encoding;
+        }
+        ajax({type: 'POST', url: raw_url, data: body, processData: false,
+              contentType: 'text/html; charset=UTF-8', headers: headers,
+              success: callback, error: error_callback, dataType: dataType,
+              responseType: responseType});
+      };
+      if (delta) {
+        delta_upload(raw_url, compress, dataType, responseType,
+                     callback, error_callback);
+        return;
+      }
+      if (incremental) {
+        var root = html_root(prune_margin, preclean);
+        if (stream && !streams_failed && supports_request_streams()) {
+          stream_upload(raw_url, root, compress, dataType, responseType,
+                        callback, error_callback, function() {
+                          incremental_html(root, compress, send);
+                        });
+        } else {
+          incremental_html(root, compress, send);
+        }
+        return;
+      }
+      var content = dom_html(prune_margin, preclean);
+      if (compress) {
+        gzip(content, send);
+      } else {
+        send(content, null);
+      }
+    } else {
+      data.content = dom_html(prune_margin, preclean);
+      ajax({type: 'POST', url: url, data: $.extend(data, extra_params),
+            success: callback, error: error_callback, dataType: dataType,
+            responseType: responseType});
+    }
   };
 
-  return {screenshot: screenshot};
+  return {screenshot: screenshot, object_url: object_url};
 }());
@@ -197,6 +197,38 @@ class NonNegativeIntTest(utils.TestCase):
         self._check_exception(err_msg, b'-4')
 
 
+class OptionalNonNegativeIntTest(utils.TestCase):
+
+    FUN = _arg_utils.optional_non_negative_int
+    EXC = ValueError
+
+    def test_none(self):
+        self._check_result(None, None, u'x')
+
+    def test_byte_string(self):
+        self._check_result(1, b'1', u'x')
+
+    def test_negative_int(self):
+        err_msg = u'unexpected negative integer for x: -3'
+        self._check_exception(err_msg, -3, u'x')
+
+
+class PositiveIntTest(utils.TestCase):
+
+    FUN = _arg_utils.positive_int
+    EXC = ValueError
+
+    def test_byte_string(self):
+        self._check_result(1, b'1', u'x')
+
+    def test_zero(self):
+        self._check_exception(u'unexpected zero for x', 0, u'x')
+
+    def test_negative_int(self):
+        err_msg = u'unexpected negative integer for x: -3'
+        self._check_exception(err_msg, -3, u'x')
+
+
 class AbsoluteURLTest(utils.TestCase):
 
     FUN = _arg_utils.absolute_url
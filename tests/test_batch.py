@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import tests.utils as utils
+from tests.test_pool import LOOP_SCRIPT
+from dom2img import _batch
+
+
+class BatchTest(utils.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _path(self, name):
+        return os.path.join(self._tmp_dir, name)
+
+    def _job(self, **kwargs):
+        job = {'width': 100,
+               'height': 200,
+               'prefix': u'http://example.com/'}
+        if 'content_file' not in kwargs:
+            job['content'] = u'<html></html>'
+        job.update(kwargs)
+        return json.dumps(job)
+
+    def _run(self, lines, jobs=1):
+        records_file = io.StringIO()
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            failures = _batch.run(lines, records_file, jobs=jobs)
+        records = [json.loads(line)
+                   for line in records_file.getvalue().splitlines()]
+        return failures, sorted(records, key=lambda r: r['line'])
+
+    def test_success(self):
+        content_file = self._path('input.html')
+        with open(content_file, 'wb') as f:
+            f.write(b'<html></html>')
+        lines = [self._job(id=1, output=self._path('1.png')),
+                 u'',
+                 self._job(id=u'two', output=self._path('2.png'),
+                           cookies={u'key': u'val'},
+                           content_file=content_file)]
+        failures, records = self._run(lines)
+        self.assertEqual(0, failures)
+        self.assertEqual([1, 3], [r['line'] for r in records])
+        self.assertEqual([1, u'two'], [r['id'] for r in records])
+        for record in records:
+            self.assertEqual(u'ok', record['status'])
+            with open(record['output'], 'rb') as f:
+                image = f.read()
+            self.assertTrue(image.isdigit())
+            self.assertEqual(len(image), record['size'])
+            self.assertTrue(record['seconds'] >= 0)
+
+    def test_failures(self):
+        lines = [u'not json',
+                 u'[]',
+                 self._job(),
+                 self._job(output=self._path('1.png'), foo=1),
+                 self._job(output=self._path('2.png'), width=-1),
+                 self._job(output=self._path('3.png'),
+                           content=u'<html>crash</html>'),
+                 self._job(output=self._path('4.png'), id=4)]
+        failures, records = self._run(lines)
+        self.assertEqual(6, failures)
+        self.assertEqual([u'ValueError'] * 5 + [u'PhantomJSFailure'],
+                         [r['error'] for r in records[:-1]])
+        self.assertEqual(u'unexpected job keys: foo', records[3]['message'])
+        self.assertEqual(u'ok', records[-1]['status'])
+        self.assertEqual(4, records[-1]['id'])
+
+    def test_parallel(self):
+        lines = [self._job(output=self._path(str(i) + '.png'))
+                 for i in range(10)]
+        failures, records = self._run(lines, jobs=3)
+        self.assertEqual(0, failures)
+        self.assertEqual(list(range(1, 11)), [r['line'] for r in records])
+        pids = set()
+        for record in records:
+            with open(record['output'], 'rb') as f:
+                pids.add(f.read())
+        self.assertTrue(1 <= len(pids) <= 3)
+
+    def test_zero_jobs(self):
+        self.assertRaisesExcStr(ValueError,
+                                u'pool size must be at least 1, not 0',
+                                self._run, [self._job()], jobs=0)
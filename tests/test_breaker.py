@@ -0,0 +1,150 @@
+import time
+
+import tests.utils as utils
+from dom2img import _breaker, _dom2img, _exceptions, _retry
+
+
+# mock PhantomJS, that fails unless it's rendering offline
+OFFLINE_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+for arg; do
+  if [ "$arg" = --offline ]; then
+    printf offline
+    exit 0
+  fi
+done
+exit 1
+'''
+
+# mock PhantomJS, that crashes
+CRASH_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+kill -SEGV $$
+'''
+
+PREFIX = u'http://example.com/path/'
+
+
+class CircuitBreakerTest(utils.TestCase):
+
+    def _record(self, breaker, failures, prefix=PREFIX):
+        for failed in failures:
+            ticket = breaker.before_render(prefix)
+            breaker.after_render(prefix, ticket, failed)
+
+    def test_origin(self):
+        self.assertEqual(u'https://example.com:8000',
+                         _breaker.origin(u'https://EXAMPLE.com:8000/a?b=c'))
+
+    def test_open(self):
+        breaker = _breaker.CircuitBreaker(failure_rate=0.5, min_renders=4)
+        self._record(breaker, [True, False, False, None])
+        self.assertFalse(breaker.is_open(PREFIX))
+        self._record(breaker, [False])
+        self.assertFalse(breaker.is_open(PREFIX))
+        self._record(breaker, [True, True])
+        self.assertTrue(breaker.is_open(PREFIX))
+        self.assertTrue(breaker.is_open(u'http://EXAMPLE.com/other'))
+        self.assertFalse(breaker.is_open(u'http://example.com:8000/'))
+        self.assertRaises(_exceptions.CircuitOpen, breaker.before_render,
+                          PREFIX)
+        self.assertFalse(
+            breaker.before_render(u'https://example.com/').offline)
+
+    def test_probe(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1, cooldown=0,
+                                          probe_timeout=60)
+        self._record(breaker, [True])
+        probe = breaker.before_render(PREFIX)
+        self.assertFalse(probe.offline)
+        # only a single probe at a time
+        self.assertRaises(_exceptions.CircuitOpen, breaker.before_render,
+                          PREFIX)
+        breaker.after_render(PREFIX, probe, True)
+        self.assertTrue(breaker.is_open(PREFIX))
+        self._record(breaker, [False])
+        self.assertFalse(breaker.is_open(PREFIX))
+
+    def test_abandoned_probe(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1, cooldown=0.2)
+        self._record(breaker, [True])
+        time.sleep(0.2)
+        abandoned = breaker.before_render(PREFIX)
+        self.assertRaises(_exceptions.CircuitOpen, breaker.before_render,
+                          PREFIX)
+        time.sleep(0.2)
+        probe = breaker.before_render(PREFIX)
+        # late outcome of the abandoned probe doesn't close the circuit
+        breaker.after_render(PREFIX, abandoned, False)
+        self.assertTrue(breaker.is_open(PREFIX))
+        breaker.after_render(PREFIX, probe, False)
+        self.assertFalse(breaker.is_open(PREFIX))
+
+    def test_offline(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1, offline=True)
+        self._record(breaker, [True])
+        ticket = breaker.before_render(PREFIX)
+        self.assertTrue(ticket.offline)
+        # offline renders say nothing about the origin
+        breaker.after_render(PREFIX, ticket, False)
+        self.assertTrue(breaker.is_open(PREFIX))
+
+    def test_max_origins(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1, max_origins=2)
+        self._record(breaker, [True], u'http://a.com/')
+        self._record(breaker, [False], u'http://b.com/')
+        self._record(breaker, [False], u'http://c.com/')
+        self.assertEqual(2, len(breaker))
+        # open circuit is kept, least recently used closed one is evicted
+        self.assertTrue(breaker.is_open(u'http://a.com/'))
+        self._record(breaker, [True], u'http://d.com/')
+        self.assertEqual(2, len(breaker))
+        self.assertTrue(breaker.is_open(u'http://a.com/'))
+        self.assertTrue(breaker.is_open(u'http://d.com/'))
+
+    def test_outcome(self):
+        breaker = _breaker.CircuitBreaker()
+        self.assertTrue(breaker.outcome(_exceptions.PhantomJSTimeout(1)))
+        self.assertTrue(breaker.outcome(
+            _exceptions.PhantomJSFailure(return_code=1)))
+        self.assertEqual(None, breaker.outcome(
+            _exceptions.PhantomJSOutputLimit(100)))
+        self.assertEqual(None, breaker.outcome(
+            _exceptions.DeadlineExceeded()))
+
+    def test_render(self):
+        breaker = _breaker.CircuitBreaker(min_renders=2, offline=True)
+        kwargs = {'content': b'',
+                  'width': 600,
+                  'height': 400,
+                  'top': 0,
+                  'left': 0,
+                  'prefix': PREFIX,
+                  'cookie_string': b'',
+                  'timeout': 30}
+        with utils.mock_phantom_js_binary(OFFLINE_SCRIPT):
+            for _ in range(2):
+                self.assertRaises(_exceptions.PhantomJSFailure,
+                                  _dom2img._run_with_retries, None, None,
+                                  None, None, breaker=breaker, **kwargs)
+            output = _dom2img._run_with_retries(None, None, None, None,
+                                                breaker=breaker, **kwargs)
+        self.assertEqual(b'offline', output)
+        self.assertTrue(output.partial)
+
+    def test_retry_opens_circuit(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1)
+        try:
+            with utils.mock_phantom_js_binary(CRASH_SCRIPT):
+                _dom2img._run_with_retries(
+                    _retry.RetryPolicy(backoff=0), None, None, None,
+                    breaker=breaker, content=b'', width=600, height=400,
+                    top=0, left=0, prefix=PREFIX, cookie_string=b'',
+                    timeout=30)
+        except _exceptions.CircuitOpen as e:
+            self.assertEqual(_exceptions.PhantomJSFailure, type(e.failure))
+            self.assertEqual(-11, e.failure.return_code)
+        else:
+            self.fail('CircuitOpen not raised')
@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+import tests.utils as utils
+from dom2img import _cache, _compat, _dom2img
+
+
+def make_image(width, height, color=(255, 0, 0, 255)):
+    return Image.new('RGBA', (width, height), color)
+
+
+def png(image):
+    buff = _compat.BytesIO()
+    image.save(buff, format='PNG')
+    return buff.getvalue()
+
+
+class CacheKeyTest(utils.TestCase):
+
+    def test_deterministic(self):
+        self.assertEqual(_cache.cache_key(b'foo', u'bar', 1),
+                         _cache.cache_key(b'foo', u'bar', 1))
+
+    def test_parts_are_separated(self):
+        self.assertNotEqual(_cache.cache_key(b'ab', b'c'),
+                            _cache.cache_key(b'a', b'bc'))
+
+
+class RenderCacheTest(utils.TestCase):
+
+    def test_get_put(self):
+        cache = _cache.RenderCache()
+        image = make_image(2, 2)
+        self.assertEqual(None, cache.get(u'key'))
+        cache.put(u'key', image)
+        self.assertTrue(cache.get(u'key') is image)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_lru(self):
+        cache = _cache.RenderCache(max_entries=2)
+        cache.put(u'a', make_image(1, 1))
+        cache.put(u'b', make_image(1, 1))
+        cache.get(u'a')
+        cache.put(u'c', make_image(1, 1))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get(u'b'))
+        self.assertNotEqual(None, cache.get(u'a'))
+        self.assertNotEqual(None, cache.get(u'c'))
+
+    def test_max_bytes(self):
+        cache = _cache.RenderCache(max_bytes=2 * 10 * 10 * 4)
+        cache.put(u'a', make_image(10, 10))
+        cache.put(u'b', make_image(10, 10))
+        cache.put(u'c', make_image(10, 10))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get(u'a'))
+
+    def test_too_big(self):
+        cache = _cache.RenderCache(max_bytes=10)
+        cache.put(u'a', make_image(10, 10))
+        self.assertEqual(0, len(cache))
+
+    def test_level_for(self):
+        self.assertEqual(100, _cache.RenderCache().level_for(25))
+        cache = _cache.RenderCache(pyramid=True)
+        self.assertEqual([100, 100, 50, 50, 25, 25],
+                         [cache.level_for(scale)
+                          for scale in [150, 51, 50, 26, 25, 10]])
+
+    def test_levels(self):
+        cache = _cache.RenderCache(max_bytes=10 * 10 * 4 + 5 * 5 * 4,
+                                   pyramid=True)
+        self.assertEqual(None, cache.get_level(u'a', 50))
+        cache.put_level(u'a', 50, make_image(5, 5))
+        self.assertEqual(None, cache.get_level(u'a', 50))
+        cache.put(u'a', make_image(10, 10))
+        level = make_image(5, 5)
+        cache.put_level(u'a', 50, level)
+        self.assertTrue(cache.get_level(u'a', 50) is level)
+        # no room for another level
+        cache.put_level(u'a', 25, make_image(3, 3))
+        self.assertEqual(None, cache.get_level(u'a', 25))
+        # levels are evicted with their render
+        cache.put(u'b', make_image(10, 10))
+        self.assertEqual(None, cache.get_level(u'a', 50))
+        self.assertEqual(1, len(cache))
+
+    def test_clear(self):
+        cache = _cache.RenderCache()
+        cache.put(u'a', make_image(1, 1))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class CropTest(utils.TestCase):
+
+    def test_inside(self):
+        image = make_image(10, 10)
+        image.putpixel((3, 2), (0, 0, 0, 255))
+        result = _dom2img._crop(image, top=2, left=3, width=4, height=5)
+        self.assertEqual((4, 5), result.size)
+        self.assertEqual((0, 0, 0, 255), result.getpixel((0, 0)))
+        self.assertEqual((255, 0, 0, 255), result.getpixel((3, 4)))
+
+    def test_outside(self):
+        image = make_image(10, 10)
+        result = _dom2img._crop(image, top=8, left=5, width=10, height=4)
+        self.assertEqual((10, 4), result.size)
+        self.assertEqual((255, 0, 0, 255), result.getpixel((4, 1)))
+        self.assertEqual((255, 255, 255, 255), result.getpixel((5, 1)))
+        self.assertEqual((255, 255, 255, 255), result.getpixel((4, 2)))
+
+
+# mock PhantomJS, that logs its args and "renders" a prebuilt full page
+RENDER_SCRIPT = b'''
+#!/bin/sh
+echo "$@" >> "$DOM2IMG_TEST_LOG"
+cat "$DOM2IMG_TEST_PNG"
+'''
+
+
+class Dom2ImgCacheTest(utils.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._log = os.path.join(self._tmp_dir, 'log')
+        page = make_image(100, 400, (255, 255, 255, 255))
+        page.paste(make_image(100, 100), (0, 200))
+        page_path = os.path.join(self._tmp_dir, 'page.png')
+        with open(page_path, 'wb') as f:
+            f.write(png(page))
+        self._old_environ = os.environ.copy()
+        os.environ['DOM2IMG_TEST_LOG'] = self._log
+        os.environ['DOM2IMG_TEST_PNG'] = page_path
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self._old_environ)
+        shutil.rmtree(self._tmp_dir)
+
+    def _invocations(self):
+        with open(self._log) as f:
+            return f.read().splitlines()
+
+    def test_renders_once(self):
+        cache = _cache.RenderCache()
+        kwargs = {'content': b'<html></html>', 'width': 100, 'height': 100,
+                  'prefix': u'http://example.com/', 'cache': cache}
+        with utils.mock_phantom_js_binary(RENDER_SCRIPT):
+            top = utils.image_from_bytestring(_dom2img.dom2img(**kwargs))
+            middle = utils.image_from_bytestring(
+                _dom2img.dom2img(top=200, **kwargs))
+            bottom = utils.image_from_bytestring(
+                _dom2img.dom2img(top=350, scale=50, **kwargs))
+        invocations = self._invocations()
+        self.assertEqual(1, len(invocations))
+        self.assertTrue(invocations[0].endswith(u' --full-page'))
+        self.assertEqual((1, 2), (cache.misses, cache.hits))
+        self.assertEqual((100, 100), top.size)
+        self.assertEqual((255, 255, 255, 255), top.getpixel((50, 50)))
+        self.assertEqual((255, 0, 0, 255), middle.getpixel((50, 50)))
+        self.assertEqual((50, 50), bottom.size)
+        self.assertEqual((255, 255, 255, 255), bottom.getpixel((25, 40)))
+
+    def test_scales(self):
+        cache = _cache.RenderCache(pyramid=True)
+        kwargs = {'content': b'<html></html>', 'width': 100, 'height': 100,
+                  'prefix': u'http://example.com/', 'cache': cache}
+        with utils.mock_phantom_js_binary(RENDER_SCRIPT):
+            images = [utils.image_from_bytestring(
+                _dom2img.dom2img(top=200, scale=scale, **kwargs))
+                for scale in [100, 75, 50, 40, 25, 20]]
+        self.assertEqual(1, len(self._invocations()))
+        self.assertEqual([(100, 100), (75, 75), (50, 50),
+                          (40, 40), (25, 25), (20, 20)],
+                         [image.size for image in images])
+        for image in images:
+            self.assertEqual((255, 0, 0, 255), image.getpixel((10, 10)))
+        key = _cache.cache_key(_dom2img._clean_up_html(
+            b'<html></html>', u'http://example.com/'),
+            u'http://example.com/', 100, b'')
+        self.assertEqual((100, 400), cache.get(key).size)
+        self.assertEqual((50, 200), cache.get_level(key, 50).size)
+        self.assertEqual((25, 100), cache.get_level(key, 25).size)
+
+    def test_different_width(self):
+        cache = _cache.RenderCache()
+        kwargs = {'content': b'<html></html>', 'height': 100,
+                  'prefix': u'http://example.com/', 'cache': cache}
+        with utils.mock_phantom_js_binary(RENDER_SCRIPT):
+            _dom2img.dom2img(width=100, **kwargs)
+            _dom2img.dom2img(width=50, **kwargs)
+        self.assertEqual(2, len(self._invocations()))
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import tests.utils as utils
+from dom2img import _cancel, _dom2img, _exceptions, _pool, _scheduler
+from tests.test_pool import LOOP_SCRIPT
+
+
+# mock PhantomJS, whose child keeps stdout open for a long time
+SLEEP_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+sleep 30 &
+wait
+'''
+
+
+def cancel_later(token, seconds=0.2):
+    timer = threading.Timer(seconds, token.cancel)
+    timer.start()
+    return timer
+
+
+class CancelTokenTest(utils.TestCase):
+
+    def test_callbacks(self):
+        token = _cancel.CancelToken()
+        calls = []
+        token.add_callback(lambda: calls.append('first'))
+        removed = lambda: calls.append('removed')
+        token.add_callback(removed)
+        token.remove_callback(removed)
+        self.assertFalse(token.cancelled)
+        token.raise_if_cancelled()
+        token.cancel()
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertEqual(['first'], calls)
+        token.add_callback(lambda: calls.append('late'))
+        self.assertEqual(['first', 'late'], calls)
+        self.assertRaises(_exceptions.RenderCancelled,
+                          token.raise_if_cancelled)
+
+
+class CancelRenderTest(utils.TestCase):
+
+    def _render(self, **kwargs):
+        return _dom2img._render(content=b'', width=600, height=400, top=0,
+                                left=0, prefix=u'http://127.0.0.1/',
+                                cookie_string=b'', timeout=30, **kwargs)
+
+    def test_kills_process_group(self):
+        token = _cancel.CancelToken()
+        with utils.mock_phantom_js_binary(SLEEP_SCRIPT):
+            start = time.time()
+            cancel_later(token)
+            self.assertRaises(_exceptions.RenderCancelled, self._render,
+                              cancel=token)
+        self.assertTrue(time.time() - start < 5)
+
+    def test_cancelled_before_start(self):
+        token = _cancel.CancelToken()
+        token.cancel()
+        self.assertRaises(_exceptions.RenderCancelled, self._render,
+                          phantomjs_path=u'/nonexistent', cancel=token)
+
+    def test_pool(self):
+        token = _cancel.CancelToken()
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                start = time.time()
+                cancel_later(token)
+                self.assertRaises(_exceptions.RenderCancelled, pool.render,
+                                  content=b'<html>freeze</html>', width=1,
+                                  height=1, top=0, left=0,
+                                  prefix=u'http://example.com/',
+                                  cookie_string=b'', timeout=30,
+                                  cancel=token)
+                self.assertTrue(time.time() - start < 5)
+                # cancelled worker gets replaced
+                worker = pool._acquire(1)
+                self.assertTrue(worker.alive())
+                pool._release(worker)
+
+    def test_pool_wait(self):
+        token = _cancel.CancelToken()
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                worker = pool._acquire()
+                cancel_later(token)
+                self.assertRaises(_exceptions.RenderCancelled,
+                                  pool._acquire, 5, token)
+                pool._release(worker)
+
+    def test_scheduler_wait(self):
+        token = _cancel.CancelToken()
+        scheduler = _scheduler.RenderScheduler(slots=1)
+        start = scheduler.acquire()
+        cancel_later(token)
+        self.assertRaises(_exceptions.RenderCancelled, scheduler.acquire,
+                          cancel=token)
+        self.assertEqual([], scheduler._waiting)
+        scheduler.release(u'interactive', start)
+        scheduler.release(u'interactive', scheduler.acquire())
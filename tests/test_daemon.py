@@ -0,0 +1,148 @@
+import contextlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import tests.utils as utils
+from tests.test_pool import LOOP_SCRIPT
+from dom2img import _daemon, _pool
+
+
+@contextlib.contextmanager
+def running_server():
+    tmp_dir = tempfile.mkdtemp()
+    address = os.path.join(tmp_dir, 'dom2img.sock')
+    with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+        with _pool.PhantomJSPool(size=1) as pool:
+            server = _daemon.make_server(address, pool)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                yield address
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+                shutil.rmtree(tmp_dir)
+
+
+OPTIONS = {'width': 100,
+           'height': 200,
+           'prefix': u'http://example.com/',
+           'cookies': u'key=val'}
+
+
+class ParseAddressTest(utils.TestCase):
+
+    FUN = _daemon.parse_address
+
+    def test_tcp(self):
+        self._check_result((socket.AF_INET, (u'localhost', 7000)),
+                           u'localhost:7000')
+
+    def test_tcp_default_host(self):
+        self._check_result((socket.AF_INET, (u'127.0.0.1', 7000)), u':7000')
+
+    def test_unix(self):
+        self._check_result((socket.AF_UNIX, u'/tmp/dom2img.sock'),
+                           u'/tmp/dom2img.sock')
+
+    def test_unix_relative(self):
+        self._check_result((socket.AF_UNIX, u'dom2img.sock'), u'dom2img.sock')
+
+
+class MakeServerTest(utils.TestCase):
+
+    def test_remote(self):
+        self.assertRaisesExcStr(ValueError,
+                                u'refusing to listen on non-loopback '
+                                u'address 0.0.0.0 (use --allow-remote to '
+                                u'allow it)',
+                                _daemon.make_server, u'0.0.0.0:0', None)
+
+    def test_allow_remote(self):
+        server = _daemon.make_server(u'0.0.0.0:0', None, allow_remote=True)
+        server.server_close()
+
+    def test_localhost(self):
+        server = _daemon.make_server(u'localhost:0', None)
+        server.server_close()
+
+
+class MessageTest(utils.TestCase):
+
+    def test_roundtrip(self):
+        sock1, sock2 = socket.socketpair()
+        try:
+            _daemon.write_message(sock1, {u'foo': 1}, b'bar')
+            _daemon.write_message(sock1, {}, b'')
+            self.assertEqual(({u'foo': 1}, b'bar'),
+                             _daemon.read_message(sock2))
+            self.assertEqual(({}, b''), _daemon.read_message(sock2))
+            sock1.close()
+            self.assertEqual(None, _daemon.read_message(sock2))
+        finally:
+            sock1.close()
+            sock2.close()
+
+    def test_truncated(self):
+        sock1, sock2 = socket.socketpair()
+        try:
+            sock1.sendall(b'\x00\x00\x00\x05{}')
+            sock1.close()
+            self.assertRaises(EOFError, _daemon.read_message, sock2)
+        finally:
+            sock2.close()
+
+
+class ServerTest(utils.TestCase):
+
+    def test_render(self):
+        with running_server() as address:
+            status, pid = _daemon.request(address, OPTIONS, b'<html></html>')
+            self.assertEqual(0, status)
+            self.assertTrue(pid.isdigit())
+            # workers are reused between requests
+            self.assertEqual((0, pid), _daemon.request(address, OPTIONS,
+                                                       b'<html></html>'))
+
+    def test_invalid_args(self):
+        options = dict(OPTIONS, width=-1)
+        with running_server() as address:
+            self.assertEqual(
+                (1, b'unexpected negative integer for width: -1'),
+                _daemon.request(address, options, b'<html></html>'))
+
+    def test_unknown_option(self):
+        options = dict(OPTIONS, pool=None)
+        with running_server() as address:
+            self.assertEqual((1, b'unexpected options: pool'),
+                             _daemon.request(address, options, b''))
+
+    def test_unexpected_error(self):
+
+        class BrokenPool(object):
+
+            def render(self, **kwargs):
+                raise OSError('no space left on device')
+
+        self.assertEqual(
+            (2, b'internal error: no space left on device'),
+            _daemon.handle_request(OPTIONS, b'<html></html>', BrokenPool()))
+
+    def test_crash(self):
+        with running_server() as address:
+            status, output = _daemon.request(address, OPTIONS,
+                                             b'<html>crash</html>')
+            self.assertEqual(2, status)
+            self.assertTrue(output.startswith(b'PhantomJS failed'))
+
+    def test_timeout(self):
+        options = dict(OPTIONS, timeout=1)
+        with running_server() as address:
+            status, output = _daemon.request(address, options,
+                                             b'<html>freeze</html>')
+            self.assertEqual(3, status)
+            self.assertTrue(output.startswith(b'PhantomJS process has been'))
@@ -0,0 +1,132 @@
+import json
+
+import tests.utils as utils
+from tests.test_upload import ECHO_SCRIPT
+from dom2img import _documents, _exceptions, _upload
+
+
+PAGE = b'''<!DOCTYPE html>
+<html><head><title>t</title></head>
+<body><div id="a">a</div><ul><li>1</li><li>2</li></ul></body></html>'''
+
+
+class ApplyChangesTest(utils.TestCase):
+
+    def test_replace(self):
+        result = _documents.apply_changes(PAGE, [
+            {'path': [[1, u'body'], [1, u'ul'], [1, u'LI']],
+             'html': u'<li class="x">3</li>'},
+            {'path': [[1, u'body'], [0, u'div']],
+             'html': u'<div id="b">b</div>'}])
+        self.assertTrue(b'<li>1</li><li class="x">3</li>' in result)
+        self.assertTrue(b'<div id="b">b</div><ul>' in result)
+        self.assertTrue(result.startswith(b'<!DOCTYPE html>'))
+
+    def test_structure(self):
+        # misplaced elements stay where browsers have them
+        result = _documents.apply_changes(
+            b'<html><body><p><div>a</div></p></body></html>',
+            [{'path': [[0, u'body'], [0, u'p'], [0, u'div']],
+              'html': u'<div>b</div>'}])
+        self.assertTrue(b'<p><div>b</div></p>' in result)
+
+    def test_mismatch(self):
+        for path in [[[1, u'body'], [0, u'span']],
+                     [[1, u'body'], [5, u'div']],
+                     [[1, u'body', 2]],
+                     [],
+                     u'body']:
+            self.assertRaises(ValueError, _documents.apply_changes, PAGE,
+                              [{'path': path, 'html': u''}])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, _documents.apply_changes, PAGE, {})
+        self.assertRaises(ValueError, _documents.apply_changes, PAGE,
+                          [{'path': [[1, u'body']]}])
+
+
+class DocumentStoreTest(utils.TestCase):
+
+    def test_sessions(self):
+        store = _documents.DocumentStore()
+        document_id = store.put(u'session1', PAGE)
+        self.assertEqual(PAGE, store.get(u'session1', document_id))
+        self.assertRaisesExcStr(_exceptions.DocumentNotFound,
+                                u'Document not found: ' + document_id,
+                                store.get, u'session2', document_id)
+
+    def test_lru(self):
+        store = _documents.DocumentStore(max_documents=2)
+        ids = [store.put(None, PAGE) for _ in range(2)]
+        store.get(None, ids[0])
+        ids.append(store.put(None, PAGE))
+        self.assertEqual(2, len(store))
+        self.assertRaises(_exceptions.DocumentNotFound,
+                          store.get, None, ids[1])
+        store.get(None, ids[0])
+        store.get(None, ids[2])
+
+    def test_max_bytes(self):
+        store = _documents.DocumentStore(max_bytes=len(PAGE) * 2)
+        for _ in range(3):
+            store.put(None, PAGE)
+        self.assertEqual(2, len(store))
+        store.put(None, PAGE * 3)
+        self.assertEqual(2, len(store))
+
+    def test_update(self):
+        store = _documents.DocumentStore()
+        base_id = store.put(None, PAGE)
+        document_id, content = store.update(
+            None, base_id, [{'path': [[1, u'body'], [0, u'div']],
+                             'html': u'<p>b</p>'}])
+        self.assertNotEqual(base_id, document_id)
+        self.assertEqual(content, store.get(None, document_id))
+        self.assertTrue(b'<p>b</p>' in content)
+
+
+class Dom2ImgUploadDocumentTest(utils.TestCase):
+
+    PARAMS = {'width': u'100', 'height': u'200'}
+
+    def _upload(self, store, body, params):
+        with utils.mock_phantom_js_binary(ECHO_SCRIPT):
+            return _upload.dom2img_upload_document(
+                body, params, u'http://example.com/', store, u'session')
+
+    def test_delta(self):
+        store = _documents.DocumentStore()
+        base_id, output = self._upload(store, PAGE, self.PARAMS)
+        self.assertTrue(b'id="a"' in output)
+        delta = json.dumps({'changes': [{'path': [[1, 'body'], [0, 'div']],
+                                         'html': u'<div id="c">c</div>'}]})
+        document_id, output = self._upload(store, delta.encode('utf-8'),
+                                           dict(self.PARAMS, base=base_id))
+        self.assertNotEqual(base_id, document_id)
+        self.assertTrue(b'id="c"' in output)
+        self.assertFalse(b'id="a"' in output)
+
+    def test_delta_clean_up(self):
+        store = _documents.DocumentStore()
+        base_id, _ = self._upload(store, PAGE, self.PARAMS)
+        delta = json.dumps({'changes': [
+            {'path': [[1, 'body'], [0, 'div']],
+             'html': u'<img src="a.png"><script>x()</script>'}]})
+        document_id, output = self._upload(store, delta.encode('utf-8'),
+                                           dict(self.PARAMS, base=base_id))
+        self.assertTrue(b'http://example.com/a.png' in output)
+        self.assertFalse(b'<script' in output)
+        # stored document keeps its structure
+        self.assertTrue(b'<script>' in store.get(u'session', document_id))
+
+    def test_missing_base(self):
+        store = _documents.DocumentStore()
+        self.assertRaises(_exceptions.DocumentNotFound, self._upload, store,
+                          b'{"changes": []}', dict(self.PARAMS, base=u'x'))
+
+    def test_invalid_delta(self):
+        store = _documents.DocumentStore()
+        base_id = store.put(u'session', PAGE)
+        for body in [b'not json', b'[]']:
+            self.assertRaises(ValueError, self._upload, store, body,
+                              dict(self.PARAMS, base=base_id))
@@ -2,12 +2,13 @@
 import os
 import signal
 import threading
+import time
 
 from PIL import Image
 from bs4 import BeautifulSoup
 
 import tests.utils as utils
-from dom2img import _compat, _dom2img, _exceptions
+from dom2img import _compat, _dom2img, _exceptions, _volatile
 
 
 class CleanUpHTMLTest(utils.TestCase):
@@ -72,6 +73,55 @@ class CleanUpHTMLTest(utils.TestCase):
         self._check_result(content, utils.dirty_html_doc,
                            comparator=lambda c: BeautifulSoup(c).prettify())
 
+    def test_base_href(self):
+        result = _dom2img._clean_up_html(utils.dirty_html_doc,
+                                         u'http://example.com/',
+                                         base_href=True)
+        doc = BeautifulSoup(result)
+        self.assertEqual([u'http://example.com/'],
+                         [tag[u'href'] for tag in doc.findAll('base')])
+        self.assertEqual('base', doc.head.find(True).name)
+        self.assertEqual(u'div_bg_color.css', doc.find('link')[u'href'])
+        self.assertEqual([], doc.findAll('script'))
+
+    def test_base_href_replaces_base(self):
+        result = _dom2img._clean_up_html(
+            b'<html><body><base href="/x" target="_top"><img src="a.png">'
+            b'</body></html>', u'http://example.com/', base_href=True)
+        doc = BeautifulSoup(result)
+        self.assertEqual([{u'href': u'http://example.com/',
+                           u'target': u'_top'}],
+                         [tag.attrs for tag in doc.findAll('base')])
+        self.assertEqual('base', doc.head.find(True).name)
+
+
+class PrepareHTMLTest(utils.TestCase):
+
+    def test_not_precleaned(self):
+        content = b'<p><a href="x">x</a></p>'
+        self.assertEqual(
+            _dom2img._clean_up_html(content, u'http://example.com/'),
+            _dom2img._prepare_html(content, u'http://example.com/'))
+
+    def test_precleaned(self):
+        content = b'<p><a href="x">x</a></p>'
+        self.assertEqual(content,
+                         _dom2img._prepare_html(content, u'http://example.com/',
+                                                precleaned=True))
+
+    def test_precleaned_with_script(self):
+        content = b'<p>x</p><SCRIPT>alert(1);</script>'
+        result = _dom2img._prepare_html(content, u'http://example.com/',
+                                        precleaned=True)
+        self.assertFalse(b'alert' in result)
+
+    def test_precleaned_with_volatile(self):
+        volatile = _volatile.VolatileContent()
+        content = b'<p nonce="1">x</p>'
+        result = _dom2img._prepare_html(content, u'http://example.com/',
+                                        volatile=volatile, precleaned=True)
+        self.assertTrue(b'nonce=""' in result)
+
 
 class PhantomjsInvocationTest(utils.TestCase):
 
@@ -225,6 +275,33 @@ exit 1
                                     err_msg, _dom2img._render,
                                     **kwargs)
 
+    def test_crash_bounds_stderr(self):
+        script = b'''
+#!/bin/sh
+echo first 1>&2
+head -c 1000000 /dev/zero | tr '\\0' 'x' 1>&2
+echo 1>&2
+echo last 1>&2
+exit 1
+'''
+        lines = []
+        with utils.mock_phantom_js_binary(script):
+            try:
+                _dom2img._render(content=b'', width=600, height=400, top=0,
+                                 left=0, prefix=u'http://127.0.0.1/',
+                                 cookie_string=b'', timeout=30,
+                                 stderr_hook=lines.append)
+            except _exceptions.PhantomJSFailure as e:
+                stderr = e.stderr
+            else:
+                self.fail('PhantomJSFailure not raised')
+        self.assertTrue(len(stderr) < 70 * 1024)
+        self.assertTrue(stderr.startswith(u'first\n'))
+        self.assertTrue(stderr.endswith(u'\nlast\n'))
+        self.assertTrue(u'bytes omitted ...]' in stderr)
+        self.assertEqual(u'first', lines[0])
+        self.assertEqual(u'last', lines[-1])
+
     def test_timeout(self):
         with utils.FlaskApp() as app:
             kwargs = {'content': utils.freezing_html_doc(app.port),
@@ -239,6 +316,82 @@ exit 1
                                     u'', _dom2img._render,
                                     **kwargs)
 
+    def test_partial(self):
+        script = b'''
+#!/bin/sh
+cat > /dev/null
+echo 'console error' 1>&2
+echo 'dom2img: partial render' 1>&2
+printf png
+'''
+        lines = []
+        with utils.mock_phantom_js_binary(script):
+            output = _dom2img._render(content=b'', width=600, height=400,
+                                      top=0, left=0,
+                                      prefix=u'http://127.0.0.1/',
+                                      cookie_string=b'', timeout=30,
+                                      stderr_hook=lines.append)
+        self.assertEqual(b'png', output)
+        self.assertTrue(output.partial)
+        self.assertEqual([u'console error'], lines)
+
+    def test_load_budget(self):
+        # mock PhantomJS, that "renders" its load timeout and settle args
+        script = b'''
+#!/bin/sh
+cat > /dev/null
+for arg; do
+  case "$arg" in
+    --load-timeout=*|--settle=*) printf %s "$arg" ;;
+  esac
+done
+'''
+        kwargs = {'content': b'',
+                  'width': 600,
+                  'height': 400,
+                  'top': 0,
+                  'left': 0,
+                  'prefix': u'http://127.0.0.1/',
+                  'cookie_string': b'',
+                  'timeout': 5}
+        with utils.mock_phantom_js_binary(script):
+            self.assertEqual(b'', _dom2img._run_renderer(None, None, None,
+                                                         **kwargs))
+            self.assertEqual(b'--load-timeout=2000',
+                             _dom2img._run_renderer(None, None, None,
+                                                    load_timeout=2,
+                                                    **kwargs))
+            self.assertEqual(b'--load-timeout=4000',
+                             _dom2img._run_renderer(None, None, None,
+                                                    load_timeout=10,
+                                                    **kwargs))
+            self.assertEqual(b'--load-timeout=2000',
+                             _dom2img._run_renderer(None, None, None,
+                                                    render_timeout=3,
+                                                    **kwargs))
+            # remaining time until deadline limits the budget
+            self.assertEqual(b'--load-timeout=1000',
+                             _dom2img._run_renderer(None, None,
+                                                    time.time() + 1.5,
+                                                    load_timeout=10,
+                                                    **kwargs))
+            # no time left for loading the page
+            self.assertRaises(_exceptions.DeadlineExceeded,
+                              _dom2img._run_renderer, None, None,
+                              time.time() + 1.5, render_timeout=3, **kwargs)
+            self.assertEqual(b'--load-timeout=2000--settle=1000',
+                             _dom2img._run_renderer(None, None, None,
+                                                    load_timeout=2,
+                                                    settle_timeout=1,
+                                                    **kwargs))
+
+    def test_render_timeout(self):
+        self.assertRaisesExcStr(
+            ValueError, u'render_timeout must be less than timeout, ' +
+            u'to leave time for loading the page', _dom2img.dom2img,
+            content=b'', width=600, height=400,
+            prefix=u'http://127.0.0.1/', timeout=5, render_timeout=5)
+
 
 class ResizeTest(utils.TestCase):
 
@@ -564,6 +717,74 @@ exit 1
                                     u'', _dom2img.dom2img,
                                     **kwargs)
 
+    def test_best_effort(self):
+        with utils.FlaskApp() as app:
+            prefix = utils.prefix_for_port(app.port)
+            output = _dom2img.dom2img(
+                content=utils.freezing_html_doc(app.port), width=600,
+                height=400, prefix=prefix, timeout=3, best_effort=True)
+            self.assertTrue(output.partial)
+            self.assertEqual((600, 400),
+                             utils.image_from_bytestring(output).size)
+
+    def test_load_timeout(self):
+        with utils.FlaskApp() as app:
+            prefix = utils.prefix_for_port(app.port)
+            output = _dom2img.dom2img(
+                content=utils.freezing_html_doc(app.port), width=600,
+                height=400, prefix=prefix, timeout=10, load_timeout=1)
+            self.assertEqual((600, 400),
+                             utils.image_from_bytestring(output).size)
+
+    def test_deadline_after_resize(self):
+        script = b'''
+#!/bin/sh
+cat > /dev/null
+printf png
+'''
+
+        def slow_resize(img_string, scale):
+            time.sleep(0.5)
+            return img_string
+
+        with utils.mock_phantom_js_binary(script):
+            with utils.MonkeyPatch(_dom2img, '_resize', slow_resize):
+                self.assertEqual(b'png', _dom2img.dom2img(
+                    b'', 600, 400, u'http://127.0.0.1/',
+                    deadline=time.time() + 10))
+                self.assertRaises(_exceptions.DeadlineExceeded,
+                                  _dom2img.dom2img, b'', 600, 400,
+                                  u'http://127.0.0.1/',
+                                  deadline=time.time() + 0.3)
+
+
+class BaseHrefRenderTest(utils.TestCase):
+
+    def _check_static_page(self, name):
+        with open(os.path.join(utils.STATIC_DIR, name), 'rb') as f:
+            content = f.read()
+        with utils.FlaskApp() as app:
+            prefix = utils.prefix_for_port(app.port)
+            kwargs = {'content': content,
+                      'width': 1024,
+                      'height': 768,
+                      'prefix': prefix}
+            rewritten = _dom2img.dom2img(**kwargs)
+            based = _dom2img.dom2img(base_href=True, **kwargs)
+        self.assertEqual(list(utils.image_from_bytestring(rewritten)
+                              .convert('RGBA').getdata()),
+                         list(utils.image_from_bytestring(based)
+                              .convert('RGBA').getdata()))
+
+    def test_scrive(self):
+        self._check_static_page('scrive.html')
+
+    def test_scrive_mobile(self):
+        self._check_static_page('scrive_mobile.html')
+
+    def test_test(self):
+        self._check_static_page('test.html')
+
 
 class Dom2ImgDebugTest(Dom2ImgExceptionsMixin, utils.TestCase):
 
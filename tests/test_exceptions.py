@@ -16,6 +16,12 @@ class PhantomJSFailureTest(utils.TestCase):
         err_msg += u'some output'
         self.assertEqual(str(exc_inst), err_msg)
 
+    def test_string_not_run(self):
+        exc_inst = _exceptions.PhantomJSFailure(return_code=None,
+                                                stderr=u'/bin/x: No access')
+        self.assertEqual(str(exc_inst),
+                         u"PhantomJS couldn't be run: /bin/x: No access")
+
 
 class PhantomJSTimeoutTest(utils.TestCase):
 
@@ -32,3 +38,84 @@ class PhantomJSNotInPathTest(utils.TestCase):
         exc_inst = _exceptions.PhantomJSNotInPath()
         err_msg = u"Couldn't find phantomjs binary in $PATH"
         self.assertEqual(str(exc_inst), err_msg)
+
+    def test_string_with_path(self):
+        exc_inst = _exceptions.PhantomJSNotInPath(u'/opt/phantomjs')
+        err_msg = u"Couldn't find phantomjs binary: /opt/phantomjs"
+        self.assertEqual(str(exc_inst), err_msg)
+
+
+class DocumentNotFoundTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.DocumentNotFound(u'abc')
+        self.assertEqual(str(exc_inst), u'Document not found: abc')
+
+
+class DeadlineExceededTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.DeadlineExceeded()
+        err_msg = u'Screenshot deadline has been exceeded before ' + \
+            u'rendering could finish'
+        self.assertEqual(str(exc_inst), err_msg)
+
+
+class RenderQueueTimeoutTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.RenderQueueTimeout(5)
+        err_msg = u'No render slot became available in 5 seconds'
+        self.assertEqual(str(exc_inst), err_msg)
+
+
+class PhantomJSMemoryLimitTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.PhantomJSMemoryLimit(1024, -6, u'bad_alloc')
+        err_msg = u'PhantomJS exceeded memory limit of 1024 bytes: ' + \
+            u'PhantomJS failed with status -6, and stderr output:\nbad_alloc'
+        self.assertEqual(str(exc_inst), err_msg)
+        self.assertTrue(isinstance(exc_inst, _exceptions.PhantomJSFailure))
+
+
+class PhantomJSCPULimitTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.PhantomJSCPULimit(5, -24)
+        err_msg = u'PhantomJS exceeded CPU time limit of 5 seconds: ' + \
+            u'PhantomJS failed with status -24'
+        self.assertEqual(str(exc_inst), err_msg)
+
+
+class PhantomJSOutputLimitTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.PhantomJSOutputLimit(100)
+        err_msg = u'PhantomJS process has been killed, because its ' + \
+            u'output exceeded 100 bytes'
+        self.assertEqual(str(exc_inst), err_msg)
+
+
+class RenderCancelledTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.RenderCancelled()
+        self.assertEqual(str(exc_inst), u'Render has been cancelled')
+
+
+class CircuitOpenTest(utils.TestCase):
+
+    def test_string(self):
+        exc_inst = _exceptions.CircuitOpen(u'http://example.com', 30)
+        err_msg = u'Renders of http://example.com are failing, ' + \
+            u'next attempt in 30 seconds'
+        self.assertEqual(str(exc_inst), err_msg)
+
+    def test_failure(self):
+        exc_inst = _exceptions.CircuitOpen(
+            u'http://example.com', 30, _exceptions.PhantomJSTimeout(10))
+        err_msg = u'Renders of http://example.com are failing, ' + \
+            u'next attempt in 30 seconds, last failure: ' + \
+            str(_exceptions.PhantomJSTimeout(10))
+        self.assertEqual(str(exc_inst), err_msg)
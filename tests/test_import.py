@@ -0,0 +1,43 @@
+import sys
+
+import tests.utils as utils
+
+
+def _imported_modules(module):
+    '''
+    Import module in a fresh interpreter.
+
+    Returns:
+        list of names of all modules loaded by the import.
+    '''
+    prog = '''
+import sys
+before = set(sys.modules)
+import %s
+print(' '.join(sorted(set(sys.modules) - before)))
+''' % module
+    stdout, _, returncode = utils.call_script([sys.executable, '-c', prog],
+                                              b'')
+    assert returncode == 0
+    return stdout.decode('ascii').split()
+
+
+class ImportTest(utils.TestCase):
+
+    def _check_lazy(self, module):
+        # import time itself is too noisy to assert on, but these
+        # modules alone take longer to import than the whole package
+        modules = _imported_modules(module)
+        for heavy_module in ['PIL', 'bs4', 'pkg_resources', 'distutils']:
+            self.assertFalse(heavy_module in modules, heavy_module)
+
+    def test_package(self):
+        self._check_lazy('dom2img')
+
+    def test_script(self):
+        self._check_lazy('dom2img._script')
+
+    def test_version(self):
+        import dom2img
+        from dom2img import _version
+        self.assertEqual(dom2img.__version__, _version.__version__)
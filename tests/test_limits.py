@@ -0,0 +1,124 @@
+import os
+import shutil
+import signal
+import tempfile
+
+import tests.utils as utils
+from dom2img import _dom2img, _exceptions, _limits, _retry
+
+
+# mock PhantomJS, that "renders" its resource limits
+ULIMIT_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+echo $(ulimit -v) $(ulimit -t) $(ulimit -n)
+'''
+
+# mock PhantomJS, that renders a huge image
+HUGE_OUTPUT_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+head -c 10000000 /dev/zero
+'''
+
+# mock PhantomJS, that renders forever
+BUSY_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+while :; do :; done
+'''
+
+# mock PhantomJS, that crashes
+CRASH_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+kill -SEGV $$
+'''
+
+
+# mock PhantomJS, that crashes on the first run
+FLAKY_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+if [ ! -e MARKER ]; then
+  touch MARKER
+  kill -SEGV $$
+fi
+printf png
+'''
+
+
+def render(limits, timeout=30, retry=None):
+    return _dom2img.dom2img(b'<html></html>', 100, 100,
+                            u'http://example.com/', timeout=timeout,
+                            limits=limits, retry=retry)
+
+
+class ResourceLimitsTest(utils.TestCase):
+
+    def test_rlimits(self):
+        limits = _limits.ResourceLimits(memory=512 * 1024 * 1024,
+                                        cpu_seconds=20, open_files=64)
+        with utils.mock_phantom_js_binary(ULIMIT_SCRIPT):
+            self.assertEqual(b'524288 20 64\n', render(limits))
+
+    def test_output(self):
+        limits = _limits.ResourceLimits(max_output=1000)
+        with utils.mock_phantom_js_binary(HUGE_OUTPUT_SCRIPT):
+            self.assertRaisesExcStr(
+                _exceptions.PhantomJSOutputLimit,
+                u'PhantomJS process has been killed, because its output ' +
+                u'exceeded 1000 bytes', render, limits)
+
+    def test_cpu(self):
+        limits = _limits.ResourceLimits(cpu_seconds=1)
+        with utils.mock_phantom_js_binary(BUSY_SCRIPT):
+            self.assertRaises(_exceptions.PhantomJSCPULimit,
+                              render, limits, 20)
+
+    def test_crash(self):
+        # crashes without evidence of exceeded limits are plain failures
+        with utils.mock_phantom_js_binary(CRASH_SCRIPT):
+            for limits in [_limits.ResourceLimits(memory=10 ** 9),
+                           _limits.ResourceLimits(cpu_seconds=10)]:
+                try:
+                    render(limits)
+                except _exceptions.PhantomJSFailure as e:
+                    self.assertEqual(_exceptions.PhantomJSFailure, type(e))
+                else:
+                    self.fail('PhantomJSFailure not raised')
+
+    def test_retry(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            script = FLAKY_SCRIPT.replace(
+                b'MARKER', os.path.join(tmp_dir, 'marker').encode('utf-8'))
+            limits = _limits.ResourceLimits(memory=10 ** 9, cpu_seconds=10)
+            with utils.mock_phantom_js_binary(script):
+                output = render(limits,
+                                retry=_retry.RetryPolicy(backoff=0))
+            self.assertEqual(b'png', output)
+            self.assertEqual(2, output.attempts)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_failure(self):
+        limits = _limits.ResourceLimits(memory=1024)
+        self.assertEqual(_exceptions.PhantomJSMemoryLimit,
+                         type(limits.failure(1, u'Out of memory')))
+        self.assertEqual(_exceptions.PhantomJSFailure,
+                         type(limits.failure(1, u'Error')))
+        self.assertEqual(_exceptions.PhantomJSFailure,
+                         type(limits.failure(-11)))
+        self.assertEqual(_exceptions.PhantomJSFailure,
+                         type(_limits.ResourceLimits().failure(-11)))
+
+        limits = _limits.ResourceLimits(cpu_seconds=10)
+        self.assertEqual(_exceptions.PhantomJSCPULimit,
+                         type(limits.failure(-signal.SIGXCPU)))
+        # e.g. killed by OOM killer
+        self.assertEqual(_exceptions.PhantomJSFailure,
+                         type(limits.failure(-signal.SIGKILL)))
+        self.assertEqual(_exceptions.PhantomJSFailure,
+                         type(_limits.ResourceLimits().failure(
+                             -signal.SIGXCPU)))
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+
+import tests.utils as utils
+from dom2img import _phantomjs, _exceptions
+
+
+VERSION_SCRIPT = b'''
+#!/bin/sh
+echo 1.9.7
+'''
+
+
+class FindPhantomJSTest(utils.TestCase):
+
+    def setUp(self):
+        _phantomjs.clear_cache()
+
+    def tearDown(self):
+        _phantomjs.clear_cache()
+
+    def test_path_lookup(self):
+        with utils.mock_phantom_js_binary(VERSION_SCRIPT):
+            binary = _phantomjs.find_phantomjs()
+            self.assertTrue(os.path.isabs(binary))
+            self.assertEqual(os.path.basename(binary), 'phantomjs')
+
+    def test_explicit_path(self):
+        with utils.mock_phantom_js_binary(VERSION_SCRIPT):
+            binary = _phantomjs.find_phantomjs()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'phantomjs-custom')
+            with open(path, 'wb') as f:
+                f.write(VERSION_SCRIPT.lstrip())
+            os.chmod(path, 0o755)
+            self.assertEqual(path, _phantomjs.find_phantomjs(path))
+            self.assertNotEqual(binary, path)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_explicit_path_missing(self):
+        self.assertRaisesExcStr(_exceptions.PhantomJSNotInPath,
+                                u"Couldn't find phantomjs binary: /nonexistent",
+                                _phantomjs.find_phantomjs, u'/nonexistent')
+
+    def test_env_override(self):
+        with utils.mock_phantom_js_binary(VERSION_SCRIPT):
+            binary = _phantomjs.find_phantomjs()
+            old_path = os.environ['PATH']
+            os.environ['PATH'] = ''
+            os.environ[_phantomjs.PHANTOMJS_PATH_ENV] = binary
+            try:
+                self.assertEqual(binary, _phantomjs.find_phantomjs())
+            finally:
+                os.environ['PATH'] = old_path
+                del os.environ[_phantomjs.PHANTOMJS_PATH_ENV]
+
+    def test_not_in_path(self):
+        old_path = os.environ['PATH']
+        os.environ['PATH'] = ''
+        try:
+            self.assertRaises(_exceptions.PhantomJSNotInPath,
+                              _phantomjs.find_phantomjs)
+        finally:
+            os.environ['PATH'] = old_path
+
+    def test_cache_invalidation(self):
+        with utils.mock_phantom_js_binary(VERSION_SCRIPT):
+            binary = _phantomjs.find_phantomjs()
+            old_path = os.environ['PATH']
+            os.environ['PATH'] = os.path.dirname(binary)
+            try:
+                self.assertEqual(binary, _phantomjs.find_phantomjs())
+                os.remove(binary)
+                self.assertRaises(_exceptions.PhantomJSNotInPath,
+                                  _phantomjs.find_phantomjs)
+            finally:
+                os.environ['PATH'] = old_path
+
+
+class RenderScriptPathTest(utils.TestCase):
+
+    def test(self):
+        path = _phantomjs.render_script_path()
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(os.path.basename(path), 'render_file.phantom.js')
+        self.assertTrue(path is _phantomjs.render_script_path())
+
+
+class CheckPhantomJSTest(utils.TestCase):
+
+    def setUp(self):
+        _phantomjs.clear_cache()
+
+    def tearDown(self):
+        _phantomjs.clear_cache()
+
+    def test_version(self):
+        with utils.mock_phantom_js_binary(VERSION_SCRIPT):
+            self.assertEqual(u'1.9.7', _phantomjs.check_phantomjs())
+
+    def test_broken_binary(self):
+        script = b'''
+#!/bin/sh
+echo broken 1>&2
+exit 1
+'''
+        with utils.mock_phantom_js_binary(script):
+            self.assertRaisesExcStr(
+                _exceptions.PhantomJSFailure,
+                u'PhantomJS failed with status 1, and stderr output:\n' +
+                u'broken\n', _phantomjs.check_phantomjs)
+
+    def test_not_executable(self):
+        with utils.mock_phantom_js_binary(b'\x7fELF garbage'):
+            self.assertRaisesRegexp(
+                _exceptions.PhantomJSFailure,
+                u"^PhantomJS couldn't be run: .*phantomjs: ",
+                _phantomjs.check_phantomjs)
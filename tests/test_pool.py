@@ -0,0 +1,131 @@
+import time
+
+import tests.utils as utils
+from dom2img import _exceptions, _pool
+
+
+# mock PhantomJS renderer loop, which "renders" its pid
+LOOP_SCRIPT = b'''
+#!/bin/sh
+while read line; do
+  case "$line" in
+    '') exit 0 ;;
+    *crash*) echo ERROR 1>&2; exit 1 ;;
+    *freeze*) exec sleep 10 ;;
+    *orphan*) sleep 30 & wait ;;
+    *partial*) echo 'dom2img: partial render' 1>&2 ;;
+  esac
+  printf %s $$ | base64
+done
+'''
+
+
+def render(pool, content=b'<html></html>', timeout=30):
+    return pool.render(content=content, width=100, height=200, top=0,
+                       left=0, prefix=u'http://example.com/',
+                       cookie_string=b'key=val', timeout=timeout)
+
+
+class PoolTest(utils.TestCase):
+
+    def test_render(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                pid = render(pool)
+                self.assertTrue(pid.isdigit())
+                self.assertEqual(pid, render(pool))
+
+    def test_max_renders(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1, max_renders=2) as pool:
+                pids = [render(pool) for _ in range(3)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_crash(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                pid = render(pool)
+                self.assertRaisesRegexp(
+                    _exceptions.PhantomJSFailure,
+                    u'PhantomJS failed with status 1, and stderr output:\n' +
+                    u'ERROR\n', render, pool, b'<html>crash</html>')
+                self.assertNotEqual(pid, render(pool))
+
+    def test_timeout(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                pid = render(pool)
+                self.assertRaises(_exceptions.PhantomJSTimeout, render,
+                                  pool, b'<html>freeze</html>', 1)
+                self.assertNotEqual(pid, render(pool))
+
+    def test_timeout_kills_children(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                start = time.time()
+                self.assertRaises(_exceptions.PhantomJSTimeout, render,
+                                  pool, b'<html>orphan</html>', 1)
+                self.assertTrue(time.time() - start < 5)
+
+    def test_partial(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            with _pool.PhantomJSPool(size=1) as pool:
+                self.assertTrue(render(pool, b'<html>partial</html>').partial)
+                self.assertFalse(render(pool).partial)
+
+    def test_size(self):
+        self.assertRaisesExcStr(ValueError,
+                                u'pool size must be at least 1, not 0',
+                                _pool.PhantomJSPool, size=0)
+
+    def test_startup_failure(self):
+        started = []
+
+        def start_worker(*args):
+            if started:
+                raise OSError('too many open files')
+            started.append(worker_class(*args))
+            return started[-1]
+
+        worker_class = _pool._Worker
+        with utils.MonkeyPatch(_pool, '_Worker', start_worker):
+            with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+                self.assertRaises(OSError, _pool.PhantomJSPool, size=2)
+        self.assertEqual(1, len(started))
+        self.assertFalse(started[0].alive())
+
+    def test_closed(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            pool = _pool.PhantomJSPool(size=1)
+            pool.close()
+            self.assertRaises(ValueError, render, pool)
+
+    def test_phantomjs_render(self):
+        with _pool.PhantomJSPool(size=1) as pool:
+            for _ in range(2):
+                output = pool.render(content=utils.html_doc(),
+                                     width=600,
+                                     height=400,
+                                     top=50,
+                                     left=50,
+                                     prefix=u'http://127.0.0.1',
+                                     cookie_string=b'',
+                                     timeout=30)
+                self._validate_render_pixels(output, top=50, left=50)
+
+    def test_phantomjs_cookies(self):
+        with utils.FlaskApp() as app:
+            prefix = u'http://127.0.0.1:' + str(app.port)
+            with _pool.PhantomJSPool(size=1) as pool:
+                for cookie_string, color in [(b'key=val', (0, 0, 0)),
+                                             (b'', (255, 0, 0))]:
+                    output = pool.render(content=utils.html_doc(app.port),
+                                         width=600,
+                                         height=400,
+                                         top=0,
+                                         left=0,
+                                         prefix=prefix,
+                                         cookie_string=cookie_string,
+                                         timeout=30)
+                    self._validate_render_pixels(output, div_color=color)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+
+import tests.utils as utils
+from dom2img import _dom2img, _exceptions, _retry
+
+
+# mock PhantomJS, that fails (using %s way) until it's been run %d times
+FLAKY_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+echo x >> COUNTER
+if [ $(wc -l < COUNTER) -lt %d ]; then
+  %s
+fi
+printf png
+'''
+
+
+class RetryPolicyTest(utils.TestCase):
+
+    def test_retryable(self):
+        policy = _retry.RetryPolicy()
+        self.assertTrue(policy.retryable(
+            _exceptions.PhantomJSFailure(return_code=-11)))
+        self.assertFalse(policy.retryable(
+            _exceptions.PhantomJSFailure(return_code=1)))
+        self.assertFalse(policy.retryable(_exceptions.PhantomJSTimeout(1)))
+        self.assertFalse(policy.retryable(
+            _exceptions.PhantomJSMemoryLimit(1024, -11)))
+        self.assertFalse(policy.retryable(_exceptions.DeadlineExceeded()))
+
+        policy = _retry.RetryPolicy(retry_signals=False,
+                                    retry_exit_codes=True,
+                                    retry_timeouts=True)
+        self.assertFalse(policy.retryable(
+            _exceptions.PhantomJSFailure(return_code=-11)))
+        self.assertTrue(policy.retryable(
+            _exceptions.PhantomJSFailure(return_code=1)))
+        self.assertTrue(policy.retryable(_exceptions.PhantomJSTimeout(1)))
+
+    def test_delay(self):
+        policy = _retry.RetryPolicy(max_attempts=3, backoff=0.5,
+                                    multiplier=3)
+        crash = _exceptions.PhantomJSFailure(return_code=-11)
+        self.assertEqual(0.5, policy.delay(crash, 1))
+        self.assertEqual(1.5, policy.delay(crash, 2))
+        self.assertEqual(None, policy.delay(crash, 3))
+        self.assertEqual(None, policy.delay(
+            _exceptions.PhantomJSFailure(return_code=1), 1))
+
+
+class RetryRenderTest(utils.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._counter = os.path.join(self._tmp_dir, 'counter')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _render(self, runs, failure, retry):
+        script = FLAKY_SCRIPT.replace(b'COUNTER',
+                                      self._counter.encode('utf-8'))
+        script = script % (runs, failure)
+        with utils.mock_phantom_js_binary(script):
+            return _dom2img._run_with_retries(
+                retry, None, None, None, content=b'', width=600,
+                height=400, top=0, left=0, prefix=u'http://127.0.0.1/',
+                cookie_string=b'', timeout=30)
+
+    def test_crash(self):
+        retry = _retry.RetryPolicy(backoff=0)
+        output = self._render(3, b'kill -SEGV $$', retry)
+        self.assertEqual(b'png', output)
+        self.assertEqual(3, output.attempts)
+
+    def test_max_attempts(self):
+        retry = _retry.RetryPolicy(max_attempts=2, backoff=0)
+        try:
+            self._render(3, b'kill -SEGV $$', retry)
+        except _exceptions.PhantomJSFailure as e:
+            self.assertEqual(2, e.attempts)
+        else:
+            self.fail('PhantomJSFailure not raised')
+
+    def test_fail_fast(self):
+        retry = _retry.RetryPolicy(backoff=0)
+        try:
+            self._render(2, b'exit 1', retry)
+        except _exceptions.PhantomJSFailure as e:
+            self.assertEqual(1, e.attempts)
+        else:
+            self.fail('PhantomJSFailure not raised')
+
+    def test_no_retry(self):
+        self.assertRaises(_exceptions.PhantomJSFailure, self._render,
+                          2, b'kill -SEGV $$', None)
+        self.assertEqual(1, self._render(2, b'kill -SEGV $$', None).attempts)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import unittest2
+
+import tests.utils as utils
+from dom2img import _dom2img, _exceptions, _scheduler, _subprocess
+
+
+# mock PhantomJS, that "renders" its niceness
+NICE_SCRIPT = b'''
+#!/bin/sh
+cat > /dev/null
+nice
+'''
+
+
+class RenderSchedulerTest(utils.TestCase):
+
+    def _wait_for_waiters(self, scheduler, count):
+        while len(scheduler._waiting) < count:
+            time.sleep(0.01)
+
+    def _run(self, scheduler, order, name, priority, deadline=None):
+        def target():
+            with scheduler.slot(priority, deadline):
+                order.append(name)
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def test_order(self):
+        scheduler = _scheduler.RenderScheduler(slots=1)
+        order = []
+        start = scheduler.acquire()
+        now = time.time()
+        threads = [
+            self._run(scheduler, order, 'background', u'background'),
+            self._run(scheduler, order, 'late', u'interactive', now + 60),
+            self._run(scheduler, order, 'no deadline', u'interactive'),
+            self._run(scheduler, order, 'early', u'interactive', now + 30)]
+        self._wait_for_waiters(scheduler, len(threads))
+        scheduler.release(u'interactive', start)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['early', 'late', 'no deadline', 'background'],
+                         order)
+
+    def test_concurrency(self):
+        scheduler = _scheduler.RenderScheduler(slots=2)
+        starts = [scheduler.acquire(), scheduler.acquire()]
+        self.assertRaises(_exceptions.DeadlineExceeded, scheduler.acquire,
+                          deadline=time.time() + 0.1)
+        scheduler.release(u'interactive', starts.pop())
+        starts.append(scheduler.acquire(deadline=time.time() + 5))
+        self.assertEqual([], scheduler._waiting)
+
+    def test_early_rejection(self):
+        scheduler = _scheduler.RenderScheduler()
+        self.assertEqual(None, scheduler.estimate(u'interactive'))
+        scheduler.release(u'interactive', time.time() - 10)
+        self.assertTrue(scheduler.estimate(u'interactive') >= 10)
+        start = time.time()
+        self.assertRaises(_exceptions.DeadlineExceeded, scheduler.acquire,
+                          deadline=time.time() + 5)
+        self.assertTrue(time.time() - start < 1)
+        # other classes have their own estimates
+        scheduler.release(u'background',
+                          scheduler.acquire(u'background',
+                                            deadline=time.time() + 5))
+
+    def test_unknown_priority(self):
+        self.assertRaisesExcStr(ValueError, u'unknown priority class: foo',
+                                _scheduler.RenderScheduler().acquire, u'foo')
+
+    def test_niceness(self):
+        scheduler = _scheduler.RenderScheduler(nice={u'background': 5})
+        self.assertEqual(5, scheduler.niceness(u'background'))
+        self.assertEqual(0, scheduler.niceness(u'interactive'))
+
+
+class Dom2ImgSchedulerTest(utils.TestCase):
+
+    def _render(self, priority):
+        scheduler = _scheduler.RenderScheduler()
+        with utils.mock_phantom_js_binary(NICE_SCRIPT):
+            return _dom2img.dom2img(b'<html></html>', 100, 100,
+                                    u'http://example.com/',
+                                    scheduler=scheduler, priority=priority)
+
+    @unittest2.skipIf(
+        _subprocess.preexec_fn(nice=1) is None,
+        'lowering process priority is not supported')
+    def test_nice(self):
+        interactive = int(self._render(u'interactive'))
+        self.assertEqual(min(interactive + 10, 19),
+                         int(self._render(u'background')))
@@ -1,11 +1,16 @@
 # coding=utf-8
 import itertools
+import json
 import os
 import random
+import shutil
 import signal
+import tempfile
 import threading
+import time
 
 import tests.utils as utils
+from tests.test_pool import LOOP_SCRIPT
 
 
 def serialize_args_for_dom2img_script(kwargs_list):
@@ -72,6 +77,28 @@ class ScriptTest(utils.TestCase):
             self.assertEqual(result[0], b'')
             self.assertEqual(result[2], 1)
 
+    def test_zero_workers(self):
+        stdout, stderr, retcode = dom2img_script(
+            '', [('serve', u'dom2img.sock'), ('workers', 0)])
+        self.assertTrue(b'--workers' in stderr)
+        self.assertEqual(stdout, b'')
+        self.assertEqual(retcode, 1)
+
+    def test_zero_jobs(self):
+        stdout, stderr, retcode = dom2img_script(
+            '', [('batch', None), ('jobs', 0)])
+        self.assertTrue(b'--jobs' in stderr)
+        self.assertEqual(stdout, b'')
+        self.assertEqual(retcode, 1)
+
+    def test_remote_address(self):
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            stdout, stderr, retcode = dom2img_script(
+                '', [('serve', u'0.0.0.0:0'), ('workers', 1)])
+        self.assertTrue(b'--allow-remote' in stderr)
+        self.assertEqual(stdout, b'')
+        self.assertEqual(retcode, 1)
+
     def test_optional_cookies_param(self):
         args = list(self.ARGS)
         for i, (arg, _) in enumerate(args):
@@ -149,3 +176,64 @@ exit 1
         self.assertTrue(b'Cookie domain: example.com' in output)
         self.assertTrue(b'key: val' in output)
         self.assertEqual(content, b'<html>\n</html>')
+
+    def test_serve_and_client(self):
+        tmp_dir = tempfile.mkdtemp()
+        address = os.path.join(tmp_dir, 'dom2img.sock')
+        with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+            server = utils.start_script(
+                serialize_args_for_dom2img_script([('serve', address),
+                                                   ('workers', 1)]))
+            try:
+                while not os.path.exists(address):
+                    time.sleep(.1)
+                args = list(self.ARGS) + [('client', address)]
+                pids = [dom2img_script(b'<html></html>', args)
+                        for _ in range(2)]
+                stdout, stderr, retcode = pids[0]
+                self.assertEqual(retcode, 0)
+                self.assertEqual(stderr, b'')
+                self.assertTrue(stdout.isdigit())
+                self.assertEqual(pids[0], pids[1])
+
+                stdout, stderr, retcode = \
+                    dom2img_script(b'<html>crash</html>', args)
+                self.assertEqual(retcode, 2)
+                self.assertEqual(stdout, b'')
+                self.assertEqual(stderr,
+                                 b'PhantomJS failed with status 1, ' +
+                                 b'and stderr output:\nERROR\n\n')
+            finally:
+                server.terminate()
+                server.wait()
+                shutil.rmtree(tmp_dir)
+
+    def test_client_without_server(self):
+        args = list(self.ARGS) + [('client', '/nonexistent/dom2img.sock')]
+        stdout, stderr, retcode = dom2img_script(b'<html></html>', args)
+        self.assertEqual(retcode, 2)
+        self.assertEqual(stdout, b'')
+        self.assertTrue(stderr.startswith(b"Couldn't talk to dom2img server"))
+
+    def test_batch(self):
+        tmp_dir = tempfile.mkdtemp()
+        output = os.path.join(tmp_dir, 'output.png')
+        jobs = json.dumps({'id': 1, 'width': 100, 'height': 200,
+                           'prefix': u'http://example.com/',
+                           'content': u'<html></html>',
+                           'output': output}) + '\n' + \
+            json.dumps({'id': 2}) + '\n'
+        try:
+            with utils.mock_phantom_js_binary(LOOP_SCRIPT):
+                stdout, stderr, retcode = dom2img_script(
+                    jobs.encode('ascii'), [('batch', None), ('jobs', 2)])
+            records = sorted(map(json.loads,
+                                 stdout.decode('ascii').splitlines()),
+                             key=lambda record: record['id'])
+            self.assertEqual(retcode, 2)
+            self.assertEqual(stderr, b'')
+            self.assertEqual([u'ok', u'error'],
+                             [record['status'] for record in records])
+            self.assertTrue(os.path.exists(output))
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,147 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import tests.utils as utils
+from dom2img import _cancel, _exceptions, _semaphore
+
+
+# holds a slot of a semaphore until stdin is closed
+HOLDER_PROG = '''
+import sys
+from dom2img import _semaphore
+semaphore = _semaphore.HostSemaphore(slots=1, directory=sys.argv[1])
+slot = semaphore.acquire()
+sys.stdout.write('acquired\\n')
+sys.stdout.flush()
+sys.stdin.read()
+'''
+
+
+class HostSemaphoreTest(utils.TestCase):
+
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def semaphore(self, **kwargs):
+        return _semaphore.HostSemaphore(directory=self._tmp_dir, **kwargs)
+
+    def test_limit(self):
+        # separate instances behave like separate processes
+        first = self.semaphore(slots=2)
+        second = self.semaphore(slots=2)
+        slots = [first.acquire(), second.acquire()]
+        self.assertRaises(_exceptions.RenderQueueTimeout, first.acquire,
+                          timeout=0.1)
+        second.release(slots.pop())
+        first.release(first.acquire(timeout=1))
+        first.release(slots.pop())
+
+    def test_timeout_cleanup(self):
+        semaphore = self.semaphore(slots=1)
+        slot = semaphore.acquire()
+        threads = threading.active_count()
+        fds = len(os.listdir('/proc/self/fd'))
+        try:
+            for _ in range(3):
+                self.assertRaises(_exceptions.RenderQueueTimeout,
+                                  semaphore.acquire, timeout=0.05)
+            self.assertEqual(threads, threading.active_count())
+            self.assertEqual(fds, len(os.listdir('/proc/self/fd')))
+            self.assertEqual(0, semaphore.stats()['waiting'])
+        finally:
+            semaphore.release(slot)
+
+    def test_deadline(self):
+        semaphore = self.semaphore(slots=1, timeout=10)
+        slot = semaphore.acquire()
+        try:
+            self.assertRaises(_exceptions.DeadlineExceeded,
+                              semaphore.acquire,
+                              deadline=time.time() + 0.1)
+        finally:
+            semaphore.release(slot)
+
+    def test_cancel(self):
+        semaphore = self.semaphore(slots=1)
+        slot = semaphore.acquire()
+        token = _cancel.CancelToken()
+        threading.Timer(0.2, token.cancel).start()
+        try:
+            self.assertRaises(_exceptions.RenderCancelled,
+                              semaphore.acquire, cancel=token)
+        finally:
+            semaphore.release(slot)
+        semaphore.release(semaphore.acquire(timeout=1))
+
+    def test_fairness(self):
+        semaphore = self.semaphore(slots=1)
+        order = []
+        slot = semaphore.acquire()
+
+        def waiter(name):
+            with semaphore.slot():
+                order.append(name)
+                time.sleep(0.05)
+
+        threads = []
+        for name in ['first', 'second', 'third', 'fourth']:
+            thread = threading.Thread(target=waiter, args=(name,))
+            thread.start()
+            threads.append(thread)
+            while semaphore.stats()['waiting'] < len(threads):
+                time.sleep(0.01)
+        # counting running renders doesn't get in the way of waiters
+        self.assertEqual(1, semaphore.stats()['running'])
+        semaphore.release(slot)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['first', 'second', 'third', 'fourth'], order)
+        self.assertEqual(0, semaphore.stats()['running'])
+
+    def test_crashed_waiter(self):
+        semaphore = self.semaphore(slots=1)
+        semaphore.release(semaphore.acquire())
+        # wait file of a crashed waiter with a lower ticket isn't locked
+        open(os.path.join(self._tmp_dir, 'dom2img.wait.0.1.1'), 'w').close()
+        semaphore.release(semaphore.acquire(timeout=1))
+
+    def test_other_process(self):
+        proc = subprocess.Popen([sys.executable, '-c', HOLDER_PROG,
+                                 self._tmp_dir],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(b'acquired\n', proc.stdout.readline())
+            semaphore = self.semaphore(slots=1)
+            self.assertEqual(1, semaphore.stats()['running'])
+            self.assertRaises(_exceptions.RenderQueueTimeout,
+                              semaphore.acquire, timeout=0.1)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+            proc.stdout.close()
+        # slot of the exited process isn't counted
+        self.assertEqual(0, semaphore.stats()['running'])
+        semaphore.release(semaphore.acquire(timeout=1))
+
+    def test_stats(self):
+        semaphore = self.semaphore(slots=1)
+        slot = semaphore.acquire()
+        self.assertRaises(_exceptions.RenderQueueTimeout,
+                          semaphore.acquire, timeout=0.1)
+        stats = semaphore.stats()
+        semaphore.release(slot)
+        self.assertEqual({'slots': 1, 'running': 1, 'waiting': 0,
+                          'acquired': 1, 'timeouts': 1},
+                         dict((key, val) for key, val in stats.items()
+                              if key != 'wait_seconds'))
+        self.assertTrue(stats['wait_seconds'] >= 0.1)
+        self.assertEqual(0, semaphore.stats()['running'])
@@ -0,0 +1,253 @@
+import json
+import shutil
+import tempfile
+import time
+
+import tests.utils as utils
+from dom2img import _breaker, _compat, _documents, _pool, _screenshot, \
+    _semaphore, _service
+from tests.test_pool import LOOP_SCRIPT
+
+
+def request(service, body=b'<html></html>', query='width=100&height=200',
+            method='POST', content_type='text/html', length=None, **extra):
+    environ = {'REQUEST_METHOD': method,
+               'QUERY_STRING': query,
+               'CONTENT_TYPE': content_type,
+               'CONTENT_LENGTH': str(len(body) if length is None else length),
+               'wsgi.input': _compat.BytesIO(body)}
+    environ.update(extra)
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = int(status.split()[0])
+        response['headers'] = dict(headers)
+
+    response['body'] = b''.join(service(environ, start_response))
+    return response
+
+
+class ServiceTest(utils.TestCase):
+
+    def setUp(self):
+        self._mock = utils.mock_phantom_js_binary(LOOP_SCRIPT)
+        self._mock.__enter__()
+        self._pool = _pool.PhantomJSPool(size=1)
+
+    def tearDown(self):
+        self._pool.close()
+        self._mock.__exit__(None, None, None)
+
+    def service(self, **kwargs):
+        return _service.ScreenshotService(u'http://example.com/',
+                                          pool=self._pool, **kwargs)
+
+    def test_raw(self):
+        response = request(self.service())
+        self.assertEqual(200, response['status'])
+        self.assertEqual('image/png', response['headers']['Content-Type'])
+        self.assertEqual(str(len(response['body'])),
+                         response['headers']['Content-Length'])
+        self.assertTrue(response['body'].isdigit())
+
+    def test_partial(self):
+        response = request(self.service(), body=b'<html>partial</html>')
+        self.assertEqual(200, response['status'])
+        self.assertEqual('1', response['headers']['X-Dom2Img-Partial'])
+        response = request(self.service())
+        self.assertFalse('X-Dom2Img-Partial' in response['headers'])
+
+    def test_circuit_open(self):
+        breaker = _breaker.CircuitBreaker(min_renders=1, cooldown=60)
+        breaker.after_render(u'http://example.com/',
+                             breaker.before_render(u'http://example.com/'),
+                             True)
+        response = request(self.service(breaker=breaker))
+        self.assertEqual(503, response['status'])
+        self.assertEqual('60', response['headers']['Retry-After'])
+
+    def test_forward_cookies(self):
+        cookie_strings = []
+
+        class RecordingPool(object):
+
+            def render(self, **kwargs):
+                cookie_strings.append(kwargs['cookie_string'])
+                return _screenshot.Screenshot(b'png')
+
+        cookie = 'a=1; b=2; c=\xe9'
+        for forward_cookies in [True, [u'a'], False]:
+            service = _service.ScreenshotService(
+                u'http://example.com/', pool=RecordingPool(),
+                forward_cookies=forward_cookies)
+            response = request(service, HTTP_COOKIE=cookie)
+            self.assertEqual(200, response['status'])
+        self.assertEqual([b'a=1;b=2', b'a=1', b''],
+                         [b';'.join(sorted(s.split(b';')))
+                          for s in cookie_strings])
+
+    def test_not_modified(self):
+        etag = request(self.service())['headers']['ETag']
+        response = request(self.service(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response['status'])
+        self.assertEqual(b'', response['body'])
+        self.assertEqual(etag, response['headers']['ETag'])
+        self.assertFalse('Content-Length' in response['headers'])
+        response = request(self.service(), HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(200, response['status'])
+
+    def test_form(self):
+        body = b'width=100&height=200&content=%3Cp%3Efoo%3C/p%3E'
+        response = request(self.service(), body=body,
+                           query='', content_type='application/' +
+                           'x-www-form-urlencoded; charset=UTF-8',
+                           HTTP_CONTENT_ENCODING='identity')
+        self.assertEqual(200, response['status'])
+        response = request(self.service(), body=b'width=1&height=1',
+                           query='', content_type='application/' +
+                           'x-www-form-urlencoded')
+        self.assertEqual(400, response['status'])
+        self.assertEqual(b'missing upload parameter: content',
+                         response['body'])
+
+    def test_method(self):
+        response = request(self.service(), method='GET')
+        self.assertEqual(405, response['status'])
+        self.assertEqual('POST', response['headers']['Allow'])
+
+    def test_length(self):
+        response = request(self.service(), length='')
+        self.assertEqual(411, response['status'])
+        response = request(self.service(max_content_size=10), length=11)
+        self.assertEqual(413, response['status'])
+
+    def test_chunked(self):
+        body = b'6;ext=1\r\n<html>\r\n7\r\n</html>\r\n0\r\n' + \
+            b'X-Trailer: 1\r\n\r\n'
+        response = request(self.service(), body=body, length='',
+                           HTTP_TRANSFER_ENCODING='chunked')
+        self.assertEqual(200, response['status'])
+        response = request(self.service(max_content_size=10), body=body,
+                           length='', HTTP_TRANSFER_ENCODING='chunked')
+        self.assertEqual(413, response['status'])
+        response = request(self.service(), body=b'x\r\n', length='',
+                           HTTP_TRANSFER_ENCODING='chunked')
+        self.assertEqual(400, response['status'])
+        self.assertEqual(b'invalid chunked request body', response['body'])
+
+    def test_input_terminated(self):
+        response = request(self.service(), length='',
+                           **{'wsgi.input_terminated': True})
+        self.assertEqual(200, response['status'])
+        response = request(self.service(max_content_size=10), length='',
+                           **{'wsgi.input_terminated': True})
+        self.assertEqual(413, response['status'])
+
+    def test_multipart(self):
+        response = request(self.service(),
+                           content_type='multipart/form-data; boundary=x')
+        self.assertEqual(415, response['status'])
+
+    def test_invalid_params(self):
+        response = request(self.service(), query='width=-1&height=1')
+        self.assertEqual(400, response['status'])
+        self.assertEqual(b'unexpected negative integer for width: -1',
+                         response['body'])
+        response = request(self.service(), query='width=1&height=1&base=x')
+        self.assertEqual(400, response['status'])
+
+    def test_broken_input(self):
+        class BrokenInput(object):
+            def read(self, size=-1):
+                raise IOError('connection reset')
+
+        response = request(self.service(), **{'wsgi.input': BrokenInput()})
+        self.assertEqual(400, response['status'])
+        self.assertEqual(b"request body couldn't be read: connection reset",
+                         response['body'])
+
+    def test_too_many_requests(self):
+        service = self.service(workers=1, queue_size=0)
+        service._slots.acquire()
+        response = request(service)
+        self.assertEqual(429, response['status'])
+        self.assertEqual('1', response['headers']['Retry-After'])
+        service._slots.release()
+        self.assertEqual(200, request(service)['status'])
+
+    def test_deadline(self):
+        worker = self._pool._acquire()
+        try:
+            start = time.time()
+            response = request(self.service(deadline=0.2))
+        finally:
+            self._pool._release(worker)
+        self.assertEqual(504, response['status'])
+        self.assertTrue(time.time() - start < 5)
+
+    def test_no_render_slot(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            semaphore = _semaphore.HostSemaphore(slots=1, directory=tmp_dir,
+                                                 timeout=0.1)
+            slot = semaphore.acquire()
+            try:
+                response = request(self.service(semaphore=semaphore))
+            finally:
+                semaphore.release(slot)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(503, response['status'])
+        self.assertTrue('Retry-After' in response['headers'])
+
+    def test_delta(self):
+        service = self.service(store=_documents.DocumentStore())
+        response = request(service, body=b'<html><p>foo</p></html>',
+                           HTTP_COOKIE='session=a')
+        self.assertEqual(200, response['status'])
+        document_id = response['headers']['X-Dom2Img-Document']
+        delta = json.dumps({'changes': []}).encode('utf-8')
+        query = 'width=100&height=200&base=' + document_id
+        response = request(service, body=delta, query=query,
+                           HTTP_COOKIE='session=a')
+        self.assertEqual(200, response['status'])
+        self.assertNotEqual(document_id,
+                            response['headers']['X-Dom2Img-Document'])
+        response = request(service, body=delta, query=query,
+                           HTTP_COOKIE='session=b')
+        self.assertEqual(404, response['status'])
+
+
+class ImageResponseTest(utils.TestCase):
+
+    def test_response(self):
+        status, headers, body = _service.image_response(b'png')
+        headers = dict(headers)
+        self.assertEqual((200, b'png'), (status, body))
+        self.assertEqual('image/png', headers['Content-Type'])
+        self.assertEqual('3', headers['Content-Length'])
+        self.assertEqual(_service.image_etag(b'png'), headers['ETag'])
+        self.assertFalse(headers['ETag'].startswith('W/'))
+
+    def test_etag(self):
+        self.assertEqual(_service.image_etag(b'png'),
+                         _service.image_etag(b'png'))
+        self.assertNotEqual(_service.image_etag(b'png'),
+                            _service.image_etag(b'png2'))
+
+    def test_conditional(self):
+        etag = _service.image_etag(b'png')
+        for if_none_match in [etag, '*', '"x", W/' + etag]:
+            status, headers, body = _service.image_response(b'png',
+                                                            if_none_match)
+            self.assertEqual((304, b''), (status, body))
+            self.assertEqual(etag, dict(headers)['ETag'])
+        self.assertEqual(200, _service.image_response(b'png', '"x"')[0])
+
+
+class MakeServerTest(utils.TestCase):
+
+    def test_invalid_address(self):
+        self.assertRaisesExcStr(ValueError, u'HTTP address must be ' +
+                                u'[HOST]:PORT', _service.make_server,
+                                u'localhost', None)
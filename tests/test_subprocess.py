@@ -62,3 +62,20 @@ os.write(sys.stderr.fileno(), b':-(')
         stop = time.time()
         elapsed_time = int(round(stop - start))
         self.assertEqual(elapsed_time, 2)
+
+    def test_stderr_capture(self):
+        proc = self._popen('''
+import os
+import sys
+os.write(sys.stderr.fileno(), b'a\\n' + b'b' * 100 + b'\\nc')
+os.write(sys.stdout.fileno(), b'out')
+''')
+        lines = []
+        capture = _subprocess.OutputCapture(limit=10, hook=lines.append)
+        stdout, stderr = _subprocess.communicate_with_timeout(
+            proc, 30, stderr_capture=capture)
+        self.assertEqual(b'out', stdout)
+        self.assertEqual(b'a\nbbb\n[... 94 bytes omitted ...]\nbbb\nc',
+                         stderr)
+        self.assertEqual(104, capture.size)
+        self.assertEqual([u'a'] + [u'b' * 10] * 10 + [u'c'], lines)
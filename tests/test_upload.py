@@ -0,0 +1,114 @@
+import gzip
+import sys
+import zlib
+
+import unittest2
+
+import tests.utils as utils
+from dom2img import _compat, _upload
+
+
+def gzipped(data):
+    buff = _compat.BytesIO()
+    f = gzip.GzipFile(fileobj=buff, mode='wb')
+    f.write(data)
+    f.close()
+    return buff.getvalue()
+
+
+# mock PhantomJS, that "renders" its cli args and input HTML
+ECHO_SCRIPT = b'''
+#!/bin/sh
+echo "$@"
+cat
+'''
+
+
+class Dom2ImgUploadTest(utils.TestCase):
+
+    def test_params(self):
+        params = {'width': u'100', 'height': u'200', 'top': u'10',
+                  'left': u'20', 'scale': u'100', 'extra': u'ignored'}
+        with utils.mock_phantom_js_binary(ECHO_SCRIPT):
+            output = _upload.dom2img_upload(
+                u'<p>f\xf6\xf6</p>'.encode('utf-8'), params,
+                u'http://example.com/', cookies={u'key': u'val'})
+        args, html = output.split(b'\n', 1)
+        self.assertTrue(args.endswith(b' 100 200 10 20 example.com key=val'))
+        self.assertTrue(u'f\xf6\xf6'.encode('utf-8') in html)
+
+    def test_gzip(self):
+        params = {'width': u'100', 'height': u'200'}
+        with utils.mock_phantom_js_binary(ECHO_SCRIPT):
+            output = _upload.dom2img_upload(
+                _compat.BytesIO(gzipped(b'<p>foo</p>')), params,
+                u'http://example.com/', content_encoding=u'gzip')
+        self.assertTrue(b'foo' in output)
+
+    def test_precleaned(self):
+        params = {'width': u'100', 'height': u'200', 'precleaned': u'1'}
+        content = b'<a href="x">foo</a>'
+        with utils.mock_phantom_js_binary(ECHO_SCRIPT):
+            trusted = _upload.dom2img_upload(content, params,
+                                             u'http://example.com/',
+                                             trust_precleaned=True)
+            untrusted = _upload.dom2img_upload(content, params,
+                                               u'http://example.com/')
+        self.assertTrue(trusted.endswith(b'\n' + content))
+        self.assertTrue(b'http://example.com/x' in untrusted)
+
+    def test_missing_params(self):
+        self.assertRaisesExcStr(ValueError, u'missing upload parameter: height',
+                                _upload.dom2img_upload, b'', {'width': 1},
+                                u'http://example.com/')
+
+    def test_invalid_params(self):
+        self.assertRaisesExcStr(
+            ValueError, u'unexpected negative integer for width: -1',
+            _upload.dom2img_upload, b'', {'width': u'-1', 'height': u'1'},
+            u'http://example.com/')
+
+
+class ReadContentTest(utils.TestCase):
+
+    HTML = b'<html>' + b'<p>foo</p>' * 10000 + b'</html>'
+
+    def test_identity(self):
+        self.assertEqual(self.HTML, _upload.read_content(self.HTML))
+        self.assertEqual(self.HTML, _upload.read_content(
+            _compat.BytesIO(self.HTML), u'identity'))
+
+    def test_gzip_stream(self):
+        body = _compat.BytesIO(gzipped(self.HTML))
+        self.assertEqual(self.HTML, _upload.read_content(body, b'gzip'))
+
+    def test_deflate(self):
+        self.assertEqual(self.HTML, _upload.read_content(
+            zlib.compress(self.HTML), u'Deflate'))
+
+    def test_max_size(self):
+        self.assertEqual(self.HTML, _upload.read_content(
+            gzipped(self.HTML), u'gzip', max_size=len(self.HTML)))
+        self.assertRaisesExcStr(
+            ValueError, u'content is bigger than 1000 bytes',
+            _upload.read_content, _compat.BytesIO(gzipped(self.HTML)),
+            u'gzip', max_size=1000)
+        self.assertRaisesExcStr(
+            ValueError, u'content is bigger than 1000 bytes',
+            _upload.read_content, self.HTML, max_size=1000)
+
+    def test_invalid(self):
+        self.assertRaisesExcStr(ValueError, u'invalid compressed content',
+                                _upload.read_content, b'foo', u'gzip')
+
+    @unittest2.skipIf(sys.version_info < (3, 3),
+                      'zlib can detect end of stream since python 3.3')
+    def test_truncated(self):
+        self.assertRaisesExcStr(ValueError, u'truncated compressed content',
+                                _upload.read_content,
+                                gzipped(self.HTML)[:-100], u'gzip')
+
+    def test_unsupported(self):
+        self.assertRaisesExcStr(ValueError,
+                                u'unsupported content encoding: br',
+                                _upload.read_content, b'', u'br')
@@ -0,0 +1,40 @@
+from bs4 import BeautifulSoup
+
+import tests.utils as utils
+from dom2img import _dom2img, _volatile
+
+
+def normalize(html, **kwargs):
+    doc = BeautifulSoup(html, 'html.parser')
+    return str(_volatile.VolatileContent(**kwargs).normalize(doc))
+
+
+class VolatileContentTest(utils.TestCase):
+
+    def test_attributes(self):
+        self.assertEqual(
+            '<div class="x" data-request-id="" nonce=""></div>',
+            normalize('<div class="x" nonce="abc" data-request-id="1"></div>',
+                      attributes=[u'NONCE', u'data-request-id']))
+
+    def test_patterns(self):
+        self.assertEqual(
+            '<form data-csrf-token="" data-csrf2="" data-x-csrf="1"></form>',
+            normalize('<form data-csrf-token="a" data-csrf2="b" '
+                      'data-x-csrf="1"></form>'))
+
+    def test_hidden_inputs(self):
+        html = ('<input type="HIDDEN" value="1"/>'
+                '<input type="text" value="2"/>')
+        self.assertEqual('<input type="HIDDEN" value=""/>'
+                         '<input type="text" value="2"/>', normalize(html))
+        self.assertEqual(html, normalize(html, hidden_inputs=False))
+
+    def test_clean_up_html(self):
+        volatile = _volatile.VolatileContent(attributes=[u'data-ts'])
+        results = [_dom2img._clean_up_html(
+            b'<div data-ts="' + ts + b'"><input type="hidden" value="' +
+            ts + b'"></div>', u'http://example.com/', volatile)
+            for ts in [b'1', b'2']]
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(b'data-ts=""' in results[0])
@@ -132,6 +132,10 @@ dirty_html_doc = u'''
 '''.encode('utf-8')
 
 
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'static')
+
+
 def prefix_for_port(port):
     return u'http://127.0.0.1:' + str(port) + u'/'
 
@@ -159,7 +163,8 @@ def freezing_html_doc(port=8000):
 class FlaskApp(object):
 
     def __init__(self):
-        self._app = flask.Flask('test')
+        # bundled static/ pages and their resources are served from /static/
+        self._app = flask.Flask('test', static_folder=STATIC_DIR)
 
         # test.css overrides div bgcolor to black
         # if cookie key=val is present